@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the analysis is run from twitter_analysis/ (see bin/twitter_analysis), which its modules are imported relative to
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'twitter_analysis'))
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
@@ -0,0 +1,102 @@
+import pytest
+
+from lib import Options, TwitterAnalysis, read_tweets
+from lib.approximate import ApproximateStore
+from lib.dedup import make_deduplicator
+from lib.interactions import KUDOS_KINDS, MENTION, QUOTE, REPLY, RETWEET
+from lib.sketches import HyperLogLog
+from lib.synthetic import write_corpus
+from lib.twitter_analysis import Kudos
+
+NUM_TWEETS = 20000
+PRECISION = 12
+MAX_STANDARD_ERRORS = 4  # HyperLogLog estimates further than this from the exact count are (very nearly) impossible
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('corpus') / 'synthetic.json')
+    write_corpus(path, NUM_TWEETS, seed=17)
+    return path
+
+
+@pytest.fixture(scope='module')
+def exact_store(corpus):
+    opts = Options().parse(['-i', corpus])
+    return TwitterAnalysis(opts).ingest(read_tweets(opts.tweets_files, dedup=make_deduplicator(opts)))
+
+
+@pytest.fixture(scope='module')
+def approximate_store(corpus):
+    opts = Options().parse(['-i', corpus])
+    store = ApproximateStore(500, 2000, PRECISION)
+    TwitterAnalysis(opts).ingest(read_tweets(opts.tweets_files, dedup=make_deduplicator(opts)), store)
+    return store
+
+
+def exact_kudos(store, screen_name):
+    return Kudos(store, store.users.lookup(screen_name))
+
+
+def test_space_saving_account_counts_are_within_their_bounds(exact_store, approximate_store):
+    accounts = approximate_store.accounts
+    kinds = exact_store.kind
+    exact_counts = dict((exact_store.users[u], sum(1 for r in exact_store.rows_targeting(u) if kinds[r] & KUDOS_KINDS))
+                        for u in exact_store.kudos_users)
+    assert accounts.total == sum(exact_counts.values())
+    assert len(accounts) == accounts.capacity
+
+    for screen_name, count, error in accounts.items():
+        assert error <= accounts.bound
+        assert count - error <= exact_counts[screen_name] <= count
+    # every account given more kudos than the bound is sure to be tracked
+    for screen_name, exact in exact_counts.items():
+        if exact > accounts.bound:
+            assert screen_name in accounts
+
+
+def test_space_saving_tweet_counts_are_within_their_bounds(exact_store, approximate_store):
+    tweets = approximate_store.tweets
+    kinds = exact_store.kind
+    exact_counts = {}
+    for t, k in zip(exact_store.tweet, kinds):
+        if k & (RETWEET | QUOTE):
+            key = (exact_store.tweets[t], RETWEET if k & RETWEET else QUOTE)
+            exact_counts[key] = exact_counts.get(key, 0) + 1
+
+    assert tweets.total == sum(exact_counts.values())
+    for key, count, error in tweets.items():
+        assert error <= tweets.bound
+        assert count - error <= exact_counts[key] <= count
+    for key, exact in exact_counts.items():
+        if exact > tweets.bound:
+            assert key in tweets
+
+    # so H-Indexes from the guaranteed counts are lower bounds
+    for screen_name, h_index in approximate_store.h_indexes().items():
+        assert h_index <= exact_kudos(exact_store, screen_name).h_index()
+
+
+def test_tracked_account_sketches_match_the_exact_counts(exact_store, approximate_store):
+    max_error = MAX_STANDARD_ERRORS * HyperLogLog.standard_error(PRECISION)
+    source = exact_store.source
+    tweet = exact_store.tweet
+
+    def assert_estimated(sketch, exact):
+        assert abs(len(sketch) - exact) <= max(1, max_error * exact)
+
+    # accounts counted from their first kudos have seen all of their interactions
+    tracked = [screen_name for screen_name, _, error in approximate_store.accounts.items() if not error]
+    assert len(tracked) > 100
+    for screen_name in tracked:
+        sketch = approximate_store.account_sketches[screen_name]
+        kudos = exact_kudos(exact_store, screen_name)
+        retweets, quotes, replies, fav_count, tweet_count = kudos.pa_counts()
+        assert (sketch.retweets, sketch.quotes, sketch.replies, sketch.fav_count) == (retweets, quotes, replies,
+                                                                                      fav_count)
+        assert sketch.followers_count == exact_store.followers_count[kudos.user]
+
+        assert_estimated(sketch.posts, tweet_count)
+        assert_estimated(sketch.interactors, len(set(source[r] for r in kudos.rows(RETWEET | QUOTE | REPLY | MENTION))))
+        assert_estimated(sketch.inspiring, len(set(tweet[r] for r in kudos.rows(RETWEET | QUOTE))))
+        assert_estimated(sketch.replied, len(set(tweet[r] for r in kudos.rows(REPLY))))
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from lib import Options, TwitterAnalysis, read_tweets
+from lib.batch_metrics import batch_metrics
+from lib.ranking import MetricTable
+from lib.twitter_analysis import Kudos
+
+COLUMNS = ['screen_names', 'h_index', 'int_ratio', 'rm_ratio', 'snp', 'mixture', 'pa_ratio']
+
+
+@pytest.mark.parametrize('corpus', ['test.json', 'qanda-100.json'])
+def test_batch_metrics_match_the_kudos_of_each_user(corpus):
+    opts = Options().parse(['-i', os.path.join(DATA_DIR, corpus)])
+    analyser = TwitterAnalysis(opts)
+    store = analyser.ingest(read_tweets(opts.tweets_files))
+
+    kudos = [Kudos(store, u) for u in store.kudos_users]
+    expected = MetricTable.from_kudos(dict((store.users[k.user], k) for k in kudos), analyser.pa_weights)
+    users, h_index, int_ratio, rm_ratio, pa_ratio = batch_metrics(store, analyser.pa_weights)
+    metrics = MetricTable([store.users[int(u)] for u in users], h_index.tolist(), int_ratio.tolist(),
+                          rm_ratio.tolist(), pa_ratio.tolist())
+
+    assert len(metrics) == len(kudos) > 0
+    for column in COLUMNS:
+        assert getattr(metrics, column) == getattr(expected, column), column
+
+
+def test_batch_metrics_engine_reports_the_same_metric_table():
+    opts = Options().parse(['-i', os.path.join(DATA_DIR, 'qanda-100.json'), '--metrics-engine', 'batch'])
+    analyser = TwitterAnalysis(opts)
+    store = analyser.ingest(read_tweets(opts.tweets_files))
+    _, metrics = analyser.calculate_metrics(store)
+
+    opts.metrics_engine = 'python'
+    _, expected = TwitterAnalysis(opts).calculate_metrics(store)
+    for column in COLUMNS:
+        assert getattr(metrics, column) == getattr(expected, column), column
@@ -0,0 +1,89 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import DATA_DIR
+from lib import Options, TwitterAnalysis, read_tweets
+from lib.cache import MappedStore, cache_key, load_cache, save_cache
+from lib.dedup import make_deduplicator
+
+METRIC_COLUMNS = ['screen_names', 'h_index', 'int_ratio', 'rm_ratio', 'snp', 'mixture', 'pa_ratio']
+STORE_COLUMNS = ['source', 'target', 'tweet', 'via', 'kind', 'followers_count', 'friends_count', 'total_tweet_count',
+                 'profiled', 'kudos_users', 'in_kudos']
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """A copy of the tweets, whose modification time can be changed"""
+    path = str(tmp_path / 'qanda-100.json')
+    shutil.copy(os.path.join(DATA_DIR, 'qanda-100.json'), path)
+    return path
+
+
+def options(corpus, *args):
+    return Options().parse(['-i', corpus] + list(args))
+
+
+def ingest(opts):
+    analyser = TwitterAnalysis(opts)
+    return analyser, analyser.ingest(read_tweets(opts.tweets_files, dedup=make_deduplicator(opts)))
+
+
+def test_a_cache_maps_back_the_store_it_was_saved_from(corpus, tmp_path):
+    opts = options(corpus)
+    _, store = ingest(opts)
+    path = str(tmp_path / 'interactions.cache')
+    assert save_cache(path, store, cache_key(opts), 100) == os.path.getsize(path)
+
+    mapped = load_cache(path, cache_key(opts))
+    assert isinstance(mapped, MappedStore)
+    assert mapped.num_tweets == 100
+    for column in STORE_COLUMNS:
+        assert list(getattr(mapped, column)) == list(getattr(store, column)), column
+    assert [mapped.users[u] for u in range(len(mapped.users))] == list(store.users.keys)
+    # tweet ids are kept as strings, so a tweet without one is mapped back as 'None'
+    assert [mapped.tweets[t] for t in range(len(mapped.tweets))] == [str(t) for t in store.tweets.keys]
+    assert sorted(mapped.favourites.items()) == sorted(store.favourites.items())
+
+
+@pytest.mark.parametrize('engines', [['--metrics-engine', 'python', '--d-rank-engine', 'python'],
+                                     ['--metrics-engine', 'batch', '--d-rank-engine', 'sparse']])
+def test_metrics_and_d_rank_from_a_cache_match_a_fresh_run(corpus, tmp_path, engines):
+    opts = options(corpus, *engines)
+    analyser, store = ingest(opts)
+    _, expected = analyser.calculate_metrics(store)
+    expected_d_rank = analyser.calculate_d_rank(store)
+
+    path = str(tmp_path / 'interactions.cache')
+    save_cache(path, store, cache_key(opts), 100)
+    mapped = load_cache(path, cache_key(opts))
+    analyser = TwitterAnalysis(opts)
+    _, metrics = analyser.calculate_metrics(mapped)
+    for column in METRIC_COLUMNS:
+        assert getattr(metrics, column) == getattr(expected, column), column
+    assert analyser.calculate_d_rank(mapped) == expected_d_rank
+
+
+@pytest.mark.parametrize('change', ['mtime', 'count', 'dedup'])
+def test_a_cache_is_stale_once_the_input_or_options_change(corpus, tmp_path, capsys, change):
+    opts = options(corpus)
+    _, store = ingest(opts)
+    path = str(tmp_path / 'interactions.cache')
+    save_cache(path, store, cache_key(opts), 100)
+    assert load_cache(path, cache_key(opts)) is not None
+
+    if change == 'mtime':
+        stat = os.stat(corpus)
+        os.utime(corpus, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    elif change == 'count':
+        opts = options(corpus, '-c', '50')
+    else:
+        opts = options(corpus, '--dedup', 'none')
+    assert load_cache(path, cache_key(opts)) is None
+    assert 'is stale' in capsys.readouterr().out
+
+
+def test_a_file_which_isnt_a_cache_is_ignored(corpus, capsys):
+    assert load_cache(corpus, cache_key(options(corpus))) is None
+    assert '[WARN] Ignoring the cache' in capsys.readouterr().out
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from lib import TwitterAnalysis, read_tweets
+from lib.dedup import make_deduplicator
+from lib.live import LiveAnalysis
+from lib.options import LiveOptions
+
+
+@pytest.mark.parametrize('count', ['-1', '30'])
+def test_live_batches_ingest_as_one_run_does(count):
+    opts = LiveOptions().parse(['-i', os.path.join(DATA_DIR, 'qanda-100.json'), '-c', count])
+    analyser = TwitterAnalysis(opts)
+    store = analyser.ingest(read_tweets(opts.tweets_files, dedup=make_deduplicator(opts)))
+
+    live = LiveAnalysis(TwitterAnalysis(opts), 10, dedup=make_deduplicator(opts))
+    with open(opts.tweets_files[0], 'rb') as f:
+        lines = [l for l in f if l.strip()]
+    for start in range(0, len(lines), 7):
+        live.ingest(lines[start:start + 7])
+    live.executor.shutdown()
+
+    assert live.num_tweets == 100
+    assert len(live.store) == len(store)
+    assert list(live.store.kind) == list(store.kind)
+    assert list(live.store.followers_count) == list(store.followers_count)
+    assert live.analyser.calculate_d_rank(live.store) == analyser.calculate_d_rank(store)
@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from lib import Options, TwitterAnalysis, read_tweets
+from lib import d_rank
+from lib.dedup import make_deduplicator
+from lib.instrumentation import Instrumentation
+from lib.parallel import ingest_in_parallel
+
+
+def recollect(tweet, screen_name=None):
+    """:return A copy of a tweet as if collected again later, with higher follower and favourite counts"""
+    tweet = json.loads(json.dumps(tweet))
+    for t in (tweet, tweet.get('retweeted_status'), tweet.get('quoted_status')):
+        if t:
+            t['favorite_count'] = (t.get('favorite_count') or 0) + 100
+            t['user']['followers_count'] += 1000
+    if screen_name is not None:
+        tweet['user']['screen_name'] = screen_name
+    return tweet
+
+
+@pytest.fixture
+def duplicated_corpus(tmp_path):
+    """Two files of tweets, the second repeating tweets of the first (and of itself), re-collected"""
+    with open(os.path.join(DATA_DIR, 'qanda-100.json'), encoding='utf-8') as f:
+        tweets = [json.loads(l) for l in f if l.strip()]
+    first = tweets[:50]
+    second = tweets[50:] + [recollect(t) for t in tweets[:20]] + [recollect(tweets[0], 'OnlyInDuplicate')] + \
+        [recollect(t) for t in tweets[60:65]]
+    paths = []
+    for name, part in (('first.json', first), ('second.json', second)):
+        path = str(tmp_path / name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(t) + '\n' for t in part)
+        paths.append(path)
+    return paths
+
+
+def analyse(opts, store):
+    analyser = TwitterAnalysis(opts)
+    _, metrics = analyser.calculate_metrics(store)
+    columns = [metrics.screen_names, metrics.h_index, metrics.int_ratio, metrics.rm_ratio, metrics.snp,
+               metrics.mixture, metrics.pa_ratio]
+    return columns, analyser.calculate_d_rank(store), list(store.followers_count), dict(store.favourites)
+
+
+@pytest.mark.parametrize('dedup', ['set', 'bloom'])
+def test_parallel_ingest_drops_duplicates_as_sequential_ingest_does(duplicated_corpus, tmp_path, dedup):
+    def options(workers):
+        return Options().parse(['-i'] + duplicated_corpus + ['--workers', str(workers), '--dedup', dedup,
+                                                             '--spill-dir', str(tmp_path)])
+
+    opts = options(1)
+    deduplicator = make_deduplicator(opts)
+    store = TwitterAnalysis(opts).ingest(read_tweets(opts.tweets_files, dedup=deduplicator))
+    assert deduplicator.num_duplicates == 26
+    assert store.users.lookup('OnlyInDuplicate') == -1
+    expected = analyse(opts, store)
+    deduplicator.close()
+
+    for workers in (2, 4):
+        opts = options(workers)
+        deduplicator = make_deduplicator(opts)
+        store = ingest_in_parallel(opts, workers, dedup=deduplicator)
+        assert deduplicator.num_duplicates == 26
+        assert store.users.lookup('OnlyInDuplicate') == -1
+        assert analyse(opts, store) == expected
+        deduplicator.close()
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+@pytest.mark.parametrize('extrapolation', ['none', 'aitken'])
+def test_parallel_d_rank_matches_the_sparse_engine(monkeypatch, workers, extrapolation):
+    opts = Options().parse(['-i', os.path.join(DATA_DIR, 'qanda-100.json')])
+    store = TwitterAnalysis(opts).ingest(read_tweets(opts.tweets_files))
+    expected = d_rank.sparse_d_rank(store, 100, extrapolation=extrapolation)
+
+    # so even this small graph is shared between worker processes
+    monkeypatch.setattr(d_rank, 'MIN_USERS_PER_WORKER', 1)
+    instrumentation = Instrumentation()
+    scores = d_rank.parallel_d_rank(store, 100, instrumentation=instrumentation, extrapolation=extrapolation,
+                                    workers=workers)
+    assert instrumentation.counters['d_rank_workers'] == workers
+    assert scores == expected
@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+import urllib.request
+
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from conftest import DATA_DIR
+from lib import TwitterAnalysis, read_tweets
+from lib.d_rank import DRankMatrix, matrix_d_rank
+from lib.dedup import make_deduplicator
+from lib.options import ServeOptions
+from lib.server import AnalysisRequestHandler, AnalysisServer
+
+
+@pytest.fixture
+def server():
+    """:return The URL of an AnalysisServer of no tweets, served on a free port"""
+    opts = ServeOptions().parse([])
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), AnalysisRequestHandler)
+    httpd.daemon_threads = True
+    httpd.analysis = AnalysisServer(TwitterAnalysis(opts), dedup=make_deduplicator(opts))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://%s:%d' % httpd.server_address[:2]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(url, body=None):
+    with urllib.request.urlopen(url, data=body) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def test_posting_tweets_reports_those_ingested_and_the_duplicates_dropped(server):
+    with open(os.path.join(DATA_DIR, 'qanda-100.json'), 'rb') as f:
+        lines = [l for l in f if l.strip()]
+    first = request(server + '/tweets', b''.join(lines[:60]))
+    assert (first['ingested'], first['duplicates'], first['tweets']) == (60, 0, 60)
+    second = request(server + '/tweets', b''.join(lines[40:]))
+    assert (second['ingested'], second['duplicates'], second['tweets']) == (40, 20, 100)
+    assert request(server + '/status')['duplicates'] == 20
+
+
+def test_concurrent_d_rank_queries_match_those_made_one_at_a_time():
+    opts = ServeOptions().parse(['-i', os.path.join(DATA_DIR, 'qanda-100.json'), '--d-rank-solver', 'gauss-seidel'])
+    analyser = TwitterAnalysis(opts)
+    store = analyser.ingest(read_tweets(opts.tweets_files))
+    snapshot = AnalysisServer(analyser, store).snapshot
+    weights = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8]
+
+    results = {}
+
+    def query(weight):
+        results[weight] = snapshot.d_rank(weight, 100)[0]
+
+    threads = [threading.Thread(target=query, args=(w,)) for w in weights]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for w in weights:
+        matrix = DRankMatrix(store)  # with a cache of its own
+        scores, _ = matrix_d_rank(matrix, matrix.initial_scores(None, w), 100, w, solver='gauss-seidel',
+                                  tolerance=float(opts.tolerance), norm=opts.residual_norm)
+        assert results[w] == dict(zip(matrix.screen_names(store), scores.tolist()))
@@ -0,0 +1,49 @@
+import json
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from lib import Options, TwitterAnalysis, read_tweets
+from lib.output import write_metric_table
+from lib.spill import OutOfCoreAnalysis, bucket_of, parse_size
+
+
+def read_table(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(l) for l in f]
+
+
+@pytest.mark.parametrize('corpus', ['test.json', 'qanda-100.json'])
+@pytest.mark.parametrize('num_buckets', [1, 7])
+def test_out_of_core_analysis_matches_the_in_memory_analysis(corpus, num_buckets, tmp_path, capsys):
+    opts = Options().parse(['-i', os.path.join(DATA_DIR, corpus), '--max-memory', '1M'])
+    analyser = TwitterAnalysis(opts)
+    store = analyser.ingest(read_tweets(opts.tweets_files))
+    _, metrics = analyser.calculate_metrics(store)
+    d_rank_scores = analyser.calculate_d_rank(store)
+    expected = str(tmp_path / 'in_memory.ndjson')
+    write_metric_table(expected, metrics, d_rank_scores)
+
+    # with several buckets, most D-rank links cross from one bucket to another
+    if num_buckets > 1:
+        incoming, _ = store.links()
+        users = store.users
+        assert any(bucket_of(users[s], num_buckets) != bucket_of(users[t], num_buckets)
+                   for t, interactors in incoming.items() for s in interactors)
+
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    output = str(tmp_path / 'out_of_core.ndjson')
+    analysis = OutOfCoreAnalysis(TwitterAnalysis(opts), parse_size(opts.max_memory), str(spill_dir), num_buckets)
+    assert analysis.run(read_tweets(opts.tweets_files), output) == len(metrics)
+
+    assert read_table(output) == read_table(expected)
+    assert '[WARN]' not in capsys.readouterr().out
+
+
+def test_a_bucket_too_large_for_the_memory_allowed_is_warned_of(tmp_path, capsys):
+    opts = Options().parse(['-i', os.path.join(DATA_DIR, 'qanda-100.json'), '--max-memory', '16K'])
+    analysis = OutOfCoreAnalysis(TwitterAnalysis(opts), parse_size(opts.max_memory), str(tmp_path), 2)
+    analysis.run(read_tweets(opts.tweets_files))
+    assert '[WARN] Bucket' in capsys.readouterr().out
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import DATA_DIR
+from lib import Options, TwitterAnalysis, read_tweets
+from lib.d_rank import DRankMatrix, matrix_d_rank
+from lib.instrumentation import Instrumentation
+from lib.ranking import top
+from lib.sweep import SWEEP_COLUMNS, parse_sweep, rank_stability, sweep, weight_factor_d_rank
+from lib.twitter_analysis import Kudos
+
+WEIGHT_FACTORS = [0.2, 0.05, 0.5, 0.85]
+
+
+@pytest.fixture(scope='module')
+def store():
+    opts = Options().parse(['-i', os.path.join(DATA_DIR, 'qanda-100.json')])
+    return TwitterAnalysis(opts).ingest(read_tweets(opts.tweets_files))
+
+
+def test_each_weight_factor_iterates_as_d_rank_with_it_alone(store):
+    matrix = DRankMatrix(store)
+    scores = weight_factor_d_rank(matrix, WEIGHT_FACTORS, 100)
+    assert scores.shape == (matrix.n, len(WEIGHT_FACTORS))
+    for c, weight_factor in enumerate(WEIGHT_FACTORS):
+        expected, _ = matrix_d_rank(matrix, matrix.initial_scores(None, weight_factor), 100, weight_factor)
+        assert scores[:, c].tolist() == expected.tolist()
+
+
+def test_rank_stability_compares_each_ranking_with_the_first():
+    scores = np.array([[3.0, 3.0, 1.0, 5.0],
+                       [2.0, 2.0, 2.0, 5.0],
+                       [1.0, 1.0, 3.0, 5.0]])
+    overlaps, spearman, tops = rank_stability(scores, 1)
+    assert overlaps == [1.0, 1.0, 0.0, 1.0]
+    assert spearman[:3] == pytest.approx([1.0, 1.0, -1.0]) and spearman[3] is None
+    assert tops == [0, 0, 2, 0]  # ties broken by position
+
+    assert rank_stability(np.empty((0, 2)), 1) == ([0.0, 0.0], [None, None], [None, None])
+
+
+def test_sweep_ranks_each_combination_as_a_run_with_its_parameters_would(store):
+    opts = Options().parse(['-i', os.path.join(DATA_DIR, 'qanda-100.json')])
+    grid = parse_sweep(['rt-weight=1,4', 'fav-weight=0,1', 'weight=0.2,0.5'], opts)
+    baseline = [1.0, 2.0, 3.0, 1.0, 0.2]
+    rows = sweep(store, grid, baseline, 100, 5, Instrumentation())
+    assert len(rows) == 8 and all(len(row) == len(SWEEP_COLUMNS) for row in rows)
+
+    kudos = [Kudos(store, u) for u in store.kudos_users]
+    names = [store.users[k.user] for k in kudos]
+    d_rank_tops = {}
+    for row in rows:
+        values = dict(zip(SWEEP_COLUMNS, row))
+        pa_weights = [values[p] for p in ('rt_weight', 'qu_weight', 're_weight', 'fav_weight')]
+        pa_ratios = [Kudos(store, k.user).pa_ratio(*pa_weights) for k in kudos]
+        assert values['pa_top_account'] == top(names, pa_ratios, 1)[0][0]
+        if pa_weights == baseline[:4]:
+            assert (values['pa_top_overlap'], values['pa_spearman']) == (1.0, pytest.approx(1.0))
+        if values['weight'] == baseline[4]:
+            assert (values['d_rank_top_overlap'], values['d_rank_spearman']) == (1.0, pytest.approx(1.0))
+        d_rank_tops[values['weight']] = values['d_rank_top_account']
+
+    matrix = DRankMatrix(store)
+    for weight_factor, top_account in d_rank_tops.items():
+        scores, _ = matrix_d_rank(matrix, matrix.initial_scores(None, weight_factor), 100, weight_factor)
+        assert top_account == top(matrix.screen_names(store), scores.tolist(), 1)[0][0]
@@ -0,0 +1,70 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+from conftest import DATA_DIR
+from lib import Options, TwitterAnalysis, read_tweets
+from lib.synthetic import write_corpus
+from lib.tweet_parsers import parse_created_at
+from lib.window import analyse_windows, parse_duration
+
+NUM_TWEETS = 3600  # a tweet a second, for an hour
+WINDOW_LINE = re.compile(r'^Window (\S+ \S+) to (\S+ \S+): (\d+) tweets', re.MULTILINE)
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('corpus') / 'synthetic.json')
+    write_corpus(path, NUM_TWEETS, seed=13)
+    return path
+
+
+def created_at(path):
+    with open(path, encoding='utf-8') as f:
+        return [parse_created_at(json.loads(l)['created_at']) for l in f if l.strip()]
+
+
+def windows(output):
+    """:return The (start, end, number of tweets) of each window reported"""
+    def seconds(time):
+        return parse_created_at(time.replace(' ', 'T') + '+0000')
+    return [(seconds(start), seconds(end), int(n)) for start, end, n in WINDOW_LINE.findall(output)]
+
+
+def assert_windows(output, times, window, step):
+    reported = windows(output)
+    assert len(reported) == (max(times) - min(times)) // step + 1
+    for start, end, n in reported:
+        assert end - start == window
+        assert n == sum(1 for t in times if start <= t < end)
+
+
+def test_each_window_holds_the_tweets_created_within_it(corpus, capsys):
+    opts = Options().parse(['-i', corpus])
+    window, step = parse_duration('20m'), parse_duration('10m')
+    num_windows = analyse_windows(TwitterAnalysis(opts), read_tweets(opts.tweets_files), window, step)
+
+    output = capsys.readouterr().out
+    assert num_windows == 6
+    assert_windows(output, created_at(corpus), window, step)
+    assert '[WARN]' not in output
+
+
+def test_windows_over_several_files_read_them_in_order(corpus, tmp_path):
+    with open(corpus, encoding='utf-8') as f:
+        lines = f.readlines()
+    shards = []
+    for n, part in enumerate((lines[:NUM_TWEETS // 2], lines[NUM_TWEETS // 2:])):
+        shards.append(str(tmp_path / ('shard-%d.json' % n)))
+        with open(shards[-1], 'w', encoding='utf-8') as f:
+            f.writelines(part)
+
+    output = subprocess.run([sys.executable, 'main.py', '-i'] + shards + ['--window', '20m', '--step', '10m'],
+                            cwd=os.path.join(os.path.dirname(DATA_DIR), 'twitter_analysis'), check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    assert_windows(output, created_at(corpus), parse_duration('20m'), parse_duration('10m'))
+    assert '0 skipped' in output and '[WARN]' not in output
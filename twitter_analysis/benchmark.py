@@ -0,0 +1,10 @@
+import sys
+
+from lib.benchmark import run_benchmarks
+from lib.options import BenchmarkOptions
+
+
+if __name__ == '__main__':
+    opts = BenchmarkOptions().parse(sys.argv[1:])
+    run_benchmarks(opts)
+    print("Results appended to %s" % opts.results_file)
@@ -0,0 +1,37 @@
+import socket
+import sys
+
+from lib.live import parse_address
+from lib.options import GenerateOptions
+from lib.synthetic import open_output_file, write_tweets
+
+
+if __name__ == '__main__':
+    opts = GenerateOptions().parse(sys.argv[1:])
+
+    num_tweets = int(float(opts.num_tweets))
+    destination = opts.connect or ('stdout' if opts.output_file == '-' else opts.output_file)
+    print("Writing %d %s tweets to %s" % (num_tweets, opts.layout, destination), file=sys.stderr)
+    if opts.connect:
+        connection = socket.create_connection(parse_address(opts.connect))
+        f = connection.makefile('w', encoding='utf-8')
+    elif opts.output_file == '-':
+        f = sys.stdout
+    else:
+        f = open_output_file(opts.output_file)
+    try:
+        write_tweets(f, num_tweets, opts.layout,
+                     num_users=int(float(opts.num_users)) if opts.num_users else None,
+                     rate=float(opts.rate) if opts.rate else None,
+                     seed=int(opts.seed),
+                     retweets=float(opts.retweets),
+                     quotes=float(opts.quotes),
+                     replies=float(opts.replies),
+                     mentions=float(opts.mentions),
+                     favourites=float(opts.favourites),
+                     skew=float(opts.skew))
+    finally:
+        if f is not sys.stdout:
+            f.close()
+        if opts.connect:
+            connection.close()
@@ -1,2 +1,3 @@
 from .twitter_analysis import TwitterAnalysis
-from .options import Options
+from .options import Options, LiveOptions, QueryOptions, ServeOptions
+from .tweet_reader import read_tweets, timestamp
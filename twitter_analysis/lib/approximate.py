@@ -0,0 +1,207 @@
+from .interactions import KUDOS_KINDS, POST, RETWEET, QUOTE, REPLY, TweetRows
+from .output import write_metric_table
+from .ranking import MetricTable, RANKED_METRICS, top
+from .sketches import HyperLogLog, SpaceSaving, hash64
+from .tweet_reader import read_tweets
+from .twitter_analysis import h_index_of, pa_ratio_of
+
+
+MAX_MISSED_FRACTION = 0.1  # of an account's kudos which may have gone uncounted for it still to be ranked
+
+
+class AccountSketch:
+    """
+    What's needed to calculate the Kudos metrics of an account approximately, in constant memory:
+    exact counts of the retweets, quotes and replies it's been given and of the favourites of its
+    tweets, and HyperLogLog estimates of how many distinct users interacted with it, how many
+    distinct tweets it posted, and how many of those were retweeted or quoted, or replied to.
+    H-Indexes come from the tweets tracked by ApproximateStore.
+    """
+    __slots__ = ('interactors', 'posts', 'inspiring', 'replied', 'retweets', 'quotes', 'replies',
+                 'followers_count', 'fav_count')
+
+    def __init__(self, precision):
+        self.interactors = HyperLogLog(precision)  # retweeters, quoters, repliers and mentioners
+        self.posts = HyperLogLog(precision)        # tweets posted
+        self.inspiring = HyperLogLog(precision)    # tweets retweeted or quoted
+        self.replied = HyperLogLog(precision)      # tweets replied to
+        self.retweets = 0
+        self.quotes = 0
+        self.replies = 0
+        self.followers_count = 0
+        # the favourite counts of its tweets, each credited when the tweet itself is ingested (the only time its
+        # count is seen), so once per tweet unless duplicates are kept with --dedup none
+        self.fav_count = 0
+
+    def metrics(self, h_index, pa_weights):
+        """
+        Estimates the metrics as Kudos calculates them.
+        :param h_index: The account's H-Index
+        :param pa_weights: The weights to calculate pa_ratio with
+        :return A tuple of (h_index, int_ratio, rm_ratio, pa_ratio)
+        """
+        followers_count = self.followers_count
+        int_ratio = len(self.interactors) / float(followers_count) if followers_count else 0
+
+        tweet_count = len(self.posts)
+        rm_ratio = (len(self.inspiring) + len(self.replied)) / float(tweet_count) if tweet_count else 0
+
+        pa_ratio = pa_ratio_of(self.retweets, self.quotes, self.replies, self.fav_count, tweet_count, *pa_weights)
+        return h_index, int_ratio, rm_ratio, pa_ratio
+
+
+class ApproximateStore(TweetRows):
+    """
+    Takes the rows of each tweet as it's ingested and, rather than keeping them, counts them in
+    sketches of fixed size: Space-Saving picks out the accounts given the most kudos (by number of
+    rows), for which an AccountSketch is kept, and the tweets retweeted or quoted the most, from
+    which H-Indexes are calculated. A HyperLogLog estimates how many users were given kudos at all.
+    So memory use depends on the sizes of the sketches, not of the corpus.
+    """
+    def __init__(self, num_accounts, num_tweets, precision):
+        TweetRows.__init__(self)
+        self.precision = precision
+        self.accounts = SpaceSaving(num_accounts)  # screen name -> number of rows targeting it
+        self.account_sketches = {}                 # screen name -> AccountSketch, for each tracked account
+        self.tweets = SpaceSaving(num_tweets)      # (tweet, RETWEET or QUOTE) -> number of retweets or quotes
+        self.authors = {}                          # (tweet, RETWEET or QUOTE) -> screen name, for each tracked tweet
+        self.kudos_users = HyperLogLog(precision)
+
+        # the profiles and favourite counts of the tweet being ingested, credited with its rows
+        self.profiles = []
+        self.favourites = {}
+
+    def kudos_user(self, screen_name):
+        self.kudos_users.add(screen_name)
+        return screen_name
+
+    def update_profile(self, user, followers_count, friends_count, total_tweet_count):
+        self.profiles.append((user, followers_count))
+
+    def update_favourite_count(self, tweet, new_fav_count):
+        if new_fav_count > self.favourites.get(tweet, 0):
+            self.favourites[tweet] = new_fav_count
+
+    def sketch(self, user):
+        """:return The AccountSketch of the user, who's just been counted, starting one if they're new"""
+        sketch = self.account_sketches.get(user)
+        if sketch is None:
+            sketch = self.account_sketches[user] = AccountSketch(self.precision)
+        return sketch
+
+    def take_rows(self, sources, targets, tweets, kinds):
+        """Counts the rows of the tweet just ingested"""
+        accounts = self.accounts
+        account_sketches = self.account_sketches
+        for source, target, tweet, kind in zip(sources, targets, tweets, kinds):
+            if not kind & KUDOS_KINDS:
+                continue
+            evicted = accounts.add(target)
+            if evicted is not None:
+                del account_sketches[evicted]
+            sketch = self.sketch(target)
+            if kind & POST:
+                sketch.posts.add(tweet)
+                sketch.fav_count += self.favourites.get(tweet, 0)
+                continue
+            if kind & (RETWEET | QUOTE):
+                if kind & RETWEET:
+                    sketch.retweets += 1
+                    key = (tweet, RETWEET)
+                else:
+                    sketch.quotes += 1
+                    key = (tweet, QUOTE)
+                sketch.inspiring.add(tweet)
+                evicted = self.tweets.add(key)
+                if evicted is not None:
+                    del self.authors[evicted]
+                self.authors[key] = target
+            elif kind & REPLY:
+                sketch.replies += 1
+                sketch.replied.add(tweet)
+            sketch.interactors.add_hash(hash64(source))
+
+        for user, followers_count in self.profiles:
+            sketch = account_sketches.get(user)
+            if sketch is not None and followers_count > sketch.followers_count:
+                sketch.followers_count = followers_count
+        del self.profiles[:]
+        self.favourites.clear()
+
+    def h_indexes(self):
+        """
+        :return Map of screen name to H-Index, from the tracked tweets of each of their authors. Only
+        the counts guaranteed by Space-Saving are used, so these are lower bounds.
+        """
+        counts = {}
+        for key, count, error in self.tweets.items():
+            counts.setdefault(self.authors[key], []).append(count - error)
+        return dict((author, h_index_of(c)) for author, c in counts.items())
+
+    def metric_table(self, pa_weights):
+        """
+        :param pa_weights: The weights to calculate pa_ratio with
+        :return The MetricTable of the tracked accounts, in order of their kudos, heaviest first. Those
+        which took over the counter of an evicted account may have missed more of their kudos than
+        MAX_MISSED_FRACTION, and are left out, as their ratios would be skewed.
+        """
+        h_indexes = self.h_indexes()
+        screen_names = [user for user, count, error in self.accounts.items() if error <= MAX_MISSED_FRACTION * count]
+        metrics = [self.account_sketches[u].metrics(h_indexes.get(u, 0), pa_weights) for u in screen_names]
+        return MetricTable(screen_names,
+                           [m[0] for m in metrics],
+                           [m[1] for m in metrics],
+                           [m[2] for m in metrics],
+                           [m[3] for m in metrics])
+
+
+def analyse_approximately(analyser, options, dedup=None):
+    """
+    Reports the top accounts by each metric approximately, from sketches of fixed size rather
+    than every interaction, see ApproximateStore. Only the heaviest accounts are ranked, and
+    D-rank isn't calculated. The error bounds of the sketches are reported too.
+    :param analyser: The TwitterAnalysis
+    :param options: The parsed command line options
+    :param dedup: A Deduplicator to drop tweets seen before with (default: keep them)
+    :return The MetricTable of the tracked accounts
+    """
+    store = ApproximateStore(int(options.sketch_accounts), int(options.sketch_tweets), int(options.hll_precision))
+    tweets = read_tweets(options.tweets_files, readers=int(options.readers), decoder=options.decoder, dedup=dedup)
+    analyser.ingest(tweets, store)
+
+    how_few = analyser.how_few
+    instrumentation = analyser.instrumentation
+    with instrumentation.stage('metrics'):
+        metrics = store.metric_table(analyser.pa_weights)
+    instrumentation.count('kudos_users', len(store.kudos_users))
+    instrumentation.count('tracked_users', len(metrics))
+    instrumentation.count('interactions', len(store))
+    print("Detected ~%d different Twitter users, ranking the %d given the most kudos" %
+          (len(store.kudos_users), len(metrics)))
+
+    with instrumentation.stage('rank'):
+        top_few = dict((metric, metrics.top(metric, how_few)) for metric in RANKED_METRICS)
+    analyser.print_top_few(top_few)
+
+    print("Most Retweeted Tweets")
+    retweeted = [(key, count - error) for key, count, error in store.tweets.items() if key[1] == RETWEET]
+    for key, count in top([key for key, _ in retweeted], [count for _, count in retweeted], how_few):
+        print("  @%s %s : %d" % (store.authors[key], key[0], count))
+    print("D-Rank isn't calculated approximately")
+
+    accounts = store.accounts
+    exact = sum(1 for error in accounts.errors.values() if not error)
+    print("Error bounds:")
+    print("  Distinct interactors, posts and inspiring tweets: HyperLogLog of %d registers, ~%.1f%% standard error" %
+          (1 << store.precision, 100 * HyperLogLog.standard_error(store.precision)))
+    print("  Accounts: %d counters over %d kudos; each account may have missed up to %d of its kudos "
+          "(%d counted from their first, %d ranked)" % (accounts.capacity, accounts.total, accounts.bound, exact,
+                                                       len(metrics)))
+    print("  Tweets: %d counters over %d retweets and quotes; each count within %d, so H-Indexes are lower bounds" %
+          (store.tweets.capacity, store.tweets.total, store.tweets.bound))
+
+    if options.output:
+        with instrumentation.stage('output'):
+            rows = write_metric_table(options.output, metrics, {}, options.output_format)
+        print("Wrote the approximate metrics of %d users to %s" % (rows, options.output))
+    return metrics
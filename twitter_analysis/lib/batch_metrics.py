@@ -0,0 +1,143 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .d_rank import require_numpy
+from .interactions import POST, RETWEET, QUOTE, REPLY, MENTION
+
+
+METRICS_ENGINES = ['python', 'batch']
+
+
+def count_pairs(groups, members, num_members):
+    """
+    Counts the occurrences of each distinct (group, member) pair, e.g. each (user, tweet).
+    :param groups: Array of group numbers
+    :param members: Array of member numbers, each in 0..num_members-1
+    :param num_members: The number of possible members
+    :return A tuple of (groups, members, counts) arrays, with an entry per distinct pair, sorted by group
+    """
+    pairs, counts = np.unique(groups.astype(np.int64) * num_members + members, return_counts=True)
+    return pairs // num_members, pairs % num_members, counts
+
+
+def pa_terms(store):
+    """
+    Calculates the terms of the Post/Activity Ratio of every user which don't depend on its weights,
+    so it can be calculated with any number of weightings at once, see pa_ratios().
+    :param store: The InteractionStore
+    :return A tuple of (log_counts, tweet_count) arrays, with a row (or entry) per user: the log(count + 1)
+    of their retweets, quotes, replies and favourites, in columns, and the number of tweets they posted
+    """
+    require_numpy("The batch metrics engine")
+    num_users = len(store.users)
+    num_tweets = len(store.tweets) + 1  # tweets are shifted up by one, so that NO_TWEET is 0
+    kind = np.frombuffer(store.kind, dtype=np.uint8)
+    target = np.frombuffer(store.target, dtype=np.int32)
+    tweet = np.frombuffer(store.tweet, dtype=np.int64) + 1
+
+    def of_kind(kinds):
+        return (kind & kinds) != 0
+
+    def per_user(users, weights=None):
+        return np.bincount(users, weights=weights, minlength=num_users)
+
+    is_post = of_kind(POST)
+    posting_users, posted_tweets, _ = count_pairs(target[is_post], tweet[is_post], num_tweets)
+    tweet_count = per_user(posting_users).astype(np.float64)
+
+    favourites = np.zeros(num_tweets, dtype=np.int64)
+    if hasattr(store.favourites, 'arrays'):
+        favourited_tweets, favourite_counts = store.favourites.arrays()  # already arrays, e.g. in a MappedStore
+        favourites[favourited_tweets + 1] = favourite_counts
+    elif store.favourites:
+        favourites[np.fromiter(store.favourites.keys(), dtype=np.int64, count=len(store.favourites)) + 1] = \
+            np.fromiter(store.favourites.values(), dtype=np.int64, count=len(store.favourites))
+    fav_count = per_user(posting_users, favourites[posted_tweets])
+    is_retweet = of_kind(RETWEET)
+    retweet_count = per_user(target[is_retweet])
+    quote_count = per_user(target[of_kind(QUOTE) & ~is_retweet])
+    reply_count = per_user(target[of_kind(REPLY) & ~of_kind(RETWEET | QUOTE)])
+    log_counts = np.log(np.column_stack([retweet_count, quote_count, reply_count, fav_count]) + 1.0)
+    return log_counts, tweet_count
+
+
+def pa_ratios(log_counts, tweet_count, pa_weights):
+    """
+    :param log_counts: The log counts of each user, see pa_terms()
+    :param tweet_count: The number of tweets each user posted, see pa_terms()
+    :param pa_weights: The weights to calculate pa_ratio with, (rt_weight, qu_weight, re_weight, fav_weight),
+    or a matrix of them, with a row per weight and a column per weighting
+    :return The Post/Activity Ratio of each user, as a vector (or a matrix, with a column per weighting)
+    """
+    pa_weights = np.asarray(pa_weights, dtype=np.float64)
+    if pa_weights.ndim == 1:
+        # term by term, in the order pa_ratio_of() adds them, so the ratios are exactly those of Kudos.pa_ratio()
+        activity = sum(w * log_counts[:, i] for i, w in enumerate(pa_weights.tolist()))
+    else:
+        activity = log_counts.dot(pa_weights)
+        tweet_count = tweet_count[:, np.newaxis]
+    return np.divide(activity, tweet_count, out=np.zeros(activity.shape), where=tweet_count != 0)
+
+
+def batch_metrics(store, pa_weights):
+    """
+    Calculates the H-Index, Interactor Ratio, Retweet/Mention Ratio and Post/Activity Ratio of
+    every user given kudos at once, as Kudos.h_index() etc. do one user at a time, from the rows
+    of the store grouped into per-user counts with array operations.
+    :param store: The InteractionStore
+    :param pa_weights: The weights to calculate pa_ratio with, (rt_weight, qu_weight, re_weight, fav_weight)
+    :return A tuple of (users, h_index, int_ratio, rm_ratio, pa_ratio) arrays, with an entry per user
+    in the order of store.kudos_users
+    """
+    require_numpy("The batch metrics engine")
+
+    num_users = len(store.users)
+    num_tweets = len(store.tweets) + 1  # tweets are shifted up by one, so that NO_TWEET is 0
+    kind = np.frombuffer(store.kind, dtype=np.uint8)
+    source = np.frombuffer(store.source, dtype=np.int32)
+    target = np.frombuffer(store.target, dtype=np.int32)
+    tweet = np.frombuffer(store.tweet, dtype=np.int64) + 1
+
+    def of_kind(kinds):
+        return (kind & kinds) != 0
+
+    def per_user(users, weights=None):
+        return np.bincount(users, weights=weights, minlength=num_users)
+
+    # H-Index: the retweets and the quotes of each tweet are counted separately
+    is_retweet = of_kind(RETWEET)
+    is_shared = of_kind(RETWEET | QUOTE)
+    shared_by = target[is_shared].astype(np.int64) * 2 + ~is_retweet[is_shared]  # the user, and retweet or quote
+    users, _, counts = count_pairs(shared_by, tweet[is_shared], num_tweets)
+    users //= 2
+    order = np.lexsort((-counts, users))   # each user's counts, highest first
+    users = users[order]
+    counts = counts[order]
+    rank = np.arange(1, len(users) + 1) - np.searchsorted(users, users)
+    h_index = per_user(users[counts >= rank])
+
+    # Interactor Ratio
+    is_interaction = of_kind(RETWEET | QUOTE | REPLY | MENTION)
+    users, _, _ = count_pairs(target[is_interaction], source[is_interaction], num_users)
+    unique_interactors = per_user(users)
+    followers_count = np.frombuffer(store.followers_count, dtype=np.int64).astype(np.float64)
+    int_ratio = np.divide(unique_interactors, followers_count, out=np.zeros(num_users), where=followers_count != 0)
+
+    # Post/Activity Ratio, whose terms include the number of tweets posted
+    log_counts, tweet_count = pa_terms(store)
+    pa_ratio = pa_ratios(log_counts, tweet_count, pa_weights)
+
+    # Retweet/Mention Ratio, from the unique tweets retweeted or quoted, replied to, and posted
+    users, _, _ = count_pairs(target[is_shared], tweet[is_shared], num_tweets)
+    inspiring_tweets_count = per_user(users)
+    is_reply = of_kind(REPLY)
+    users, _, _ = count_pairs(target[is_reply], tweet[is_reply], num_tweets)
+    reply_tweets_count = per_user(users)
+    rm_ratio = np.divide(inspiring_tweets_count + reply_tweets_count, tweet_count,
+                         out=np.zeros(num_users), where=tweet_count != 0)
+
+    kudos_users = np.frombuffer(store.kudos_users, dtype=np.int32)
+    return (kudos_users, h_index[kudos_users], int_ratio[kudos_users], rm_ratio[kudos_users],
+            pa_ratio[kudos_users])
@@ -0,0 +1,144 @@
+import io
+import json
+import multiprocessing
+import os
+import platform
+import time
+
+from contextlib import redirect_stdout
+from itertools import islice
+
+from .instrumentation import peak_rss
+from .interactions import InteractionStore
+from .options import Options
+from .ranking import RANKED_METRICS
+from .synthetic import write_corpus
+from .tweet_reader import read_tweets, timestamp
+from .twitter_analysis import TwitterAnalysis
+
+
+STAGES = ['parse', 'aggregate', 'rank', 'd_rank']
+
+TWEETS_PER_BATCH = 10000  # tweets parsed, then aggregated, at a time, so the two can be timed separately
+
+
+def corpus_path(corpus_dir, layout, num_tweets, seed):
+    return os.path.join(corpus_dir, 'synthetic-%s-%d-%d.json' % (layout, num_tweets, seed))
+
+
+def run_case(args):
+    """
+    Runs the analysis over one corpus, timing each stage. Meant to be run in a fresh process,
+    so that the peak memory use is that of this case alone.
+    :param args: A tuple of (path of the corpus, analysis command line arguments)
+    :return A map of the results
+    """
+    path, analysis_args = args
+    options = Options().parse(['-i', path] + analysis_args)
+    analyser = TwitterAnalysis(options)
+    store = InteractionStore()
+    timings = dict((stage, 0.0) for stage in STAGES)
+
+    with redirect_stdout(io.StringIO()):  # the results aren't of interest, only how long they take
+        tweets = read_tweets(path, progress_steps=0, decoder=options.decoder)
+        num_tweets = 0
+        while True:
+            started = time.perf_counter()
+            batch = list(islice(tweets, TWEETS_PER_BATCH))
+            timings['parse'] += time.perf_counter() - started
+            if not batch:
+                break
+            num_tweets += len(batch)
+
+            started = time.perf_counter()
+            analyser.ingest(batch, store)
+            timings['aggregate'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        kudos, metrics = analyser.calculate_metrics(store)
+        for metric in RANKED_METRICS:
+            metrics.top(metric, analyser.how_few)
+        timings['rank'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        analyser.calculate_d_rank(store)
+        timings['d_rank'] = time.perf_counter() - started
+
+    total = sum(timings.values())
+    return {
+        'tweets': num_tweets,
+        'users': len(store.users),
+        'kudos_users': len(kudos),
+        'rows': len(store),
+        'seconds': timings,
+        'total_seconds': total,
+        'tweets_per_second': num_tweets / total if total else None,
+        'peak_rss_bytes': peak_rss()
+    }
+
+
+def load_results(path):
+    """:return The results recorded in a file of results, one JSON object per line (or none, if it doesn't exist)"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+
+def case_key(result):
+    return result['layout'], result['tweets'], result['engines']
+
+
+def run_benchmarks(options):
+    """
+    Times the analysis of synthetic corpora of each of the given sizes and layouts (generating any
+    which don't exist yet), printing the time taken by each stage and appending the results to the
+    results file, along with how they compare with the latest earlier results for the same case.
+    :param options: The parsed benchmark command line options
+    :return The results of this run
+    """
+    label = options.label or timestamp()
+    analysis_args = ['--metrics-engine', options.metrics_engine, '--d-rank-engine', options.d_rank_engine,
+                     '--decoder', options.decoder, '-x', options.max_iterations]
+    engines = '%s/%s' % (options.metrics_engine, options.d_rank_engine)
+    previous = dict((case_key(r), r) for r in load_results(options.results_file))
+
+    if not os.path.isdir(options.corpus_dir):
+        os.makedirs(options.corpus_dir)
+
+    print("%-10s %9s %9s %9s %9s %9s %9s %11s %9s %8s" %
+          ('layout', 'tweets', 'parse', 'aggregate', 'rank', 'd_rank', 'total', 'tweets/s', 'peak MB', 'vs last'))
+    results = []
+    for num_tweets in [int(float(n)) for n in options.sizes]:
+        for layout in options.layouts:
+            path = corpus_path(options.corpus_dir, layout, num_tweets, int(options.seed))
+            if not os.path.exists(path):
+                write_corpus(path, num_tweets, layout, seed=int(options.seed))
+
+            # a fresh process for each case, so its peak memory use isn't that of an earlier case
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                result = pool.apply(run_case, ((path, analysis_args),))
+            result.update({
+                'label': label,
+                'layout': layout,
+                'engines': engines,
+                'decoder': options.decoder,
+                'python': platform.python_version(),
+                'platform': platform.platform()
+            })
+            results.append(result)
+
+            last = previous.get(case_key(result))
+            change = ''
+            if last is not None and last['total_seconds']:
+                change = '%+.0f%%' % (100.0 * (result['total_seconds'] / last['total_seconds'] - 1))
+            seconds = result['seconds']
+            print("%-10s %9d %9.3f %9.3f %9.3f %9.3f %9.3f %11.0f %9.1f %8s" % (
+                layout, result['tweets'], seconds['parse'], seconds['aggregate'], seconds['rank'], seconds['d_rank'],
+                result['total_seconds'], result['tweets_per_second'] or 0,
+                (result['peak_rss_bytes'] or 0) / 1048576.0, change))
+
+            with open(options.results_file, 'a') as f:
+                f.write(json.dumps(result, sort_keys=True))
+                f.write('\n')
+    return results
@@ -0,0 +1,248 @@
+import json
+import mmap
+import os
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .d_rank import require_numpy
+from .interactions import InteractionStore
+from .tweet_reader import expand_input_paths
+
+
+CACHE_MAGIC = b'TWCACHE1'
+CACHE_VERSION = 1
+ALIGNMENT = 64  # bytes; each column starts on a boundary of this, so it can be viewed in place
+
+# the columns of a cache file, and their types: the rows of the store, the per-user profile counts,
+# the users given kudos, the favourite counts (sorted by tweet), and the screen names and tweet IDs,
+# each a blob of UTF-8 with the offset of each key in it
+COLUMNS = [
+    ('source', 'i4'), ('target', 'i4'), ('tweet', 'i8'), ('via', 'i8'), ('kind', 'u1'),
+    ('followers_count', 'i8'), ('friends_count', 'i8'), ('total_tweet_count', 'i8'), ('profiled', 'u1'),
+    ('kudos_users', 'i4'), ('in_kudos', 'u1'),
+    ('favourite_tweets', 'i8'), ('favourite_counts', 'i8'),
+    ('user_names', 'u1'), ('user_offsets', 'i8'), ('tweet_ids', 'u1'), ('tweet_offsets', 'i8')
+]
+
+
+def cache_key(options):
+    """
+    :param options: The parsed command line options
+    :return What a cache of the input's interactions depends on: each input file's path, size and
+    modification time, and the options which change what's ingested from it
+    """
+    files = []
+    for path in expand_input_paths(options.tweets_files):
+        stat = os.stat(path)
+        files.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    dedup = options.dedup
+    if dedup == 'bloom':
+        dedup = [dedup, str(options.bloom_capacity), str(options.bloom_error)]  # which unique tweets it drops
+    return {'version': CACHE_VERSION, 'files': files, 'count': str(options.tweet_count), 'dedup': dedup}
+
+
+def encode_keys(keys):
+    """:return A tuple of (blob of the keys in UTF-8, array of the offset of each key in it, and of its end)"""
+    encoded = [str(k).encode('utf-8') for k in keys]
+    offsets = array('q', [0])
+    total = 0
+    for e in encoded:
+        total += len(e)
+        offsets.append(total)
+    return b''.join(encoded), offsets
+
+
+def save_cache(path, store, key, num_tweets):
+    """
+    Writes the contents of an InteractionStore to a columnar binary file, which load_cache() maps back
+    into memory. The file is only replaced once it's fully written.
+    :param path: The cache file
+    :param store: The InteractionStore
+    :param key: The cache_key() of the input the store was ingested from
+    :param num_tweets: How many tweets were ingested
+    :return The size of the file, in bytes
+    """
+    favourites = sorted(store.favourites.items())
+    user_names, user_offsets = encode_keys(store.users.keys)
+    tweet_ids, tweet_offsets = encode_keys(store.tweets.keys)
+    data = {
+        'source': store.source, 'target': store.target, 'tweet': store.tweet, 'via': store.via,
+        'kind': store.kind, 'followers_count': store.followers_count, 'friends_count': store.friends_count,
+        'total_tweet_count': store.total_tweet_count, 'profiled': store.profiled,
+        'kudos_users': store.kudos_users, 'in_kudos': store.in_kudos,
+        'favourite_tweets': array('q', (t for t, _ in favourites)),
+        'favourite_counts': array('q', (c for _, c in favourites)),
+        'user_names': user_names, 'user_offsets': user_offsets, 'tweet_ids': tweet_ids, 'tweet_offsets': tweet_offsets
+    }
+
+    # lay the columns out one after another, each aligned, after the header
+    columns = {}
+    offset = 0
+    for name, dtype in COLUMNS:
+        nbytes = memoryview(data[name]).nbytes
+        columns[name] = [dtype, offset, nbytes]
+        offset += -(-nbytes // ALIGNMENT) * ALIGNMENT
+    meta = json.dumps({'key': key, 'num_tweets': num_tweets, 'columns': columns}).encode('utf-8')
+    header_size = -(-(len(CACHE_MAGIC) + 8 + len(meta)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(CACHE_MAGIC + len(meta).to_bytes(8, 'little') + meta)
+        for name, _ in COLUMNS:
+            f.seek(header_size + columns[name][1])
+            f.write(data[name])
+        f.truncate(header_size + offset)
+    os.replace(tmp_path, path)
+    return header_size + offset
+
+
+def read_cache_meta(f):
+    """:return The metadata of a cache file (its key, columns, etc.), and the size of its header"""
+    magic = f.read(len(CACHE_MAGIC))
+    if magic != CACHE_MAGIC:
+        raise ValueError("Not an interaction cache file")
+    meta_size = int.from_bytes(f.read(8), 'little')
+    meta = json.loads(f.read(meta_size).decode('utf-8'))
+    return meta, -(-(len(CACHE_MAGIC) + 8 + meta_size) // ALIGNMENT) * ALIGNMENT
+
+
+def load_cache(path, key):
+    """
+    Maps a cache file written by save_cache() into memory, if it exists and was written from the same input.
+    :param path: The cache file
+    :param key: The cache_key() of the input
+    :return A MappedStore, or None if there's no cache or it's stale
+    """
+    require_numpy("The interaction cache")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        try:
+            meta, header_size = read_cache_meta(f)
+        except ValueError as e:
+            print("[WARN] Ignoring the cache %s: %s" % (path, e))
+            return None
+        if meta['key'] != key:
+            print("[INFO] The cache %s is stale (the input or options have changed since it was written)" % path)
+            return None
+        if os.fstat(f.fileno()).st_size == header_size:
+            return MappedStore(None, header_size, meta)  # an empty corpus, which can't be mapped
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return MappedStore(mapped, header_size, meta)
+
+
+class MappedStrings:
+    """
+    Stands in for an Interner (see interactions.py) over keys held in a cache file: each key is
+    decoded from the mapped bytes only when it's looked up by number, and the map back from keys to
+    numbers is only built if it's needed.
+    """
+    def __init__(self, mapped, start, offsets):
+        self.mapped = mapped
+        self.start = start
+        self.offsets = offsets
+        self.ids = None
+
+    def __getitem__(self, i):
+        i = int(i)
+        return self.mapped[self.start + int(self.offsets[i]):self.start + int(self.offsets[i + 1])].decode('utf-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def keys(self):
+        return [self[i] for i in range(len(self))]
+
+    def lookup(self, key):
+        """:return The integer for key, or -1 if it isn't one of the keys"""
+        if self.ids is None:
+            self.ids = dict((k, i) for i, k in enumerate(self.keys))
+        return self.ids.get(key, -1)
+
+
+class MappedFavourites:
+    """A read-only map of tweet to favourite count, over the sorted arrays of a cache file"""
+    def __init__(self, tweets, counts):
+        self.tweets = tweets
+        self.counts = counts
+
+    def arrays(self):
+        """:return A tuple of the (tweets, counts) arrays, without copying them"""
+        return self.tweets, self.counts
+
+    def get(self, tweet, default=None):
+        i = int(np.searchsorted(self.tweets, tweet))
+        if i < len(self.tweets) and self.tweets[i] == tweet:
+            return int(self.counts[i])
+        return default
+
+    def __getitem__(self, tweet):
+        count = self.get(tweet)
+        if count is None:
+            raise KeyError(tweet)
+        return count
+
+    def __contains__(self, tweet):
+        return self.get(tweet) is not None
+
+    def __len__(self):
+        return len(self.tweets)
+
+    def keys(self):
+        return self.tweets.tolist()
+
+    def values(self):
+        return self.counts.tolist()
+
+    def items(self):
+        return zip(self.tweets.tolist(), self.counts.tolist())
+
+
+class MappedStore(InteractionStore):
+    """
+    A read-only InteractionStore whose columns are numpy arrays viewing a memory-mapped cache file
+    (see save_cache()), so a corpus ingested once can be analysed again without decoding its tweets,
+    or even reading the file up front: the OS pages the columns in as they're used. The batch metrics
+    engine and the sparse and parallel D-rank engines work on the mapped columns in place.
+    """
+    def __init__(self, mapped, header_size, meta):
+        self.mapped = mapped
+        self.num_tweets = meta['num_tweets']
+        columns = {}
+        for name, (dtype, offset, nbytes) in meta['columns'].items():
+            dtype = np.dtype(dtype)
+            if mapped is None:
+                columns[name] = np.zeros(0, dtype=dtype)
+            else:
+                columns[name] = np.frombuffer(mapped, dtype=dtype, count=nbytes // dtype.itemsize,
+                                              offset=header_size + offset)
+
+        self.source = columns['source']
+        self.target = columns['target']
+        self.tweet = columns['tweet']
+        self.via = columns['via']
+        self.kind = columns['kind']
+        self.followers_count = columns['followers_count']
+        self.friends_count = columns['friends_count']
+        self.total_tweet_count = columns['total_tweet_count']
+        self.profiled = columns['profiled']
+        self.kudos_users = columns['kudos_users']
+        self.in_kudos = columns['in_kudos']
+        self.favourites = MappedFavourites(columns['favourite_tweets'], columns['favourite_counts'])
+        self.users = MappedStrings(mapped, header_size + meta['columns']['user_names'][1], columns['user_offsets'])
+        self.tweets = MappedStrings(mapped, header_size + meta['columns']['tweet_ids'][1], columns['tweet_offsets'])
+        self._by_target = None
+
+    def rows_by_target(self):
+        """As InteractionStore.rows_by_target(), with a stable argsort"""
+        if self._by_target is None:
+            offsets = np.zeros(len(self.users) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.target, minlength=len(self.users)), out=offsets[1:])
+            self._by_target = (offsets, np.argsort(self.target, kind='stable'))
+        return self._by_target
@@ -0,0 +1,532 @@
+import multiprocessing
+import os
+import threading
+import time
+
+from collections import deque
+
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy import sparse
+    from scipy.sparse.linalg import spsolve_triangular
+except ImportError:
+    sparse = None
+
+from .interactions import LINK
+
+
+D_RANK_ENGINES = ['python', 'sparse', 'parallel']
+
+D_RANK_SOLVERS = ['jacobi', 'gauss-seidel']
+
+EXTRAPOLATIONS = ['none', 'aitken', 'quadratic']
+
+RESIDUAL_NORMS = ['linf', 'l1']
+
+INTERESTING_DELTA = 0.001   # redo scores if a new value differs by more than this
+
+EXTRAPOLATE_EVERY = 5  # iterations between extrapolations, so the slowest-decaying errors dominate again
+
+MIN_USERS_PER_WORKER = 50000  # fewer than this each, and starting workers costs more than it saves
+
+
+def require_numpy(what):
+    if np is None:
+        raise RuntimeError("%s requires numpy (and ideally scipy) to be installed" % what)
+
+
+class Convergence:
+    """
+    Decides when D-rank has converged from the residual of each iteration, the change it made to
+    the scores by the chosen norm: the largest change to any one score (linf) or the total change
+    (l1). Each iteration's residual is recorded (and reported, if debugging), and a warning is
+    printed if the iterations run out before the residual falls within the tolerance.
+    """
+    def __init__(self, tolerance=INTERESTING_DELTA, norm='linf', debug=False, instrumentation=None):
+        if norm not in RESIDUAL_NORMS:
+            raise ValueError("Unknown residual norm '%s', expected one of %s" % (norm, ', '.join(RESIDUAL_NORMS)))
+        self.tolerance = tolerance
+        self.norm = norm
+        self.debug = debug
+        self.instrumentation = instrumentation
+        self.iterations = 0
+        self.residual = None
+        self.started = None
+
+    def start(self):
+        """Marks the start of an iteration"""
+        self.iterations += 1
+        self.started = (time.perf_counter(), time.process_time())
+
+    def finish(self, max_delta, total_delta, num_users):
+        """
+        Marks the end of an iteration.
+        :param max_delta: The largest change to any score in the iteration
+        :param total_delta: The sum of the changes to every score in the iteration
+        :param num_users: How many users were scored
+        :return Whether the scores are still changing by more than the tolerance
+        """
+        started_wall, started_cpu = self.started
+        self.residual = max_delta if self.norm == 'linf' else total_delta
+        if self.instrumentation is not None:
+            self.instrumentation.d_rank_iteration(time.perf_counter() - started_wall,
+                                                  time.process_time() - started_cpu, max_delta, self.residual)
+        if self.debug:
+            print("=== Iteration %d (%d users): largest change %.6f, %s residual %.6g ===" %
+                  (self.iterations, num_users, max_delta, self.norm, self.residual))
+        return self.residual > self.tolerance
+
+    @property
+    def converged(self):
+        return self.residual is None or self.residual <= self.tolerance
+
+    def report(self, max_iterations):
+        """Reports whether the scores converged, once the iterations are over"""
+        converged = self.converged
+        if self.instrumentation is not None:
+            self.instrumentation.count('d_rank_converged', converged)
+            self.instrumentation.count('d_rank_residual', self.residual)
+        if not converged:
+            print("[WARN] D-rank hit iteration max of %d before converging (%s residual %.6g > %g)" %
+                  (max_iterations, self.norm, self.residual, self.tolerance))
+        elif self.debug:
+            print("[INFO] D-rank converged after %d iterations" % self.iterations)
+
+
+def aitken_extrapolation(history):
+    """
+    Aitken's delta-squared extrapolation of each score from its last three iterates, x0, x1 and x2,
+    to x2 - (x2 - x1)^2 / ((x2 - x1) - (x1 - x0)), the limit of a geometrically converging sequence.
+    Scores whose changes aren't shrinking are left as they are.
+    """
+    x0, x1, x2 = history[-3:]
+    d1 = x1 - x0
+    d2 = x2 - x1
+    shrinking = np.abs(d2) < np.abs(d1)
+    return np.where(shrinking, x2 - d2 * d2 / np.where(shrinking, d2 - d1, 1.0), x2)
+
+
+def quadratic_extrapolation(history):
+    """
+    Quadratic extrapolation (Kamvar et al., 2003) of the scores from their last four iterates,
+    assuming the error in them is made up of the two slowest-decaying components of the iteration,
+    which it eliminates. D-rank is an affine iteration, x' = (1 - w) + w.A.x, so it's applied to
+    the iterates extended with a constant 1, which is divided out again afterwards.
+    """
+    x0, x1, x2, x3 = history[-4:]
+    y = np.column_stack([x1 - x0, x2 - x0])
+    gamma = np.linalg.lstsq(y, x0 - x3, rcond=None)[0]
+    beta = [gamma[0] + gamma[1] + 1.0, gamma[1] + 1.0, 1.0]
+    total = sum(beta)
+    if not np.isfinite(total) or abs(total) < 1e-12:
+        return x3
+    return (beta[0] * x1 + beta[1] * x2 + beta[2] * x3) / total
+
+
+class Extrapolator:
+    """
+    Extrapolates D-rank's scores from the iterates so far, every EXTRAPOLATE_EVERY iterations,
+    to jump ahead towards their limit: with Aitken's delta-squared process or quadratic extrapolation.
+    """
+    def __init__(self, method='none', instrumentation=None):
+        if method not in EXTRAPOLATIONS:
+            raise ValueError("Unknown extrapolation '%s', expected one of %s" % (method, ', '.join(EXTRAPOLATIONS)))
+        if method != 'none':
+            require_numpy("D-rank extrapolation")
+        self.method = method
+        self.extrapolate = aitken_extrapolation if method == 'aitken' else quadratic_extrapolation
+        self.needed = 3 if method == 'aitken' else 4
+        self.history = deque(maxlen=self.needed)
+        self.instrumentation = instrumentation
+        self.since = 0  # iterations since the last extrapolation
+        self.extrapolations = 0
+
+    def __bool__(self):
+        return self.method != 'none'
+
+    def __call__(self, scores):
+        """
+        :param scores: The vector of scores of an iteration (which isn't modified)
+        :return The scores, extrapolated if it's time to
+        """
+        self.history.append(scores)
+        self.since += 1
+        if self.since < EXTRAPOLATE_EVERY or len(self.history) < self.needed:
+            return scores
+        scores = self.extrapolate(list(self.history))
+        self.history.clear()
+        self.history.append(scores)
+        self.since = 0
+        self.extrapolations += 1
+        if self.instrumentation is not None:
+            self.instrumentation.count('d_rank_extrapolations', self.extrapolations)
+        return scores
+
+
+class DRankMatrix:
+    """
+    The D-rank interaction graph as a weighted adjacency matrix in CSR form, built once from the
+    LINK rows of an InteractionStore. Row i, column j holds the number of interactions user j
+    (the inspired user) directed at user i, divided by the number of distinct users j interacted
+    with (j's out-degree), so that one D-rank iteration is (1 - w) + w * A.s.
+    Users are numbered 0..n-1 in screen name order; `users` maps them back to store user numbers.
+    """
+    def __init__(self, store):
+        require_numpy("The sparse D-rank engine")
+
+        kind = np.frombuffer(store.kind, dtype=np.uint8)
+        is_link = (kind & LINK) != 0
+        sources = np.frombuffer(store.source, dtype=np.int32)[is_link]
+        targets = np.frombuffer(store.target, dtype=np.int32)[is_link]
+
+        # renumber the users involved in links densely, in screen name order
+        users, inverse = np.unique(np.concatenate([sources, targets]), return_inverse=True)
+        names = store.users
+        by_name = np.array(sorted(range(len(users)), key=lambda i: names[int(users[i])]), dtype=np.int64)
+        rank = np.empty(len(users), dtype=np.int64)
+        rank[by_name] = np.arange(len(users))
+        self.users = users[by_name]
+        self.n = n = len(users)
+        cols = rank[inverse[:len(sources)]]
+        rows = rank[inverse[len(sources):]]
+
+        # count the interactions between each pair of users, sorted by row then column
+        pairs, counts = np.unique(rows * max(n, 1) + cols, return_counts=True)
+        rows = pairs // max(n, 1)
+        cols = pairs % max(n, 1)
+        out_degrees = np.bincount(cols, minlength=n)
+        data = counts / out_degrees[cols].astype(np.float64)
+        self._set_csr(np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))]), cols, data, n, rows)
+
+    @classmethod
+    def from_csr(cls, indptr, cols, data, num_cols):
+        """:return A DRankMatrix of the given rows of links, e.g. some of the rows of another one, without users"""
+        matrix = cls.__new__(cls)
+        matrix.users = None
+        matrix._set_csr(indptr, cols, data, num_cols)
+        return matrix
+
+    def _set_csr(self, indptr, cols, data, num_cols, rows=None):
+        self.n = n = len(indptr) - 1
+        self.indptr = indptr
+        self.cols = cols
+        self.data = data
+        self.rows = rows if rows is not None else np.repeat(np.arange(n), np.diff(indptr))
+        self.matrix = None
+        self.triangles = None
+        if sparse is not None:
+            self.matrix = sparse.csr_matrix((data, cols, indptr), shape=(n, num_cols))
+
+    def dot(self, scores):
+        """:return A.scores, where scores is a vector (or a matrix with a column per score vector)"""
+        if self.matrix is not None:
+            return self.matrix.dot(scores)
+        if scores.ndim == 1:
+            return np.bincount(self.rows, weights=self.data * scores[self.cols], minlength=self.n)
+        return np.column_stack([self.dot(scores[:, c]) for c in range(scores.shape[1])])
+
+    def gauss_seidel_sweep(self, scores, weight_factor):
+        """
+        Runs a Gauss-Seidel sweep of D-rank: each user's new score is calculated in turn, in row order,
+        from the new scores of the users before them and the old scores of the rest (and their own),
+        as if the scores were updated in place. With scipy, the sweep is a single sparse triangular
+        solve, (I - w.L).s' = (1 - w) + w.U.s, where L is the part of the matrix below the diagonal
+        and U the rest.
+        :param scores: The vector of scores before the sweep (which isn't modified)
+        :param weight_factor: The D-rank weighting factor
+        :return The vector of scores after the sweep
+        """
+        damping_factor = 1 - weight_factor
+        if self.matrix is not None:
+            if self.triangles is None or self.triangles[0] != weight_factor:
+                lower = sparse.tril(self.matrix, k=-1, format='csr')
+                self.triangles = (weight_factor, sparse.identity(self.n, format='csr') - weight_factor * lower,
+                                  sparse.triu(self.matrix, format='csr'))
+            _, lower, upper = self.triangles
+            return spsolve_triangular(lower, damping_factor + weight_factor * upper.dot(scores), lower=True)
+
+        new_scores = scores.copy()
+        for i in range(self.n):
+            start, end = self.indptr[i], self.indptr[i + 1]
+            surrounding_influence = np.dot(self.data[start:end], new_scores[self.cols[start:end]])
+            new_scores[i] = damping_factor + weight_factor * surrounding_influence
+        return new_scores
+
+    def screen_names(self, store):
+        return [store.users[int(u)] for u in self.users]
+
+    def initial_scores(self, store, weight_factor, initial_scores=None):
+        """:return The vector of scores to start D-rank from, see sparse_d_rank()"""
+        influence_scores = np.full(self.n, weight_factor)
+        if initial_scores:
+            for i, screen_name in enumerate(self.screen_names(store)):
+                influence_scores[i] = initial_scores.get(screen_name, weight_factor)
+        return influence_scores
+
+    def partition(self, parts):
+        """
+        Divides the rows into contiguous ranges of about the same amount of work (a row's links, plus
+        one for the row itself), one per worker.
+        :param parts: How many ranges to divide the rows into
+        :return A list of (first row, end row) tuples
+        """
+        work = self.indptr + np.arange(self.n + 1)
+        bounds = np.searchsorted(work, np.linspace(0, work[-1], parts + 1)[1:-1])
+        bounds = [0] + bounds.tolist() + [self.n]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+
+def sparse_d_rank(store, max_iterations, weight_factor=0.2, debug=False, initial_scores=None, instrumentation=None,
+                  solver='jacobi', extrapolation='none', tolerance=INTERESTING_DELTA, norm='linf'):
+    """
+    Calculates D-rank exactly as TwitterAnalysis.d_rank() does, but with each iteration
+    as a single sparse matrix-vector product over a DRankMatrix.
+    :param store: The InteractionStore holding the links
+    :param max_iterations: The most iterations to run before giving up on convergence
+    :param weight_factor: The D-rank weighting factor
+    :param debug: Whether to report each iteration
+    :param initial_scores: Map of screen name to score to start from (default: start every user from weight_factor)
+    :param instrumentation: An Instrumentation to record the time taken and residual of each iteration in
+    :param solver: One of D_RANK_SOLVERS: jacobi iterations (the reference), or gauss-seidel sweeps, which
+    use each new score as soon as it's calculated
+    :param extrapolation: One of EXTRAPOLATIONS, see Extrapolator
+    :param tolerance: The residual at or below which the scores have converged
+    :param norm: The norm of the residual, one of RESIDUAL_NORMS, see Convergence
+    :return A map of screen name to D-rank score
+    """
+    matrix = DRankMatrix(store)
+    if debug:
+        print("[INFO] D-rank matrix: %d users, %d weighted links" % (matrix.n, len(matrix.data)))
+    if instrumentation is not None:
+        instrumentation.count('d_rank_users', matrix.n)
+        instrumentation.count('d_rank_links', len(matrix.data))
+
+    # Step 1. Set all weights
+    influence_scores = matrix.initial_scores(store, weight_factor, initial_scores)
+
+    influence_scores, _ = matrix_d_rank(matrix, influence_scores, max_iterations, weight_factor, debug,
+                                        instrumentation, solver, extrapolation, tolerance, norm)
+    return dict(zip(matrix.screen_names(store), influence_scores.tolist()))
+
+
+def matrix_d_rank(matrix, influence_scores, max_iterations, weight_factor=0.2, debug=False, instrumentation=None,
+                  solver='jacobi', extrapolation='none', tolerance=INTERESTING_DELTA, norm='linf'):
+    """
+    Iterates D-rank over a DRankMatrix from the given scores, see sparse_d_rank().
+    :param matrix: The DRankMatrix
+    :param influence_scores: The vector of scores to start from (which isn't modified)
+    :return A tuple of (the vector of scores, the Convergence of the iterations)
+    """
+    if solver not in D_RANK_SOLVERS:
+        raise ValueError("Unknown D-rank solver '%s', expected one of %s" % (solver, ', '.join(D_RANK_SOLVERS)))
+    damping_factor = 1 - weight_factor
+    convergence = Convergence(tolerance, norm, debug, instrumentation)
+    extrapolate = Extrapolator(extrapolation, instrumentation)
+
+    # Step 2.
+    scores_have_changed = matrix.n > 0
+    while convergence.iterations < max_iterations and scores_have_changed:
+        convergence.start()
+        if solver == 'gauss-seidel':
+            new_influence_scores = matrix.gauss_seidel_sweep(influence_scores, weight_factor)
+        else:
+            new_influence_scores = damping_factor + weight_factor * matrix.dot(influence_scores)
+
+        # Step 3. check if any have changed
+        changes = np.abs(new_influence_scores - influence_scores)
+        scores_have_changed = convergence.finish(float(changes.max()), float(changes.sum()), matrix.n)
+        influence_scores = new_influence_scores
+        if extrapolate and scores_have_changed:
+            influence_scores = extrapolate(influence_scores)
+
+    convergence.report(max_iterations)
+    return influence_scores, convergence
+
+
+class SharedArrays:
+    """
+    Numpy arrays in shared memory, which worker processes attach to by the names of their blocks
+    (see `blocks`) rather than having them copied to them.
+    """
+    def __init__(self, blocks, create=False):
+        """
+        :param blocks: Map of array name to (shared memory block name, shape, dtype), or to an array to
+        copy into a new block if create is set
+        :param create: Whether to create the blocks, rather than attach to existing ones
+        """
+        self.memory = []
+        self.arrays = {}
+        self.blocks = {}
+        for name, block in blocks.items():
+            if create:
+                array = np.ascontiguousarray(block)
+                memory = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+                shared[...] = array
+            else:
+                block_name, shape, dtype = block
+                memory = shared_memory.SharedMemory(name=block_name)
+                shared = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+            self.memory.append(memory)
+            self.arrays[name] = shared
+            self.blocks[name] = (memory.name, shared.shape, shared.dtype.str)
+        self.created = create
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def close(self):
+        """Detaches from the blocks, freeing them if they were created here; the arrays mustn't be used after"""
+        self.arrays = {}
+        for memory in self.memory:
+            memory.close()
+            if self.created:
+                memory.unlink()
+        self.memory = []
+
+
+def d_rank_worker(blocks, worker, first_row, end_row, weight_factor, barrier):
+    """
+    Calculates the new scores of rows first_row..end_row-1 of the D-rank matrix in each iteration run
+    by parallel_d_rank(), until told to stop. Each iteration starts and ends at the barrier.
+    :param blocks: The blocks of the SharedArrays holding the matrix, scores, deltas and control
+    :param worker: The number of this worker, which its largest and total change in each iteration are recorded
+    under
+    :param first_row: The first row of this worker's partition
+    :param end_row: The end of this worker's partition (exclusive)
+    :param weight_factor: The D-rank weighting factor
+    :param barrier: The multiprocessing.Barrier shared with the other workers and the coordinator
+    """
+    shared = SharedArrays(blocks)
+    try:
+        iterate_partition(shared, worker, first_row, end_row, weight_factor, barrier)
+    except BaseException:
+        barrier.abort()  # rather than leave the others waiting for this worker forever
+        raise
+    finally:
+        shared.close()
+
+
+def iterate_partition(shared, worker, first_row, end_row, weight_factor, barrier):
+    damping_factor = 1 - weight_factor
+    indptr = shared['indptr']
+    first_link = indptr[first_row]
+    end_link = indptr[end_row]
+    scores = shared['scores']
+    partition = DRankMatrix.from_csr(indptr[first_row:end_row + 1] - first_link, shared['cols'][first_link:end_link],
+                                     shared['data'][first_link:end_link], scores.shape[1])
+
+    deltas = shared['deltas']
+    control = shared['control']  # [whether to stop, which row of scores holds the current scores]
+    while True:
+        barrier.wait()
+        if control[0]:
+            return
+        current = int(control[1])
+        old_scores = scores[current]
+        new_scores = scores[1 - current]
+        new_scores[first_row:end_row] = damping_factor + weight_factor * partition.dot(old_scores)
+        changes = np.abs(new_scores[first_row:end_row] - old_scores[first_row:end_row])
+        deltas[worker] = (changes.max(), changes.sum()) if len(changes) else (0.0, 0.0)
+        barrier.wait()
+
+
+def parallel_d_rank(store, max_iterations, weight_factor=0.2, debug=False, initial_scores=None, instrumentation=None,
+                    solver='jacobi', extrapolation='none', tolerance=INTERESTING_DELTA, norm='linf', workers=None):
+    """
+    Calculates D-rank exactly as sparse_d_rank() does, but with the rows of the matrix (the users)
+    divided between worker processes, which share the matrix and the score vectors in shared memory.
+    Each iteration, every worker calculates the new scores of its own users from the previous
+    scores, as D-rank is a Jacobi iteration, and the residual across all of them decides whether
+    to carry on; any extrapolation is done between iterations. Small graphs, a lack of cores, or
+    Gauss-Seidel sweeps (which are inherently sequential) fall back to sparse_d_rank().
+    :param store: The InteractionStore holding the links
+    :param max_iterations: The most iterations to run before giving up on convergence
+    :param weight_factor: The D-rank weighting factor
+    :param debug: Whether to report each iteration
+    :param initial_scores: Map of screen name to score to start from (default: start every user from weight_factor)
+    :param instrumentation: An Instrumentation to record the time taken and residual of each iteration in
+    :param solver: One of D_RANK_SOLVERS, see sparse_d_rank()
+    :param extrapolation: One of EXTRAPOLATIONS, see Extrapolator
+    :param tolerance: The residual at or below which the scores have converged
+    :param norm: The norm of the residual, one of RESIDUAL_NORMS, see Convergence
+    :param workers: The number of worker processes (default: one per CPU)
+    :return A map of screen name to D-rank score
+    """
+    matrix = DRankMatrix(store)
+    workers = min(workers or os.cpu_count() or 1, matrix.n // MIN_USERS_PER_WORKER)
+    if multiprocessing.current_process().daemon:
+        workers = 1  # e.g. within a benchmark's pool, where processes can't start their own
+    if solver == 'gauss-seidel':
+        print("[WARN] Gauss-Seidel sweeps are sequential; running them with the sparse D-rank engine")
+        workers = 1
+    if workers <= 1:
+        return sparse_d_rank(store, max_iterations, weight_factor, debug, initial_scores, instrumentation,
+                             solver, extrapolation, tolerance, norm)
+    if debug:
+        print("[INFO] D-rank matrix: %d users, %d weighted links, across %d workers" %
+              (matrix.n, len(matrix.data), workers))
+    if instrumentation is not None:
+        instrumentation.count('d_rank_users', matrix.n)
+        instrumentation.count('d_rank_links', len(matrix.data))
+        instrumentation.count('d_rank_workers', workers)
+    convergence = Convergence(tolerance, norm, debug, instrumentation)
+    extrapolate = Extrapolator(extrapolation, instrumentation)
+
+    # Step 1. Set all weights
+    scores = np.empty((2, matrix.n))
+    scores[0] = matrix.initial_scores(store, weight_factor, initial_scores)
+    shared = SharedArrays({
+        'indptr': matrix.indptr,
+        'cols': matrix.cols,
+        'data': matrix.data,
+        'scores': scores,
+        'deltas': np.zeros((workers, 2)),  # the largest and total change of each worker's scores
+        'control': np.zeros(2, dtype=np.int64)
+    }, create=True)
+    barrier = multiprocessing.Barrier(workers + 1)
+    processes = [multiprocessing.Process(target=d_rank_worker,
+                                         args=(shared.blocks, w, first_row, end_row, weight_factor, barrier))
+                 for w, (first_row, end_row) in enumerate(matrix.partition(workers))]
+    control = shared['control']
+    finished = False
+    try:
+        for process in processes:
+            process.start()
+
+        # Step 2.
+        scores_have_changed = True
+        while convergence.iterations < max_iterations and scores_have_changed:
+            convergence.start()
+            barrier.wait()  # the workers calculate the new scores from control[1]'s
+            barrier.wait()
+            control[1] = 1 - control[1]
+
+            # Step 3. check if any have changed
+            deltas = shared['deltas']
+            scores_have_changed = convergence.finish(float(deltas[:, 0].max()), float(deltas[:, 1].sum()), matrix.n)
+            if extrapolate and scores_have_changed:
+                current_scores = shared['scores'][control[1]]
+                current_scores[:] = extrapolate(current_scores.copy())  # the workers are waiting at the barrier
+
+        control[0] = 1
+        barrier.wait()
+        finished = True
+        influence_scores = shared['scores'][control[1]].tolist()
+    except threading.BrokenBarrierError:
+        raise RuntimeError("A D-rank worker failed")
+    finally:
+        if not finished:
+            barrier.abort()  # releases any workers still waiting
+        for process in processes:
+            process.join()
+        shared.close()
+
+    convergence.report(max_iterations)
+    return dict(zip(matrix.screen_names(store), influence_scores))
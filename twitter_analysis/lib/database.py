@@ -0,0 +1,213 @@
+import os
+import sqlite3
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .interactions import KUDOS_KINDS, NO_TWEET, POST, RETWEET, QUOTE, REPLY, MENTION
+
+
+# the interactions saved, by the name they're stored and queried under
+INTERACTION_KINDS = [('post', POST), ('retweet', RETWEET), ('quote', QUOTE), ('reply', REPLY), ('mention', MENTION)]
+QUERY_KINDS = [name for name, _ in INTERACTION_KINDS] + ['favourite']
+
+ROWS_PER_INSERT = 10000  # rows handed to sqlite at a time, so the whole store needn't be copied at once
+
+if np is not None:
+    # the columns of a MappedStore are numpy arrays, whose numbers sqlite doesn't otherwise take
+    for numpy_type in (np.uint8, np.int32, np.int64):
+        sqlite3.register_adapter(numpy_type, int)
+
+SCHEMA = [
+    'CREATE TABLE users (id INTEGER PRIMARY KEY, screen_name TEXT NOT NULL, followers_count INTEGER, '
+    'friends_count INTEGER, total_tweet_count INTEGER)',
+    'CREATE TABLE tweets (id INTEGER PRIMARY KEY, tweet_id TEXT)',
+    'CREATE TABLE interactions (source INTEGER NOT NULL, target INTEGER NOT NULL, kind TEXT NOT NULL, '
+    'tweet INTEGER, via INTEGER)',
+    'CREATE TABLE favourites (tweet INTEGER PRIMARY KEY, count INTEGER NOT NULL)',
+    'CREATE TABLE metrics (user INTEGER PRIMARY KEY, h_index INTEGER, int_ratio REAL, rm_ratio REAL, '
+    'pa_ratio REAL, d_rank REAL)'
+]
+
+# created after the bulk inserts, which is much quicker than maintaining them row by row
+INDEXES = [
+    'CREATE UNIQUE INDEX users_by_screen_name ON users (screen_name)',
+    'CREATE UNIQUE INDEX tweets_by_tweet_id ON tweets (tweet_id)',
+    'CREATE INDEX interactions_by_target ON interactions (target, kind)',
+    'CREATE INDEX interactions_by_source ON interactions (source, kind)',
+    'CREATE INDEX interactions_by_tweet ON interactions (tweet)'
+]
+
+
+def batches(rows, size=ROWS_PER_INSERT):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class InteractionDatabase:
+    """
+    A SQLite database of the interactions in an InteractionStore (posts, retweets, quotes, replies
+    and mentions, as recorded for the Kudos metrics), the favourite counts of tweets, each user's
+    profile counts and their metrics, indexed so that a user's interactions can be looked up
+    without re-reading the tweets.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, store, kudos, pa_weights, d_rank_scores):
+        """
+        Replaces the contents of the database with the store's interactions and the metrics
+        calculated from them, all in a single transaction.
+        :param store: The InteractionStore
+        :param kudos: The Kudos of each user reported on
+        :param pa_weights: The weights to calculate pa_ratio with
+        :param d_rank_scores: Map of screen name to D-rank score
+        """
+        db = self.connection
+        kind_names = dict((flag, name) for name, flag in INTERACTION_KINDS)
+        users = store.users
+        with db:
+            for (table,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                db.execute('DROP TABLE %s' % table)
+            for statement in SCHEMA:
+                db.execute(statement)
+
+            for batch in batches((u, users[u], store.followers_count[u], store.friends_count[u],
+                                  store.total_tweet_count[u]) if store.profiled[u] else (u, users[u], None, None, None)
+                                 for u in range(len(users))):
+                db.executemany('INSERT INTO users VALUES (?, ?, ?, ?, ?)', batch)
+            for batch in batches(enumerate(store.tweets.keys)):
+                db.executemany('INSERT INTO tweets VALUES (?, ?)', batch)
+            for batch in batches((source, target, kind_names[kind & KUDOS_KINDS],
+                                  tweet if tweet != NO_TWEET else None, via if via != NO_TWEET else None)
+                                 for source, target, tweet, via, kind
+                                 in zip(store.source, store.target, store.tweet, store.via, store.kind)
+                                 if kind & KUDOS_KINDS):  # rows which are only D-rank links aren't kept
+                db.executemany('INSERT INTO interactions VALUES (?, ?, ?, ?, ?)', batch)
+            for batch in batches(store.favourites.items()):
+                db.executemany('INSERT INTO favourites VALUES (?, ?)', batch)
+
+            metrics = dict((k.user, [k.h_index(), k.int_ratio(), k.rm_ratio(), k.pa_ratio(*pa_weights), None])
+                           for k in kudos)
+            for screen_name, score in d_rank_scores.items():
+                metrics.setdefault(users.lookup(screen_name), [None] * 5)[4] = score
+            for batch in batches((u,) + tuple(m) for u, m in metrics.items()):
+                db.executemany('INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)', batch)
+
+            for statement in INDEXES:
+                db.execute(statement)
+        db.execute('ANALYZE')
+
+    def profile(self, screen_name):
+        """:return A tuple of (user, followers_count, friends_count, total_tweet_count), or None for an unknown user"""
+        return self.connection.execute(
+            'SELECT id, followers_count, friends_count, total_tweet_count FROM users WHERE screen_name = ?',
+            (screen_name,)).fetchone()
+
+    def metrics(self, user):
+        """:return A tuple of (h_index, int_ratio, rm_ratio, pa_ratio, d_rank), any of which may be None"""
+        return self.connection.execute(
+            'SELECT h_index, int_ratio, rm_ratio, pa_ratio, d_rank FROM metrics WHERE user = ?', (user,)).fetchone()
+
+    def interactions(self, user, kind, by_user=False):
+        """
+        Looks up the interactions of one kind with (or, if by_user, by) a user.
+        :param user: The user, as returned by profile()
+        :param kind: One of the names in INTERACTION_KINDS
+        :param by_user: Whether to look up the user's interactions with others, rather than others' with them
+        :return A list of (screen name of the other user, interacted-with tweet ID, tweet ID of the interaction),
+        in the order they appeared in the corpus
+        """
+        this_user, other_user = ('source', 'target') if by_user else ('target', 'source')
+        return self.connection.execute(
+            'SELECT u.screen_name, t.tweet_id, v.tweet_id FROM interactions i '
+            'JOIN users u ON u.id = i.%s LEFT JOIN tweets t ON t.id = i.tweet LEFT JOIN tweets v ON v.id = i.via '
+            'WHERE i.%s = ? AND i.kind = ? ORDER BY i.rowid' % (other_user, this_user),
+            (user, kind)).fetchall()
+
+    def favourites(self, user):
+        """:return A list of (tweet ID, favourite count) of the user's tweets which have been favourited"""
+        return self.connection.execute(
+            "SELECT DISTINCT t.tweet_id, f.count FROM interactions i JOIN favourites f ON f.tweet = i.tweet "
+            "JOIN tweets t ON t.id = i.tweet WHERE i.target = ? AND i.kind = 'post' ORDER BY f.count DESC",
+            (user,)).fetchall()
+
+
+def save_database(path, store, kudos, pa_weights, d_rank_scores):
+    """
+    Saves the interactions and metrics to a database file, see InteractionDatabase.write(). The database
+    is built afresh alongside any existing one, which it replaces only once it's fully written.
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    with InteractionDatabase(tmp_path) as db:
+        db.write(store, kudos, pa_weights, d_rank_scores)
+    os.replace(tmp_path, path)
+
+
+def print_interactions(db, screen_name, kinds, by_user=False):
+    """
+    Prints a user's profile, metrics and interactions of the given kinds.
+    :param db: The InteractionDatabase
+    :param screen_name: The user's screen name, with or without a leading '@'
+    :param kinds: Names from QUERY_KINDS
+    :param by_user: Whether to print the user's interactions with others, rather than others' with them
+    :return False if the user isn't in the database
+    """
+    screen_name = screen_name.lstrip('@')
+    profile = db.profile(screen_name)
+    if profile is None:
+        print("@%s: not found" % screen_name)
+        return False
+    user, followers_count, friends_count, total_tweet_count = profile
+
+    if followers_count is None:
+        print("@%s" % screen_name)
+    else:
+        print("@%s: %d followers, %d friends, %d tweets" % (screen_name, followers_count, friends_count,
+                                                           total_tweet_count))
+    metrics = db.metrics(user)
+    if metrics is not None:
+        h_index, int_ratio, rm_ratio, pa_ratio, d_rank = metrics
+        if h_index is not None:
+            print("  H-Index %d, Ir %.2f, RMr %.2f, PAr %.2f" % (h_index, int_ratio, rm_ratio, pa_ratio))
+        if d_rank is not None:
+            print("  D-Rank %.2f" % d_rank)
+
+    for kind in kinds:
+        if kind == 'favourite':
+            if by_user:
+                continue  # who favourited what isn't known, only how many times each tweet was
+            favourites = db.favourites(user)
+            print("  favourited tweets (%d)" % len(favourites))
+            for tweet_id, count in favourites:
+                print("    %s : %d" % (tweet_id, count))
+            continue
+        interactions = db.interactions(user, kind, by_user)
+        plural = 'replies' if kind == 'reply' else kind + 's'
+        print("  %s %s @%s (%d)" % (plural, 'by' if by_user else 'of', screen_name, len(interactions)))
+        for other_screen_name, tweet_id, via_tweet_id in interactions:
+            if kind == 'post':
+                print("    %s" % tweet_id)
+            else:
+                print("    @%s : %s (in %s)" % (other_screen_name, tweet_id, via_tweet_id))
+    return True
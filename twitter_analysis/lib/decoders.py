@@ -0,0 +1,34 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+
+DECODERS = ['auto', 'orjson', 'simdjson', 'json']
+
+
+def get_decoder(name='auto'):
+    """
+    Provides a function to decode a line of JSON (as bytes) into Python objects, using the
+    fastest available library. 'auto' prefers orjson, then simdjson, then the standard library.
+    :param name: One of DECODERS
+    :return A tuple of (name of the decoder used, decoding function)
+    """
+    if name not in DECODERS:
+        raise ValueError("Unknown JSON decoder '%s', expected one of %s" % (name, ', '.join(DECODERS)))
+
+    if name in ('auto', 'orjson') and orjson is not None:
+        return 'orjson', orjson.loads
+    if name in ('auto', 'simdjson') and simdjson is not None:
+        parser = simdjson.Parser()
+        return 'simdjson', lambda l: parser.parse(l, True)  # True: convert the whole document eagerly
+    if name not in ('auto', 'json'):
+        raise ValueError("JSON decoder '%s' is not installed" % name)
+    return 'json', json.loads
@@ -0,0 +1,255 @@
+import math
+import mmap
+import os
+import re
+import tempfile
+
+from array import array
+
+from .sketches import hash64
+
+
+DEDUP_MODES = ['none', 'set', 'bloom']
+
+MASK64 = (1 << 64) - 1
+FIBONACCI = 0x9E3779B97F4A7C15  # 2^64 / the golden ratio, to spread keys over a hash table
+
+# a tweet's own ID (and not that of its user, or of a tweet it embeds) is found in the raw line only
+# before the first nested object: as "id":123 or "id":"123", or "id_str":"123"
+TWEET_ID = re.compile(rb'"id(?:_str)?"\s*:\s*(?:"(\d+)"|(\d+)[\s,}])')
+
+BLOOM_MAGIC = b'TWBLOOM1'
+BLOOM_HEADER = 32  # magic, then the number of bits and of hash functions, each 8 bytes, then padding
+
+
+def tweet_key(tweet_id):
+    """
+    :param tweet_id: A tweet ID, as a string (or bytes) of digits, or any other string
+    :return The ID as a signed 64 bit integer: the number itself, if it fits, otherwise a hash of it
+    """
+    try:
+        key = int(tweet_id)
+        if 0 <= key < 1 << 63:
+            return key
+    except ValueError:
+        pass
+    if isinstance(tweet_id, bytes):
+        tweet_id = tweet_id.decode('utf-8')
+    h = hash64(tweet_id)
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def peek_tweet_id(line):
+    """
+    Finds the ID of the tweet in a line of JSON without decoding it, if it comes before any nested
+    object (as the APIs and Twitter4J write it).
+    :return The ID, as bytes of digits, or None if it isn't found before the first nested object
+    """
+    end = line.find(b'{', 1)
+    m = TWEET_ID.search(line, 0, end if end != -1 else len(line))
+    if m is None:
+        return None
+    return m.group(1) or m.group(2)
+
+
+class TweetIdSet:
+    """
+    An exact set of 64 bit tweet keys (see tweet_key()) in an open-addressing hash table, a single
+    array of int64 with linear probing, kept at most half full: 16-32 bytes per key, rather than the
+    ~100 of a Python set of ints.
+    """
+    def __init__(self, capacity=1 << 16):
+        self.bits = max(4, (2 * capacity - 1).bit_length())
+        self.table = array('q', bytes(8 << self.bits))
+        self.size = 0
+        self.has_zero = False  # 0 marks an empty slot, so the key 0 is held apart
+
+    def add(self, key):
+        """:return Whether the key is new, in which case it's added"""
+        if key == 0:
+            new = not self.has_zero
+            self.has_zero = True
+            return new
+        table = self.table
+        mask = len(table) - 1
+        i = ((key & MASK64) * FIBONACCI & MASK64) >> (64 - self.bits)
+        while True:
+            k = table[i]
+            if k == key:
+                return False
+            if k == 0:
+                break
+            i = (i + 1) & mask
+        table[i] = key
+        self.size += 1
+        if 2 * self.size > len(table):
+            self.grow()
+        return True
+
+    def grow(self):
+        old = self.table
+        self.bits += 1
+        self.table = array('q', bytes(8 << self.bits))
+        self.size = 0
+        for k in old:
+            if k:
+                self.add(k)
+
+    def __len__(self):
+        return self.size + self.has_zero
+
+    def nbytes(self):
+        return len(self.table) * self.table.itemsize
+
+
+class BloomFilter:
+    """
+    An approximate set of 64 bit tweet keys in a memory-mapped bit array on disk, so billions of
+    keys can be held in a few GB without keeping them in memory: the OS pages the bits in and out.
+    Keys are never missed, but a key not added may be taken for one that was with the given
+    probability, once the filter holds its capacity (fewer keys, less often), so a few unique tweets
+    are dropped as duplicates. The file is created afresh, sparse, sized for the capacity and error
+    rate (about 1.44 * log2(1/error_rate) bits per key), and the k probes are derived from the key by
+    double hashing (Kirsch and Mitzenmacher, "Less hashing, same performance", 2006).
+    """
+    def __init__(self, path, capacity, error_rate=0.001, temporary=False):
+        if not 0 < error_rate < 1:
+            raise ValueError("The Bloom filter error rate must be between 0 and 1, not %g" % error_rate)
+        capacity = max(1, int(capacity))
+        self.num_bits = max(64, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.path = path
+        self.temporary = temporary  # whether to remove the file once closed
+        self.size = 0
+        size = BLOOM_HEADER + (self.num_bits + 7) // 8
+        with open(path, 'wb') as f:
+            f.write(BLOOM_MAGIC + self.num_bits.to_bytes(8, 'little') + self.num_hashes.to_bytes(8, 'little'))
+            f.truncate(size)  # sparse, so only the pages with bits set take up space
+        self.file = open(path, 'r+b')
+        self.bits = mmap.mmap(self.file.fileno(), size)
+
+    def add(self, key):
+        """:return Whether the key is (probably) new, in which case it's added"""
+        h1 = (key & MASK64) * FIBONACCI & MASK64
+        h2 = (h1 ^ (h1 >> 31)) * 0xBF58476D1CE4E5B9 & MASK64 | 1
+        bits = self.bits
+        num_bits = self.num_bits
+        new = False
+        for i in range(self.num_hashes):
+            bit = (h1 + i * h2) % num_bits
+            byte = BLOOM_HEADER + (bit >> 3)
+            flag = 1 << (bit & 7)
+            b = bits[byte]
+            if not b & flag:
+                bits[byte] = b | flag
+                new = True
+        if new:
+            self.size += 1
+        return new
+
+    def __len__(self):
+        return self.size
+
+    def nbytes(self):
+        return len(self.bits)
+
+    def close(self):
+        self.bits.close()
+        self.file.close()
+        if self.temporary:
+            os.remove(self.path)
+
+
+def line_tweet_key(line, decode):
+    """
+    :param line: A line holding one tweet as a JSON object
+    :param decode: A function to decode a line into a TweetRecord, if its ID can't be found without decoding it
+    :return The key of the tweet (see tweet_key())
+    """
+    tweet_id = peek_tweet_id(line)
+    return tweet_key(tweet_id if tweet_id is not None else decode(line).id)
+
+
+class Deduplicator:
+    """
+    Drops tweets seen before (by ID) from a stream, keeping the first of each, before they're
+    aggregated, so a tweet collected more than once (as where streamed and searched collections
+    overlap) counts once towards the metrics and D-rank. Where the ID can be found in the raw line
+    (see peek_tweet_id()), a duplicate is dropped before it's decoded at all, for the cost of a regular
+    expression search and a hash table probe; otherwise it's dropped once decoded, before it's ingested.
+    The IDs seen are held in a TweetIdSet, exactly, or a BloomFilter on disk, approximately.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.num_duplicates = 0
+
+    def is_new(self, tweet_id):
+        """:return Whether the tweet hasn't been seen before, noting it as seen"""
+        return self.is_new_key(tweet_key(tweet_id))
+
+    def is_new_key(self, key):
+        """:return Whether the tweet with the given key (see tweet_key()) hasn't been seen before, noting it as seen"""
+        if self.index.add(key):
+            return True
+        self.num_duplicates += 1
+        return False
+
+    def decode_unique(self, lines, decode):
+        """
+        :param lines: An iterable of lines, each holding one tweet as a JSON object
+        :param decode: A function to decode a line into a TweetRecord
+        :return A generator of the TweetRecords of the tweets not seen before
+        """
+        decode_if_new = self.decode_if_new
+        for l in lines:
+            record = decode_if_new(l, decode)
+            if record is not None:
+                yield record
+
+    def decode_if_new(self, line, decode):
+        """:return The TweetRecord decoded from the line, or None if the tweet has been seen before"""
+        tweet_id = peek_tweet_id(line)
+        if tweet_id is not None:
+            return decode(line) if self.is_new(tweet_id) else None
+        record = decode(line)
+        return record if self.is_new(record.id) else None
+
+    def unique_records(self, records):
+        """:return A generator of the TweetRecords (or tweet dictionaries) of the tweets not seen before"""
+        for t in records:
+            if self.is_new(t.id if hasattr(t, 'id') else t.get('id_str', t.get('id'))):
+                yield t
+
+    def add_store(self, store):
+        """Notes the tweets already in an InteractionStore (e.g. one being resumed) as seen"""
+        tweets = store.tweets
+        for t in store.corpus_tweets():
+            self.index.add(tweet_key(tweets[t]))
+
+    def record(self, instrumentation):
+        instrumentation.count('dedup_duplicates', self.num_duplicates)
+        instrumentation.count('dedup_index_bytes', self.index.nbytes())
+
+    def close(self):
+        if isinstance(self.index, BloomFilter):
+            self.index.close()
+
+
+def make_deduplicator(options):
+    """
+    :param options: The parsed command line options, see --dedup, --bloom-file, --bloom-capacity
+    and --bloom-error
+    :return A Deduplicator for the chosen mode, or None if duplicates are to be kept
+    """
+    mode = options.dedup
+    if mode not in DEDUP_MODES:
+        raise ValueError("Unknown de-duplication mode '%s', expected one of %s" % (mode, ', '.join(DEDUP_MODES)))
+    if mode == 'none':
+        return None
+    if mode == 'set':
+        return Deduplicator(TweetIdSet())
+    path = options.bloom_file
+    if path is None:
+        path = os.path.join(options.spill_dir or tempfile.gettempdir(), 'tweet_ids-%d.bloom' % os.getpid())
+    return Deduplicator(BloomFilter(path, float(options.bloom_capacity), float(options.bloom_error),
+                                    temporary=options.bloom_file is None))
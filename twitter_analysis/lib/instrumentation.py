@@ -0,0 +1,113 @@
+import json
+import platform
+import sys
+import time
+
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None  # not on Windows
+
+
+def peak_rss():
+    """:return The peak resident set size of this process so far, in bytes (or None, if it's unknown)"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024  # bytes on macOS, KiB elsewhere
+
+
+class Instrumentation:
+    """
+    Records how long each stage of the analysis takes (in wall clock and CPU time), counts of what
+    was processed, and the progress of each D-rank iteration, so they can be saved as JSON.
+    Stages may be entered more than once, in which case their times accumulate.
+    """
+    def __init__(self):
+        self.stages = {}             # name -> {'wall': seconds, 'cpu': seconds, 'calls': count}
+        self.counters = {}           # name -> value
+        self.d_rank_iterations = []  # {'wall', 'cpu', 'max_delta', 'residual'} for each iteration
+
+    def add_time(self, name, wall, cpu, calls=1):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'wall': 0.0, 'cpu': 0.0, 'calls': 0}
+        stage['wall'] += wall
+        stage['cpu'] += cpu
+        stage['calls'] += calls
+
+    @contextmanager
+    def stage(self, name):
+        """Times the code run within the `with` block as (part of) the named stage"""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def timed(self, items, name):
+        """
+        Times how long it takes to produce each item of an iterable, e.g. to read each line of a
+        file, as the named stage. Anything done with an item by the consumer isn't included.
+        :param items: An iterable
+        :param name: The name of the stage
+        :return A generator of the same items
+        """
+        wall = cpu = 0.0
+        calls = 0
+        it = iter(items)
+        try:
+            while True:
+                started_wall = time.perf_counter()
+                started_cpu = time.process_time()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                finally:
+                    wall += time.perf_counter() - started_wall
+                    cpu += time.process_time() - started_cpu
+                calls += 1
+                yield item
+        finally:
+            self.add_time(name, wall, cpu, calls)
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def add_count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def d_rank_iteration(self, wall, cpu, max_delta, residual=None):
+        self.d_rank_iterations.append({'wall': wall, 'cpu': cpu, 'max_delta': max_delta,
+                                       'residual': max_delta if residual is None else residual})
+
+    def to_dict(self):
+        stages = dict((name, dict(stage)) for name, stage in self.stages.items())
+        # decoding is timed as producing each record, which includes reading its line, and reading
+        # and decoding happen within ingestion, the rest of which is aggregating the interactions
+        if 'decode' in stages and 'read' in stages and 'ingest' in stages:
+            stages['aggregate'] = dict(stages['ingest'])
+            for clock in ('wall', 'cpu'):
+                stages['decode'][clock] -= stages['read'][clock]
+                stages['aggregate'][clock] -= stages['read'][clock] + stages['decode'][clock]
+        ingest = stages.get('ingest')
+        tweets = self.counters.get('tweets')
+        return {
+            'stages': stages,
+            'counters': self.counters,
+            'tweets_per_second': tweets / ingest['wall'] if tweets is not None and ingest and ingest['wall'] else None,
+            'd_rank_iterations': self.d_rank_iterations,
+            'peak_rss_bytes': peak_rss(),
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        }
+
+    def save(self, path):
+        """Writes the recorded measurements to a file as JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
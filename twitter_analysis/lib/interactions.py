@@ -0,0 +1,309 @@
+from abc import ABC, abstractmethod
+from array import array
+
+
+# Kinds of row in the InteractionStore. These are bit flags, because a single row can serve
+# more than one purpose, e.g. a mention counts towards the Kudos of the mentioned user and is
+# also a D-rank link from the mentioning user to the mentioned user.
+POST = 1        # source posted tweet (source == target)
+RETWEET = 2     # source retweeted target's tweet
+QUOTE = 4       # source quoted target's tweet
+REPLY = 8       # source replied to target's tweet
+MENTION = 16    # source mentioned target in tweet
+LINK = 32       # source interacted with target, for the purposes of D-rank
+
+KUDOS_KINDS = POST | RETWEET | QUOTE | REPLY | MENTION
+
+KIND_NAMES = [(POST, 'post'), (RETWEET, 'retweet'), (QUOTE, 'quote'), (REPLY, 'reply'),
+              (MENTION, 'mention'), (LINK, 'link')]
+
+NO_TWEET = -1
+
+
+def kind_names(kind):
+    return [name for flag, name in KIND_NAMES if kind & flag]
+
+
+class Interner:
+    """
+    Maps keys (e.g. screen names or tweet IDs) to dense integers, 0, 1, 2..., in the order they
+    are first seen, and back again.
+    """
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+
+    def intern(self, key):
+        i = self.ids.get(key)
+        if i is None:
+            i = len(self.keys)
+            self.ids[key] = i
+            self.keys.append(key)
+        return i
+
+    def lookup(self, key):
+        """:return The integer for key, or -1 if it hasn't been interned"""
+        return self.ids.get(key, -1)
+
+    def __getitem__(self, i):
+        return self.keys[i]
+
+    def __getstate__(self):
+        return self.keys  # the map back from keys is rebuilt on unpickling
+
+    def __setstate__(self, keys):
+        self.keys = keys
+        self.ids = dict((k, i) for i, k in enumerate(keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class InteractionStore:
+    """
+    Holds every interaction seen in the corpus exactly once, as rows in typed columnar arrays:
+      source: the interacting user (e.g. the retweeter)
+      target: the user interacted with (e.g. the retweeted user)
+      tweet:  the tweet interacted with (e.g. the retweeted tweet); for mentions and D-rank links,
+              the tweet containing the mention
+      via:    the tweet in the corpus which gave rise to the row (e.g. the retweet)
+      kind:   bit flags, see POST, RETWEET, QUOTE, REPLY, MENTION and LINK
+    Users (by screen name) and tweets (by ID) are interned to dense integers. Per-user profile
+    counts are held in arrays indexed by user, and favourite counts in a map indexed by tweet.
+    Both the Kudos metrics and D-rank are calculated from this one store.
+    """
+    def __init__(self):
+        self.users = Interner()
+        self.tweets = Interner()
+
+        self.source = array('i')
+        self.target = array('i')
+        self.tweet = array('q')
+        self.via = array('q')
+        self.kind = array('B')
+
+        self.followers_count = array('q')
+        self.friends_count = array('q')
+        self.total_tweet_count = array('q')
+        self.profiled = bytearray()   # 1 if a profile has been seen for the user
+
+        self.kudos_users = array('i')  # users given kudos, in the order they were first given kudos
+        self.in_kudos = bytearray()
+
+        self.favourites = {}  # tweet -> highest favourite count seen
+
+        self._by_target = None
+
+    def user(self, screen_name):
+        u = self.users.intern(screen_name)
+        if u == len(self.profiled):
+            for column in (self.followers_count, self.friends_count, self.total_tweet_count):
+                column.append(0)
+            self.profiled.append(0)
+            self.in_kudos.append(0)
+        return u
+
+    def kudos_user(self, screen_name):
+        """Interns a user, noting that they are to be reported on with the Kudos metrics"""
+        u = self.user(screen_name)
+        if not self.in_kudos[u]:
+            self.in_kudos[u] = 1
+            self.kudos_users.append(u)
+        return u
+
+    def tweet_id(self, tweet_id):
+        return self.tweets.intern(tweet_id)
+
+    def add(self, source, target, tweet, via, kind):
+        self.source.append(source)
+        self.target.append(target)
+        self.tweet.append(tweet)
+        self.via.append(via)
+        self.kind.append(kind)
+        self._by_target = None
+
+    def link(self, interactee, interactor, tweet, via, first_row=0):
+        """
+        Records a D-rank link from interactor to interactee. If a row for the same pair of users
+        has already been added since first_row (typically, the first row added for the current
+        tweet) and not yet counted as a link, it is flagged as one instead of adding another row.
+        """
+        kind = self.kind
+        for r in range(first_row, len(kind)):
+            if not kind[r] & LINK and self.source[r] == interactor and self.target[r] == interactee:
+                kind[r] |= LINK
+                return
+        self.add(interactor, interactee, tweet, via, LINK)
+
+    def update_profile(self, user, followers_count, friends_count, total_tweet_count):
+        self.followers_count[user] = max(followers_count, self.followers_count[user])
+        self.friends_count[user] = max(friends_count, self.friends_count[user])
+        self.total_tweet_count[user] = max(total_tweet_count, self.total_tweet_count[user])
+        self.profiled[user] = 1
+
+    def update_favourite_count(self, tweet, new_fav_count):
+        if new_fav_count > self.favourites.get(tweet, 0):
+            self.favourites[tweet] = new_fav_count
+
+    def __len__(self):
+        return len(self.kind)
+
+    def end_tweet(self):
+        """Marks the end of the rows of a tweet; there's nothing to do, as every row is kept"""
+
+    def drop_rows_before(self, row):
+        """
+        Forgets the rows before the given one (e.g. those of tweets which have left a time window),
+        so they no longer take up memory. The remaining rows are renumbered from 0.
+        """
+        for column in (self.source, self.target, self.tweet, self.via, self.kind):
+            del column[:row]
+        self._by_target = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_by_target'] = None
+        return state
+
+    def merge(self, other):
+        """
+        Adds the contents of another store (e.g. one built from another part of the corpus) to
+        this one: profile counts take the maximum of the two, favourite counts likewise, rows
+        (including each user's posted tweets) are concatenated, and users first given kudos in
+        the other store follow those of this one. Merging the stores built from consecutive
+        parts of a corpus, in order, gives exactly the store built from the whole corpus.
+        :param other: The InteractionStore to merge into this one
+        :return This store
+        """
+        user_map = array('i', (self.user(name) for name in other.users.keys))
+        tweet_map = array('q', (self.tweet_id(t) for t in other.tweets.keys))
+
+        for u in other.kudos_users:
+            self.kudos_user(other.users[u])
+        for u in range(len(other.users)):
+            if other.profiled[u]:
+                self.update_profile(user_map[u], other.followers_count[u], other.friends_count[u],
+                                    other.total_tweet_count[u])
+        for t, count in other.favourites.items():
+            self.update_favourite_count(tweet_map[t], count)
+
+        self.source.extend(user_map[u] for u in other.source)
+        self.target.extend(user_map[u] for u in other.target)
+        self.tweet.extend(tweet_map[t] if t != NO_TWEET else NO_TWEET for t in other.tweet)
+        self.via.extend(tweet_map[t] if t != NO_TWEET else NO_TWEET for t in other.via)
+        self.kind.extend(other.kind)
+        self._by_target = None
+        return self
+
+    def corpus_tweets(self):
+        """:return The set of (the numbers of) the tweets in the corpus, each of which posted its own row"""
+        return set(t for t, v, k in zip(self.tweet, self.via, self.kind) if k & POST and t == v)
+
+    def rows_by_target(self):
+        """
+        Groups the rows by target user with a counting sort, so the rows targeting user u are
+        rows[offsets[u]:offsets[u + 1]]. The grouping is cached until more rows are added.
+        :return A tuple of (offsets, rows) arrays
+        """
+        if self._by_target is None:
+            num_users = len(self.users)
+            offsets = array('q', bytes(8 * (num_users + 1)))
+            for t in self.target:
+                offsets[t + 1] += 1
+            for u in range(num_users):
+                offsets[u + 1] += offsets[u]
+            rows = array('q', bytes(8 * len(self.target)))
+            next_slot = array('q', offsets)
+            for r, t in enumerate(self.target):
+                rows[next_slot[t]] = r
+                next_slot[t] += 1
+            self._by_target = (offsets, rows)
+        return self._by_target
+
+    def rows_targeting(self, user):
+        offsets, rows = self.rows_by_target()
+        return rows[offsets[user]:offsets[user + 1]]
+
+    def links(self):
+        """
+        Collects the D-rank links between users.
+        :return A tuple of (incoming, outgoing), where incoming is
+        { interactee: { interactor: number of interactions } } and outgoing is
+        { interactor: set(interactee) }, all by user number
+        """
+        incoming = {}
+        outgoing = {}
+        for source, target, kind in zip(self.source, self.target, self.kind):
+            if kind & LINK:
+                interactors = incoming.get(target)
+                if interactors is None:
+                    interactors = incoming[target] = {}
+                interactors[source] = interactors.get(source, 0) + 1
+                interactees = outgoing.get(source)
+                if interactees is None:
+                    interactees = outgoing[source] = set()
+                interactees.add(target)
+        return incoming, outgoing
+
+
+class TweetRows(ABC):
+    """
+    Stands in for an InteractionStore while ingesting tweets (see TwitterAnalysis.add_kudos() and
+    gather_tweet_interactions()) for stores which don't keep every row in memory, holding only the
+    rows of the tweet being ingested until end_tweet() hands them over to take_rows(). Users and
+    tweets aren't interned, but held as screen names and tweet IDs. Subclasses also provide
+    update_profile() and update_favourite_count(), as InteractionStore does.
+    """
+    def __init__(self):
+        self.num_rows = 0  # rows of the tweets ingested before this one
+
+        # the rows of the tweet being ingested
+        self.source = []
+        self.target = []
+        self.tweet = []
+        self.kind = []
+
+    def __len__(self):
+        return self.num_rows + len(self.kind)
+
+    def user(self, screen_name):
+        return screen_name
+
+    def kudos_user(self, screen_name):
+        return screen_name
+
+    def tweet_id(self, tweet_id):
+        return tweet_id
+
+    def add(self, source, target, tweet, via, kind):
+        self.source.append(source)
+        self.target.append(target)
+        self.tweet.append(tweet)
+        self.kind.append(kind)
+
+    def link(self, interactee, interactor, tweet, via, first_row=0):
+        """As InteractionStore.link(), within the rows of the tweet being ingested"""
+        kind = self.kind
+        for r in range(max(0, first_row - self.num_rows), len(kind)):
+            if not kind[r] & LINK and self.source[r] == interactor and self.target[r] == interactee:
+                kind[r] |= LINK
+                return
+        self.add(interactor, interactee, tweet, via, LINK)
+
+    def end_tweet(self):
+        """Hands the rows of the tweet just ingested over to take_rows()"""
+        self.take_rows(self.source, self.target, self.tweet, self.kind)
+        self.num_rows += len(self.kind)
+        for column in (self.source, self.target, self.tweet, self.kind):
+            del column[:]
+
+    @abstractmethod
+    def take_rows(self, sources, targets, tweets, kinds):
+        """
+        Takes the rows of the tweet just ingested, e.g. to count them or spill them to disk, which each
+        subclass must implement. The lists are reused for the next tweet, so must be copied to be kept.
+        :param sources: The source user of each row
+        :param targets: The target user of each row
+        :param tweets: The tweet of each row
+        :param kinds: The kind of each row, see POST etc.
+        """
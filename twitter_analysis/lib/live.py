@@ -0,0 +1,224 @@
+import asyncio
+import os
+import stat
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .decoders import get_decoder
+from .interactions import InteractionStore
+from .output import write_metric_table
+from .state import AnalysisState
+from .tweet_parsers import RecordExtractor
+from .tweet_reader import report, timestamp
+
+
+READ_BYTES = 1 << 20  # bytes read from a stream at a time; the complete lines in them are decoded as a batch
+
+QUEUED_BATCHES = 16   # batches read ahead of the analysis, beyond which reading waits for it to catch up
+
+
+def parse_address(address, default_host='127.0.0.1'):
+    """
+    :param address: A TCP address, '[host:]port'
+    :return A tuple of (host, port)
+    """
+    host, _, port = address.rpartition(':')
+    try:
+        return host or default_host, int(port)
+    except ValueError:
+        raise ValueError("Invalid address '%s', expected [host:]port" % address)
+
+
+def is_pipe(f):
+    """:return Whether the file is a pipe, FIFO, socket or character device, which asyncio can read from directly"""
+    mode = os.fstat(f.fileno()).st_mode
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode)
+
+
+class LiveAnalysis:
+    """
+    Ingests newline-delimited tweets from any number of streams (stdin, named pipes and TCP
+    connections) as they arrive, and reports the top accounts every so often.
+
+    Each stream is read a large chunk at a time by a coroutine, which hands the complete lines in it
+    over to the analysis as a batch, through a bounded queue. The batches are decoded and ingested
+    off the event loop, one at a time, so reading carries on meanwhile; if the analysis falls behind,
+    the queue fills up and the readers wait, leaving the producers to be held up by their pipes' and
+    sockets' own buffers filling up, rather than buffering tweets without limit. The reports take
+    turns with ingestion, and like an incremental run (see AnalysisState) recalculate the metrics
+    of only the users affected since the last one, and warm-start D-rank.
+    """
+    def __init__(self, analyser, refresh, output=None, dedup=None):
+        """
+        :param analyser: The TwitterAnalysis
+        :param refresh: How often to report the top accounts, in seconds
+        :param output: A file to write the full metric table to with each report (default: none)
+        :param dedup: A Deduplicator to drop tweets seen before, on any stream, with (default: keep them)
+        """
+        self.analyser = analyser
+        self.refresh = refresh
+        self.output = output
+        self.dedup = dedup
+        self.store = InteractionStore()
+        self.state = AnalysisState(self.store)
+        self.executor = ThreadPoolExecutor(1)  # ingestion and reports take turns, away from the event loop
+        self.batches = None
+        _, self.loads = get_decoder(analyser.options.decoder)
+        self.extract = RecordExtractor()
+        self.num_tweets = 0
+        self.num_invalid = 0
+        self.reported_tweets = 0
+        self.reported_at = time.perf_counter()
+
+    async def run(self, stdin=False, fifos=(), tcp_addresses=()):
+        """
+        Reads and analyses tweets from the given sources until they have all ended, which only stdin
+        does (named pipes are kept open for successive writers, and TCP servers keep listening).
+        :param stdin: Whether to read tweets from stdin
+        :param fifos: Paths of named pipes to read tweets from
+        :param tcp_addresses: (host, port) tuples to listen for connections sending tweets on
+        """
+        loop = asyncio.get_running_loop()
+        self.batches = asyncio.Queue(QUEUED_BATCHES)
+        consumer = asyncio.ensure_future(self.consume())
+        refresher = asyncio.ensure_future(self.refresh_periodically())
+
+        sources = [self.read_fifo(path) for path in fifos] + [self.listen(host, port) for host, port in tcp_addresses]
+        if stdin:
+            f = sys.stdin.buffer
+            sources.append(self.read_pipe(f, 'stdin') if is_pipe(f) else
+                           self.read_stream(lambda n: loop.run_in_executor(None, f.read, n), 'stdin'))
+        try:
+            await asyncio.gather(*sources)
+            await self.batches.put(None)
+            await consumer
+        finally:
+            refresher.cancel()
+            consumer.cancel()
+
+    async def read_stream(self, read, name):
+        """
+        Reads lines from a stream a chunk at a time, handing the complete lines in each chunk to the
+        analysis as a batch, and waiting for the analysis whenever it's QUEUED_BATCHES behind.
+        :param read: A coroutine function to read up to n bytes with, returning b'' at the end of the stream
+        :param name: The name of the stream, to report
+        """
+        report("%s: reading tweets" % name)
+        partial = b''
+        num_lines = 0
+        while True:
+            chunk = await read(READ_BYTES)
+            if not chunk:
+                break
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            lines = [l for l in lines if l.strip()]
+            if lines:
+                num_lines += len(lines)
+                await self.batches.put(lines)
+        if partial.strip():
+            num_lines += 1
+            await self.batches.put([partial])
+        report("%s: finished after %d lines" % (name, num_lines))
+
+    async def read_pipe(self, f, name):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=READ_BYTES)
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), f)
+        try:
+            await self.read_stream(reader.read, name)
+        finally:
+            transport.close()
+
+    async def read_fifo(self, path):
+        # opened for writing too, so that it doesn't end when a writer closes it, but waits for the next
+        f = os.fdopen(os.open(path, os.O_RDWR), 'rb', buffering=0)
+        await self.read_pipe(f, path)
+
+    async def listen(self, host, port):
+        async def handle_connection(reader, writer):
+            peer = '%s:%d' % writer.get_extra_info('peername')[:2]
+            try:
+                await self.read_stream(reader.read, peer)
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle_connection, host, port, limit=READ_BYTES)
+        report("Listening for tweets on %s:%d" % (host, port))
+        async with server:
+            await server.serve_forever()
+
+    async def consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lines = await self.batches.get()
+            if lines is None:
+                return
+            await loop.run_in_executor(self.executor, self.ingest, lines)
+
+    async def refresh_periodically(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.refresh)
+            await loop.run_in_executor(self.executor, self.report)
+
+    def ingest(self, lines):
+        """Decodes a batch of lines of JSON and ingests the tweets, see TwitterAnalysis.ingest_tweet()"""
+        analyser = self.analyser
+        store = self.store
+        instrumentation = analyser.instrumentation
+        loads = self.loads
+        extract = self.extract
+        dedup = self.dedup
+        with instrumentation.stage('decode'):
+            tweets = []
+            for l in lines:
+                try:
+                    if dedup is None:
+                        tweets.append(extract(loads(l)))
+                    else:
+                        t = dedup.decode_if_new(l, lambda l: extract(loads(l)))
+                        if t is not None:
+                            tweets.append(t)
+                except (ValueError, KeyError, TypeError):
+                    self.num_invalid += 1
+        with instrumentation.stage('ingest'):
+            # numbered from the first tweet to arrive on any stream, so -c counts across batches
+            for i, t in enumerate(tweets, self.num_tweets + 1):
+                analyser.ingest_tweet(t, store, i)
+        instrumentation.add_count('tweets', len(tweets))
+        self.num_tweets += len(tweets)
+
+    def report(self):
+        """Reports the top accounts by each metric, if any tweets have arrived since the last report"""
+        if self.num_tweets == self.reported_tweets:
+            return
+        now = time.perf_counter()
+        print("=== %s: %d tweets (%.0f per second since the last report), %d invalid lines, %d duplicates ===" %
+              (timestamp(), self.num_tweets, (self.num_tweets - self.reported_tweets) / (now - self.reported_at),
+               self.num_invalid, self.dedup.num_duplicates if self.dedup is not None else 0))
+        _, metrics, d_rank_scores = self.analyser.report(self.store, self.state)
+        if self.output:
+            rows = write_metric_table(self.output, metrics, d_rank_scores, self.analyser.options.output_format)
+            print("Wrote the metrics of %d users to %s" % (rows, self.output))
+        sys.stdout.flush()
+        self.reported_tweets = self.num_tweets
+        self.reported_at = now
+
+
+def analyse_live(analyser, refresh, stdin=False, fifos=(), tcp_addresses=(), output=None, dedup=None):
+    """
+    Analyses tweets as they arrive, see LiveAnalysis, until the sources end or it's interrupted,
+    and then reports the top accounts one last time.
+    :return The LiveAnalysis
+    """
+    live = LiveAnalysis(analyser, refresh, output, dedup)
+    try:
+        asyncio.run(live.run(stdin, fifos, tcp_addresses))
+    except KeyboardInterrupt:
+        pass
+    live.executor.shutdown(wait=True)  # finishes ingesting any batch already under way
+    live.report()
+    return live
@@ -1,5 +1,13 @@
 from argparse import ArgumentParser
 
+from .batch_metrics import METRICS_ENGINES
+from .d_rank import D_RANK_ENGINES, D_RANK_SOLVERS, EXTRAPOLATIONS, RESIDUAL_NORMS
+from .database import QUERY_KINDS
+from .decoders import DECODERS
+from .dedup import DEDUP_MODES
+from .output import OUTPUT_FORMATS
+from .synthetic import LAYOUTS
+
 
 class Options:
 
@@ -8,22 +16,60 @@ class Options:
 
     def _init_parser(self):
         usage = 'bin/py_twitter_analysis\n' + \
-                '    -i|--input-file <tweets_file.json>  : File of tweets, one per line\n' +\
+                '    -i|--input-file <tweets_file.json>+ : Files (or globs/dirs) of tweets, one per line,\n' + \
+                '                                          optionally gzip/bzip2/xz compressed\n' + \
                 '    [-x|--max-iterations <max loops>]   : D-rank iteration roof value (default: 20)\n' +\
                 '    [-w|--weight <weight factor value>] : D-rank weighting factor (default: 0.2)\n' + \
                 '    [-c|--count <tweet_count_limit>]    : Consider up to this many tweets (default: -1 = all)\n' + \
+                '    [-n|--top <how_few>]                : Report this many top accounts per metric (default: 20)\n' + \
+                '    [--d-rank-engine <engine>]          : python, sparse or parallel D-rank (default: python)\n' + \
+                '    [--d-rank-workers <num_workers>]    : Processes for parallel D-rank (default: 0 = one per CPU)\n' + \
+                '    [--d-rank-solver <solver>]          : jacobi or gauss-seidel D-rank sweeps (default: jacobi)\n' + \
+                '    [--extrapolation <method>]          : none, aitken or quadratic D-rank extrapolation (default: none)\n' + \
+                '    [--tolerance <residual>]            : D-rank has converged within this residual (default: 0.001)\n' + \
+                '    [--residual-norm <linf|l1>]         : Largest (linf) or total (l1) change in scores (default: linf)\n' + \
+                '    [--seeds <seeds_file>]              : Personalised D-rank per seed set in the file (default: none)\n' + \
+                '    [--seed-output <output_file>]       : Write the user by seed set D-rank table (default: none)\n' + \
+                '    [--metrics-engine <python|batch>]   : Kudos metrics implementation (default: python)\n' + \
                 '    [--rt_weight <rt_weight>]           : PA weighting for retweets (default: 1.0)\n' + \
                 '    [--qu_weight <qu_weight>]           : PA weighting for quote (default: 2.0)\n' + \
                 '    [--re_weight <re_weight>]           : PA weighting for replies (default: 3.0)\n' + \
                 '    [--fav_weight <fav_weight>]         : PA weighting for favourites (default: 1.0)\n' + \
+                '    [--sweep <param=values>+]           : Rank stability over grids of -w & PA weights (default: off)\n' + \
+                '    [--sweep-output <output_file>]      : Write the sweep\'s rank-stability table (default: none)\n' + \
+                '    [-r|--readers <num_readers>]        : Input files to read concurrently (default: 4)\n' + \
+                '    [-s|--state <state_file>]           : Resume from, and save, the analysis state (default: none)\n' + \
+                '    [--cache <cache_file>]              : Map (or save) the ingested interactions (default: none)\n' + \
+                '    [--window <duration>]               : Report per sliding time window, e.g. 6h (default: off)\n' + \
+                '    [--step <duration>]                 : How far the window slides each time (default: 15m)\n' + \
+                '    [-d|--database <db_file>]           : Save interactions & metrics to SQLite (default: none)\n' + \
+                '    [-o|--output <output_file>]         : Write every user\'s metrics to a file (default: none)\n' + \
+                '    [--output-format <format>]          : csv, ndjson or parquet (default: by file extension)\n' + \
+                '    [--workers <num_workers>]           : Processes to parse the input with (default: 1)\n' + \
+                '    [--max-memory <size>]               : Analyse out of core within e.g. 2G of memory (default: off)\n' + \
+                '    [--spill-dir <dir>]                 : Where to spill to out of core (default: system temp dir)\n' + \
+                '    [--approximate]                     : Estimate the metrics with fixed-size sketches (default: off)\n' + \
+                '    [--sketch-accounts <num_accounts>]  : Heaviest accounts to track approximately (default: 10000)\n' + \
+                '    [--sketch-tweets <num_tweets>]      : Most retweeted/quoted tweets to track (default: 50000)\n' + \
+                '    [--hll-precision <bits>]            : HyperLogLog registers are 2^bits (default: 10)\n' + \
+                '    [--decoder <decoder>]               : auto, orjson, simdjson or json (default: auto)\n' + \
+                '    [--dedup <none|set|bloom>]          : Drop tweets seen before, by ID (default: set)\n' + \
+                '    [--bloom-file <bloom_file>]         : Where to keep the --dedup bloom filter (default: temp file)\n' + \
+                '    [--bloom-capacity <num_tweets>]     : Tweets the bloom filter is sized for (default: 1e8)\n' + \
+                '    [--bloom-error <rate>]              : Bloom filter false positive rate (default: 0.001)\n' + \
+                '    [--metrics-out <metrics_file.json>] : Save stage timings, counts, etc. as JSON (default: none)\n' + \
+                '    [--trace-memory]                    : Record peak memory use with tracemalloc (default: off)\n' + \
+                '    [--profile <profile_file>]          : Profile the analysis with cProfile (default: off)\n' + \
                 '    [-v|--verbose]                      : Verbose debugging flag (default: off)\n'
 
         self.parser = ArgumentParser(usage=usage)
         self.parser.add_argument('-i',
                                  '--input-file',
-                                 default='data/test.json',
-                                 dest='tweets_file',
-                                 help='A file of tweets, one JSON object per line')
+                                 nargs='+',
+                                 action='extend',
+                                 dest='tweets_files',
+                                 help='Files of tweets, one JSON object per line, optionally compressed '
+                                      '(gzip, bzip2 or xz). Globs and directories are expanded.')
         self.parser.add_argument('-x',
                                  '--max-iterations',
                                  default='20',
@@ -39,6 +85,204 @@ class Options:
                                  default='-1',
                                  dest='tweet_count',
                                  help='Limit the tweets to consider to this many')
+        self.parser.add_argument('-n',
+                                 '--top',
+                                 default='20',
+                                 dest='how_few',
+                                 help='How many of the top accounts to report by each metric')
+        self.parser.add_argument('-r',
+                                 '--readers',
+                                 default='4',
+                                 dest='readers',
+                                 help='How many input files to read and decompress concurrently')
+        self.parser.add_argument('-s',
+                                 '--state',
+                                 default=None,
+                                 dest='state_file',
+                                 help='A file holding the analysis state. If it exists, the analysis resumes from it, '
+                                      'ingesting only the given (new) tweets; either way, the final state is saved to it')
+        self.parser.add_argument('--cache',
+                                 default=None,
+                                 dest='cache_file',
+                                 help='A binary file of the interactions ingested from the input, in columns. If it '
+                                      'was written from the same input files (by path, size and modification time), '
+                                      'they are mapped into memory from it rather than read from the input; '
+                                      'otherwise, they are saved to it once ingested (requires numpy)')
+        self.parser.add_argument('--window',
+                                 default=None,
+                                 dest='window',
+                                 help='Report the top accounts within a window of time (e.g. 90s, 15m, 6h or 1d) '
+                                      'sliding over the tweets, by their creation time, which should be in order')
+        self.parser.add_argument('--step',
+                                 default='15m',
+                                 dest='step',
+                                 help='How far the window slides between reports')
+        self.parser.add_argument('-d',
+                                 '--database',
+                                 default=None,
+                                 dest='database',
+                                 help='A SQLite database file to save the interactions and metrics to, replacing '
+                                      'its previous contents, for looking up with the query subcommand')
+        self.parser.add_argument('-o',
+                                 '--output',
+                                 default=None,
+                                 dest='output',
+                                 help='A file to write the full metric table to, a row per user with their H-Index, '
+                                      'Ir, RMr, SNP, Mixture, PAr and D-rank')
+        self.parser.add_argument('--output-format',
+                                 default=None,
+                                 choices=OUTPUT_FORMATS,
+                                 dest='output_format',
+                                 help='The format of the --output file (default: by its extension, .csv, .ndjson, '
+                                      '.jsonl or .parquet, otherwise CSV); parquet requires pyarrow')
+        self.parser.add_argument('--workers',
+                                 default='1',
+                                 dest='workers',
+                                 help='How many processes to parse the input with, each taking whole files or '
+                                      'byte ranges of uncompressed files')
+        self.parser.add_argument('--max-memory',
+                                 default=None,
+                                 dest='max_memory',
+                                 help='Analyse the corpus out of core, spilling the interactions to disk to stay within '
+                                      'about this much memory (e.g. 512M or 2G), with exactly the same results as in '
+                                      'memory (requires numpy)')
+        self.parser.add_argument('--spill-dir',
+                                 default=None,
+                                 dest='spill_dir',
+                                 help='The directory in which to create a temporary directory to spill to with '
+                                      '--max-memory (default: the system temporary directory)')
+        self.parser.add_argument('--approximate',
+                                 action='store_true',
+                                 default=False,
+                                 dest='approximate',
+                                 help='Estimate the metrics of the accounts given the most kudos in fixed memory, '
+                                      'with Space-Saving and HyperLogLog sketches, reporting their error bounds '
+                                      '(no D-rank)')
+        self.parser.add_argument('--sketch-accounts',
+                                 default='10000',
+                                 dest='sketch_accounts',
+                                 help='How many of the accounts given the most kudos to track with --approximate')
+        self.parser.add_argument('--sketch-tweets',
+                                 default='50000',
+                                 dest='sketch_tweets',
+                                 help='How many of the most retweeted or quoted tweets to track for H-Indexes with '
+                                      '--approximate')
+        self.parser.add_argument('--hll-precision',
+                                 default='10',
+                                 dest='hll_precision',
+                                 help='The precision of the HyperLogLog distinct counts with --approximate: 2^bits '
+                                      'registers per count, with a standard error of 1.04/sqrt(2^bits)')
+        self.parser.add_argument('--decoder',
+                                 default='auto',
+                                 choices=DECODERS,
+                                 dest='decoder',
+                                 help='JSON library to decode tweets with (auto prefers orjson, then simdjson)')
+        self.parser.add_argument('--dedup',
+                                 default='set',
+                                 choices=DEDUP_MODES,
+                                 dest='dedup',
+                                 help='Drop tweets whose IDs have been seen before, in any input file, keeping the '
+                                      'first: set (an exact hash set of IDs in memory), bloom (an approximate Bloom '
+                                      'filter on disk, for billions of tweets, which drops about --bloom-error of '
+                                      'unique tweets too) or none')
+        self.parser.add_argument('--bloom-file',
+                                 default=None,
+                                 dest='bloom_file',
+                                 help='The file to keep the Bloom filter in with --dedup bloom, created afresh '
+                                      '(default: a temporary file in --spill-dir, removed afterwards)')
+        self.parser.add_argument('--bloom-capacity',
+                                 default='1e8',
+                                 dest='bloom_capacity',
+                                 help='How many tweets the Bloom filter is sized for, at about 1.44 * log2(1 / '
+                                      '--bloom-error) bits each; beyond it, more unique tweets are dropped')
+        self.parser.add_argument('--bloom-error',
+                                 default='0.001',
+                                 dest='bloom_error',
+                                 help='The rate at which the Bloom filter takes unique tweets for duplicates, when full')
+        self.parser.add_argument('--d-rank-engine',
+                                 default='python',
+                                 choices=D_RANK_ENGINES,
+                                 dest='d_rank_engine',
+                                 help='D-rank implementation: python (the reference), sparse (sparse matrix '
+                                      'products, requires numpy) or parallel (sparse, with the users divided between '
+                                      'processes sharing memory)')
+        self.parser.add_argument('--d-rank-workers',
+                                 default='0',
+                                 dest='d_rank_workers',
+                                 help='How many processes the parallel D-rank engine divides the users between '
+                                      '(0: one per CPU); small graphs use fewer')
+        self.parser.add_argument('--d-rank-solver',
+                                 default='jacobi',
+                                 choices=D_RANK_SOLVERS,
+                                 dest='d_rank_solver',
+                                 help='How D-rank iterates: jacobi (each iteration\'s scores from the last\'s, the '
+                                      'reference) or gauss-seidel (in-place sweeps, each score from the latest scores '
+                                      'of the others, which usually converge in fewer iterations)')
+        self.parser.add_argument('--extrapolation',
+                                 default='none',
+                                 choices=EXTRAPOLATIONS,
+                                 dest='extrapolation',
+                                 help='Periodically extrapolate the D-rank scores towards their limit from the last '
+                                      'few iterations, with Aitken\'s delta-squared process or quadratic extrapolation '
+                                      '(requires numpy)')
+        self.parser.add_argument('--tolerance',
+                                 default='0.001',
+                                 dest='tolerance',
+                                 help='D-rank stops iterating once the residual, the change in the scores made by an '
+                                      'iteration, is at most this')
+        self.parser.add_argument('--residual-norm',
+                                 default='linf',
+                                 choices=RESIDUAL_NORMS,
+                                 dest='residual_norm',
+                                 help='How the residual of a D-rank iteration is measured: the largest change to any '
+                                      'score (linf) or the total change to every score (l1)')
+        self.parser.add_argument('--seeds',
+                                 default=None,
+                                 dest='seeds',
+                                 help='A file of seed sets, a line per set such as "climate: @alice @bob", for each '
+                                      'of which a personalised D-rank is calculated (requires numpy)')
+        self.parser.add_argument('--seed-output',
+                                 default=None,
+                                 dest='seed_output',
+                                 help='A file to write the personalised D-rank scores to, a row per user and a column '
+                                      'per seed set (CSV, NDJSON or Parquet, by its extension)')
+        self.parser.add_argument('--sweep',
+                                 nargs='+',
+                                 action='extend',
+                                 dest='sweep',
+                                 help='Instead of reporting the top accounts, compare the rankings by PAr and D-rank '
+                                      'over grids of their parameters, e.g. rt-weight=0.5,1,2 weight=0.1:0.5:0.1 '
+                                      '(parameters rt-weight, qu-weight, re-weight, fav-weight and weight; values '
+                                      'as a list and/or start:stop:step ranges) with those of the other options, in a '
+                                      'rank-stability table (requires numpy)')
+        self.parser.add_argument('--sweep-output',
+                                 default=None,
+                                 dest='sweep_output',
+                                 help='A file to write the rank-stability table of a --sweep to, a row per combination '
+                                      'of parameters (CSV, NDJSON or Parquet, by its extension)')
+        self.parser.add_argument('--metrics-engine',
+                                 default='python',
+                                 choices=METRICS_ENGINES,
+                                 dest='metrics_engine',
+                                 help='Kudos metrics implementation: python (each user in turn, the reference) or '
+                                      'batch (all users at once with array operations, requires numpy)')
+        self.parser.add_argument('--metrics-out',
+                                 default=None,
+                                 dest='metrics_out',
+                                 help='A file to save measurements of the run to, as JSON: the wall clock and CPU time '
+                                      'of each stage (reading, decoding, ingesting, each metric, ranking and D-rank), '
+                                      'tweets per second, counts of users and interactions, and the time and largest '
+                                      'change of each D-rank iteration')
+        self.parser.add_argument('--trace-memory',
+                                 action='store_true',
+                                 dest='trace_memory',
+                                 help='Trace memory allocations with tracemalloc, recording the peak in the '
+                                      '--metrics-out file (this slows the analysis down considerably)')
+        self.parser.add_argument('--profile',
+                                 default=None,
+                                 dest='profile_file',
+                                 help='Profile the ingestion and analysis of the tweets with cProfile, saving the '
+                                      'statistics to this file (see python -m pstats)')
         self.parser.add_argument('-v',
                                  '--verbose',
                                  action='store_true',
@@ -61,5 +305,294 @@ class Options:
                                  dest='fav_weight',
                                  help='Post/Activity ratio weighting for favourites')
 
+    def parse(self, args=None):
+        opts = self.parser.parse_args(args)
+        if not opts.tweets_files:
+            opts.tweets_files = ['data/test.json']
+        return opts
+
+
+class ServeOptions(Options):
+    """The options of the serve subcommand: those of an analysis run, plus where to serve it"""
+
+    def _init_parser(self):
+        Options._init_parser(self)
+        self.parser.usage = 'bin/py_twitter_analysis serve\n' + \
+                            '    [-i|--input-file <tweets_file>+]    : Tweets to load before serving (default: none)\n' + \
+                            '    [--host <host>]                     : Interface to listen on (default: 127.0.0.1)\n' + \
+                            '    [-p|--port <port>]                  : Port to listen on (default: 8080)\n' + \
+                            '    [--cache-size <num_results>]        : Query results to cache (default: 128)\n' + \
+                            '    [analysis options]                  : As for an analysis run, e.g. -w, -x, --rt-weight\n'
+        self.parser.add_argument('--host',
+                                 default='127.0.0.1',
+                                 dest='host',
+                                 help='The interface to serve the HTTP/JSON API on (by default, only this machine)')
+        self.parser.add_argument('-p',
+                                 '--port',
+                                 default='8080',
+                                 dest='port',
+                                 help='The port to serve the HTTP/JSON API on')
+        self.parser.add_argument('--cache-size',
+                                 default='128',
+                                 dest='cache_size',
+                                 help='How many query results (e.g. D-rank with given parameters) to keep, evicting '
+                                      'the least recently used; ingesting tweets empties the cache')
+
+    def parse(self, args=None):
+        opts = self.parser.parse_args(args)
+        if not opts.tweets_files:
+            opts.tweets_files = []
+        return opts
+
+
+class LiveOptions(Options):
+    """The options of the live subcommand: those of an analysis run, plus where the tweets come from"""
+
+    def _init_parser(self):
+        Options._init_parser(self)
+        self.parser.usage = 'bin/py_twitter_analysis live\n' + \
+                            '    [--stdin]                           : Read tweets from stdin (the default, without others)\n' + \
+                            '    [--fifo <named_pipe>+]              : Read tweets from named pipes (default: none)\n' + \
+                            '    [--tcp <[host:]port>+]              : Listen for tweets on TCP sockets (default: none)\n' + \
+                            '    [--refresh <duration>]              : How often to report the top accounts (default: 10s)\n' + \
+                            '    [analysis options]                  : As for an analysis run, e.g. -n, -o, --rt-weight\n'
+        self.parser.add_argument('--stdin',
+                                 action='store_true',
+                                 dest='stdin',
+                                 help='Read tweets, one JSON object per line, from stdin')
+        self.parser.add_argument('--fifo',
+                                 nargs='+',
+                                 action='extend',
+                                 dest='fifos',
+                                 help='Named pipes to read tweets from, one JSON object per line; each is kept open '
+                                      'for one writer after another')
+        self.parser.add_argument('--tcp',
+                                 nargs='+',
+                                 action='extend',
+                                 dest='tcp_addresses',
+                                 help='Addresses ([host:]port, by default on 127.0.0.1) to listen on for TCP '
+                                      'connections sending tweets, one JSON object per line')
+        self.parser.add_argument('--refresh',
+                                 default='10s',
+                                 dest='refresh',
+                                 help='How often to report the top accounts (and rewrite the --output file), e.g. '
+                                      '30s or 5m')
+
+    def parse(self, args=None):
+        opts = self.parser.parse_args(args)
+        opts.fifos = opts.fifos or []
+        opts.tcp_addresses = opts.tcp_addresses or []
+        if not opts.fifos and not opts.tcp_addresses:
+            opts.stdin = True
+        return opts
+
+
+class QueryOptions:
+
+    def __init__(self):
+        self._init_parser()
+
+    def _init_parser(self):
+        usage = 'bin/py_twitter_analysis query\n' + \
+                '    -d|--database <db_file>             : Database saved by an analysis run with --database\n' + \
+                '    -u|--user <screen_name>+            : Users to look up\n' + \
+                '    [-k|--kind <kind>+]                 : post, retweet, quote, reply, mention or favourite\n' + \
+                '                                          (default: all but post)\n' + \
+                '    [-b|--by]                           : Look up interactions by the users (default: with them)\n'
+
+        self.parser = ArgumentParser(usage=usage)
+        self.parser.add_argument('-d',
+                                 '--database',
+                                 required=True,
+                                 dest='database',
+                                 help='A SQLite database file saved by an analysis run with --database')
+        self.parser.add_argument('-u',
+                                 '--user',
+                                 nargs='+',
+                                 action='extend',
+                                 required=True,
+                                 dest='screen_names',
+                                 help='Screen names of the users to look up')
+        self.parser.add_argument('-k',
+                                 '--kind',
+                                 nargs='+',
+                                 action='extend',
+                                 choices=QUERY_KINDS,
+                                 dest='kinds',
+                                 help='Kinds of interaction to list')
+        self.parser.add_argument('-b',
+                                 '--by',
+                                 action='store_true',
+                                 dest='by_user',
+                                 help='List the interactions by the users with others, rather than with the users')
+
+    def parse(self, args=None):
+        opts = self.parser.parse_args(args)
+        if not opts.kinds:
+            opts.kinds = [k for k in QUERY_KINDS if k != 'post']
+        return opts
+
+
+class GenerateOptions:
+
+    def __init__(self):
+        self._init_parser()
+
+    def _init_parser(self):
+        usage = 'generate_corpus.py\n' + \
+                '    -o|--output <tweets_file.json>      : File to write, compressed if it ends in .gz, .bz2 or .xz,\n' + \
+                '                                          or - for stdout\n' + \
+                '    [--connect <[host:]port>]           : Send the tweets over TCP instead (e.g. to a live run)\n' + \
+                '    [--rate <tweets_per_second>]        : Write at most this many tweets per second (default: no limit)\n' + \
+                '    [-n|--tweets <num_tweets>]          : How many tweets to generate (default: 1000)\n' + \
+                '    [-u|--users <num_users>]            : How many users (default: tweets / 10, at least 100)\n' + \
+                '    [-l|--layout <standard|twitter4j>]  : JSON layout of the tweets (default: standard)\n' + \
+                '    [--seed <seed>]                     : Random seed (default: 0)\n' + \
+                '    [--retweets <proportion>]           : Proportion of tweets which are retweets (default: 0.3)\n' + \
+                '    [--quotes <proportion>]             : Proportion of tweets which are quotes (default: 0.05)\n' + \
+                '    [--replies <proportion>]            : Proportion of tweets which are replies (default: 0.1)\n' + \
+                '    [--mentions <proportion>]           : Proportion of tweets mentioning others (default: 0.2)\n' + \
+                '    [--favourites <proportion>]         : Proportion of tweets favourited (default: 0.1)\n' + \
+                '    [--skew <exponent>]                 : Power law exponent of user activity (default: 1.1)\n'
+
+        self.parser = ArgumentParser(usage=usage)
+        self.parser.add_argument('-o',
+                                 '--output',
+                                 default=None,
+                                 dest='output_file',
+                                 help='The file to write the tweets to, one JSON object per line (- for stdout, e.g. '
+                                      'to pipe them into a live run)')
+        self.parser.add_argument('--connect',
+                                 default=None,
+                                 dest='connect',
+                                 help='A TCP address ([host:]port, by default on 127.0.0.1) to send the tweets to, one '
+                                      'JSON object per line, e.g. that of a live run, rather than writing a file')
+        self.parser.add_argument('--rate',
+                                 default=None,
+                                 dest='rate',
+                                 help='How many tweets to write per second, at most, e.g. to imitate a collector')
+        self.parser.add_argument('-n',
+                                 '--tweets',
+                                 default='1000',
+                                 dest='num_tweets',
+                                 help='How many tweets to generate, e.g. 1e6')
+        self.parser.add_argument('-u',
+                                 '--users',
+                                 default=None,
+                                 dest='num_users',
+                                 help='How many users could appear in the corpus')
+        self.parser.add_argument('-l',
+                                 '--layout',
+                                 default='standard',
+                                 choices=LAYOUTS,
+                                 dest='layout',
+                                 help='The layout of the tweets: the standard Twitter API one, or Twitter4J\'s')
+        self.parser.add_argument('--seed',
+                                 default='0',
+                                 dest='seed',
+                                 help='The random seed; the same options and seed always give the same corpus')
+        self.parser.add_argument('--retweets',
+                                 default='0.3',
+                                 dest='retweets',
+                                 help='The proportion of tweets which are retweets')
+        self.parser.add_argument('--quotes',
+                                 default='0.05',
+                                 dest='quotes',
+                                 help='The proportion of tweets which are quotes')
+        self.parser.add_argument('--replies',
+                                 default='0.1',
+                                 dest='replies',
+                                 help='The proportion of tweets which are replies')
+        self.parser.add_argument('--mentions',
+                                 default='0.2',
+                                 dest='mentions',
+                                 help='The proportion of tweets which mention other users')
+        self.parser.add_argument('--favourites',
+                                 default='0.1',
+                                 dest='favourites',
+                                 help='The proportion of original tweets which have been favourited')
+        self.parser.add_argument('--skew',
+                                 default='1.1',
+                                 dest='skew',
+                                 help='The power law exponent of user activity (higher: fewer, busier users)')
+
+    def parse(self, args=None):
+        opts = self.parser.parse_args(args)
+        if not opts.output_file and not opts.connect:
+            self.parser.error('one of -o/--output or --connect is required')
+        return opts
+
+
+class BenchmarkOptions:
+
+    def __init__(self):
+        self._init_parser()
+
+    def _init_parser(self):
+        usage = 'benchmark.py\n' + \
+                '    [-n|--tweets <num_tweets>+]         : Corpus sizes (default: 1e3 1e4 1e5)\n' + \
+                '    [-l|--layout <layout>+]             : standard and/or twitter4j (default: both)\n' + \
+                '    [--corpus-dir <dir>]                : Where to keep the generated corpora (default: data/synthetic)\n' + \
+                '    [-o|--results <results_file>]       : File to append results to (default: benchmark_results.jsonl)\n' + \
+                '    [--label <label>]                   : Label for the results, e.g. a version (default: the time)\n' + \
+                '    [--seed <seed>]                     : Random seed of the corpora (default: 0)\n' + \
+                '    [-x|--max-iterations <max loops>]   : D-rank iteration roof value (default: 20)\n' + \
+                '    [--metrics-engine <python|batch>]   : Kudos metrics implementation (default: python)\n' + \
+                '    [--d-rank-engine <engine>]          : python, sparse or parallel D-rank (default: python)\n' + \
+                '    [--decoder <decoder>]               : auto, orjson, simdjson or json (default: auto)\n'
+
+        self.parser = ArgumentParser(usage=usage)
+        self.parser.add_argument('-n',
+                                 '--tweets',
+                                 nargs='+',
+                                 default=['1e3', '1e4', '1e5'],
+                                 dest='sizes',
+                                 help='How many tweets each corpus should have')
+        self.parser.add_argument('-l',
+                                 '--layout',
+                                 nargs='+',
+                                 default=LAYOUTS,
+                                 choices=LAYOUTS,
+                                 dest='layouts',
+                                 help='The layouts of corpora to benchmark')
+        self.parser.add_argument('--corpus-dir',
+                                 default='data/synthetic',
+                                 dest='corpus_dir',
+                                 help='Where to keep the generated corpora, which are reused by later runs')
+        self.parser.add_argument('-o',
+                                 '--results',
+                                 default='benchmark_results.jsonl',
+                                 dest='results_file',
+                                 help='A file to append the results to, one JSON object per line, against which '
+                                      'later runs are compared')
+        self.parser.add_argument('--label',
+                                 default=None,
+                                 dest='label',
+                                 help='A label to record with the results, e.g. the version benchmarked')
+        self.parser.add_argument('--seed',
+                                 default='0',
+                                 dest='seed',
+                                 help='The random seed the corpora are generated with')
+        self.parser.add_argument('-x',
+                                 '--max-iterations',
+                                 default='20',
+                                 dest='max_iterations',
+                                 help='Maximum number of iterations for Duan-rank calculation')
+        self.parser.add_argument('--metrics-engine',
+                                 default='python',
+                                 choices=METRICS_ENGINES,
+                                 dest='metrics_engine',
+                                 help='Kudos metrics implementation to benchmark')
+        self.parser.add_argument('--d-rank-engine',
+                                 default='python',
+                                 choices=D_RANK_ENGINES,
+                                 dest='d_rank_engine',
+                                 help='D-rank implementation to benchmark')
+        self.parser.add_argument('--decoder',
+                                 default='auto',
+                                 choices=DECODERS,
+                                 dest='decoder',
+                                 help='JSON library to decode tweets with')
+
     def parse(self, args=None):
         return self.parser.parse_args(args)
@@ -0,0 +1,116 @@
+import csv
+import json
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+OUTPUT_FORMATS = ['csv', 'ndjson', 'parquet']
+
+OUTPUT_COLUMNS = ['screen_name', 'h_index', 'int_ratio', 'rm_ratio', 'snp', 'mixture', 'pa_ratio', 'd_rank']
+OUTPUT_TYPES = ['string', 'int64'] + ['float64'] * 6  # the pyarrow type of each column
+
+ROWS_PER_CHUNK = 65536  # rows formatted and written at a time
+
+FORMAT_EXTENSIONS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.parquet': 'parquet'
+}
+
+
+def output_format(path, format=None):
+    """
+    :param path: The file to write
+    :param format: One of OUTPUT_FORMATS, or None to go by the file's extension (defaulting to CSV)
+    :return The format to write the file in
+    """
+    if format is None:
+        format = FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'csv')
+    if format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format '%s', expected one of %s" % (format, ', '.join(OUTPUT_FORMATS)))
+    if format == 'parquet' and pyarrow is None:
+        raise ImportError("Writing Parquet requires pyarrow (pip install pyarrow)")
+    return format
+
+
+def metric_chunks(metrics, d_rank_scores, rows_per_chunk=ROWS_PER_CHUNK):
+    """
+    Slices the metric table into chunks of columns, so that only a chunk's worth of rows is
+    copied at a time, however many users there are.
+    :param metrics: The MetricTable
+    :param d_rank_scores: Map of screen name to D-rank score (users without one get None)
+    :param rows_per_chunk: How many rows to put in each chunk
+    :return A generator of lists of columns, in the order of OUTPUT_COLUMNS
+    """
+    columns = [metrics.screen_names, metrics.h_index, metrics.int_ratio, metrics.rm_ratio, metrics.snp,
+               metrics.mixture, metrics.pa_ratio]
+    for start in range(0, len(metrics), rows_per_chunk):
+        chunk = [column[start:start + rows_per_chunk] for column in columns]
+        chunk[1] = [int(h) for h in chunk[1]]  # H-Indexes may be numpy integers, which json can't write
+        chunk.append([d_rank_scores.get(sn) for sn in chunk[0]])
+        yield chunk
+
+
+def write_csv(path, chunks, columns, types):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in chunks:
+            writer.writerows(zip(*chunk))
+
+
+def write_ndjson(path, chunks, columns, types):
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            f.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in zip(*chunk))
+
+
+def write_parquet(path, chunks, columns, types):
+    schema = pyarrow.schema([(c, getattr(pyarrow, t)()) for c, t in zip(columns, types)])
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(chunk, schema)], schema=schema))
+
+
+WRITERS = {
+    'csv': write_csv,
+    'ndjson': write_ndjson,
+    'parquet': write_parquet
+}
+
+
+def write_chunks(path, chunks, format=None, columns=OUTPUT_COLUMNS, types=OUTPUT_TYPES):
+    """
+    Writes rows of metrics to a file, a chunk at a time. The file is written alongside and moved
+    into place once complete, so that readers of it never see it half written.
+    :param path: The file to write
+    :param chunks: An iterable of lists of columns, in the order of columns
+    :param format: One of OUTPUT_FORMATS (default: by the file's extension, see output_format())
+    :param columns: The names of the columns (default: those of the metric table)
+    :param types: The pyarrow type of each column, e.g. 'string', 'int64' or 'float64'
+    """
+    write = WRITERS[output_format(path, format)]
+    tmp_path = path + '.tmp'
+    write(tmp_path, chunks, columns, types)
+    os.replace(tmp_path, path)
+
+
+def write_metric_table(path, metrics, d_rank_scores, format=None):
+    """
+    Writes every user's metrics and D-rank score to a file, a row per user (in the order of the
+    table), streaming the rows out a chunk at a time.
+    :param path: The file to write
+    :param metrics: The MetricTable
+    :param d_rank_scores: Map of screen name to D-rank score
+    :param format: One of OUTPUT_FORMATS (default: by the file's extension, see output_format())
+    :return The number of rows written
+    """
+    write_chunks(path, metric_chunks(metrics, d_rank_scores), format)
+    return len(metrics)
@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+
+from array import array
+
+from .decoders import get_decoder
+from .dedup import line_tweet_key
+from .interactions import InteractionStore
+from .tweet_parsers import RecordExtractor
+from .tweet_reader import decode_tweets, detect_compression, expand_input_paths, read_line_range, read_lines
+from .twitter_analysis import TwitterAnalysis
+
+
+def plan_chunks(tweets_files, workers):
+    """
+    Divides the input into chunks for the workers to ingest. Each file is a chunk of its own,
+    except that, when there are fewer files than workers, uncompressed files are split further
+    into byte ranges (on line boundaries) so that every worker has something to do. Compressed
+    files can't be split, as they can't be read from an arbitrary offset.
+    :param tweets_files: A path or list of paths, globs or directories, see expand_input_paths()
+    :param workers: The number of worker processes
+    :return A list of (path, start, end) tuples, in corpus order; start and end are None for whole files
+    """
+    files = expand_input_paths(tweets_files)
+    pieces_per_file = max(1, -(-workers // len(files))) if files else 1
+
+    chunks = []
+    for path in files:
+        size = os.path.getsize(path)
+        if pieces_per_file == 1 or detect_compression(path) is not None or size == 0:
+            chunks.append((path, None, None))
+            continue
+        step = -(-size // pieces_per_file)
+        chunks.extend((path, start, min(start + step, size)) for start in range(0, size, step))
+    return chunks
+
+
+def chunk_lines(path, start, end, progress_steps=10):
+    """:return A generator of the lines of a chunk of the input, see plan_chunks()"""
+    if start is None:
+        return read_lines(path, progress_steps)
+    return read_line_range(path, start, end, progress_steps)
+
+
+def chunk_tweet_keys(args):
+    """
+    Finds the key (see tweet_key()) of each tweet in one chunk of the input in a worker process, so
+    that the tweets seen before, in this chunk or an earlier one, can be found before any is ingested.
+    :param args: A tuple of (options, (path, start, end)), see plan_chunks()
+    :return An array of the key of the tweet on each line of the chunk, in order
+    """
+    options, (path, start, end) = args
+    _, loads = get_decoder(options.decoder)
+    extract = RecordExtractor()
+    return array('q', (line_tweet_key(l, lambda l: extract(loads(l))) for l in chunk_lines(path, start, end, 0)))
+
+
+def ingest_chunk(args):
+    """
+    Ingests one chunk of the input in a worker process, leaving out the given lines (e.g. duplicates).
+    :param args: A tuple of (options, (path, start, end), skipped), see plan_chunks(), where skipped is an
+    array of the (0-based) numbers of the lines of the chunk to leave out
+    :return A tuple of (the InteractionStore of the chunk's interactions, the number of tweets ingested)
+    """
+    options, (path, start, end), skipped = args
+    lines = chunk_lines(path, start, end)
+    if skipped:
+        skipped = set(skipped)
+        lines = (l for i, l in enumerate(lines) if i not in skipped)
+    analyser = TwitterAnalysis(options)
+    store = analyser.ingest(decode_tweets(lines, options.decoder), InteractionStore())
+    return store, analyser.instrumentation.counters['tweets']
+
+
+def ingest_in_parallel(options, workers, instrumentation=None, dedup=None):
+    """
+    Builds the InteractionStore for the input files named in the options using several worker
+    processes, each of which builds a partial store from its own chunks of the input. The
+    partial stores are merged in corpus order, so the result is the same as ingesting the
+    whole input in one process.
+    Duplicates are found before anything is ingested: the workers first find the ID of every tweet in
+    their chunks, which are checked against the de-duplication index in corpus order, and then ingest
+    their chunks leaving out the duplicates, so that a duplicate contributes nothing (no interactions,
+    profile counts, favourite counts or users), exactly as when ingesting in one process.
+    :param options: The parsed command line options
+    :param workers: The number of worker processes
+    :param instrumentation: An Instrumentation to count the tweets ingested in (default: none)
+    :param dedup: A Deduplicator to drop the tweets seen before with, in any chunk (default: keep them)
+    :return The merged InteractionStore
+    """
+    chunks = plan_chunks(options.tweets_files, workers)
+    print("Ingesting %d chunk(s) of input with %d workers" % (len(chunks), workers))
+
+    store = None
+    with multiprocessing.Pool(workers) as pool:
+        skipped = [None] * len(chunks)
+        if dedup is not None:
+            is_new_key = dedup.is_new_key
+            for c, keys in enumerate(pool.imap(chunk_tweet_keys, [(options, chunk) for chunk in chunks])):
+                skipped[c] = array('q', (i for i, k in enumerate(keys) if not is_new_key(k)))
+            print("Dropped %d duplicate tweets" % dedup.num_duplicates)
+
+        tasks = [(options, chunk, skip) for chunk, skip in zip(chunks, skipped)]
+        for partial, num_tweets in pool.imap(ingest_chunk, tasks):
+            store = partial if store is None else store.merge(partial)
+            if instrumentation is not None:
+                instrumentation.add_count('tweets', num_tweets)
+    return store if store is not None else InteractionStore()
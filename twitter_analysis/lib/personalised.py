@@ -0,0 +1,127 @@
+import re
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .d_rank import DRankMatrix, INTERESTING_DELTA
+from .output import ROWS_PER_CHUNK, write_chunks
+from .ranking import top
+
+
+def load_seed_sets(path):
+    """
+    Reads seed sets from a file with a line per set, naming it (uniquely) and then listing its
+    accounts, e.g. 'climate: @alice @bob carol'. Blank lines and lines starting with '#' are skipped.
+    :param path: The file to read
+    :return A list of (name, list of screen names) tuples, in the order of the file
+    """
+    seed_sets = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            match = re.match(r'^([^:]+):(.*)$', line)
+            if match is None:
+                raise ValueError("%s:%d: expected 'name: @account @account ...'" % (path, line_number))
+            name = match.group(1).strip()
+            if any(name == other for other, _ in seed_sets):
+                raise ValueError("%s:%d: there's already a seed set named '%s'" % (path, line_number, name))
+            seed_sets.append((name, [sn.lstrip('@') for sn in match.group(2).split()]))
+    return seed_sets
+
+
+def personalised_d_rank(store, seed_sets, max_iterations, weight_factor=0.2, debug=False, instrumentation=None,
+                        tolerance=INTERESTING_DELTA, norm='linf'):
+    """
+    Calculates a personalised D-rank for each seed set, in which the (1 - weight_factor) each user
+    is given per iteration by plain D-rank is instead shared between the seeds of the set, so scores
+    reflect influence relative to the seeds (a seed set of every user gives plain D-rank). All the
+    seed sets are iterated together, as a matrix with a column per set, so the links are read once
+    per iteration whatever the number of sets. Each set stops iterating once its own scores have
+    converged (its residual is within the tolerance), as it would alone.
+    :param store: The InteractionStore holding the links
+    :param seed_sets: A list of (name, list of screen names) tuples, see load_seed_sets()
+    :param max_iterations: The most iterations to run before giving up on convergence
+    :param weight_factor: The D-rank weighting factor
+    :param debug: Whether to report each iteration
+    :param instrumentation: An Instrumentation to record the number of seed sets and iterations in
+    :param tolerance: The residual at or below which a set's scores have converged
+    :param norm: The norm of the residual, one of RESIDUAL_NORMS, see Convergence
+    :return A tuple of (screen names, scores), where scores is an array with a row per user (in the
+    order of the screen names) and a column per seed set (in the order given)
+    """
+    matrix = DRankMatrix(store)
+    screen_names = matrix.screen_names(store)
+    user_numbers = dict((sn, i) for i, sn in enumerate(screen_names))
+
+    # Step 1. Share the teleport weight (and the starting weight) of every user between each set's seeds
+    teleport = np.zeros((matrix.n, len(seed_sets)))
+    for s, (name, seeds) in enumerate(seed_sets):
+        seed_users = sorted(set(user_numbers[sn] for sn in seeds if sn in user_numbers))
+        if not seed_users:
+            print("[WARN] None of the seeds of '%s' have any D-rank links; its scores are all zero" % name)
+            continue
+        teleport[seed_users, s] = matrix.n / float(len(seed_users))
+    influence_scores = weight_factor * teleport
+    teleport *= 1 - weight_factor
+
+    # Step 2.
+    active = np.arange(len(seed_sets))  # the seed sets whose scores have yet to converge
+    iterations = 0
+    while iterations < max_iterations and len(active) and matrix.n:
+        iterations += 1
+        started = time.perf_counter()
+        scores = influence_scores[:, active]
+        new_scores = teleport[:, active] + weight_factor * matrix.dot(scores)
+        influence_scores[:, active] = new_scores
+
+        # Step 3. check which have changed
+        changes = np.abs(new_scores - scores)
+        residuals = changes.max(axis=0) if norm == 'linf' else changes.sum(axis=0)
+        if debug:
+            print("=== Iteration %d (%d users, %d seed sets): largest change %.6f, largest %s residual %.6g, "
+                  "%.3fs ===" % (iterations, matrix.n, len(active), changes.max(), norm, residuals.max(),
+                                 time.perf_counter() - started))
+        active = active[residuals > tolerance]
+
+    if debug and len(active):
+        print("[INFO] Personalised D-rank hit iteration max of %d with %d seed sets still changing" %
+              (max_iterations, len(active)))
+    elif debug:
+        print("[INFO] Personalised D-rank converged after %d iterations" % iterations)
+    if instrumentation is not None:
+        instrumentation.count('seed_sets', len(seed_sets))
+        instrumentation.count('personalised_d_rank_iterations', iterations)
+    return screen_names, influence_scores
+
+
+def print_personalised_top_few(seed_sets, screen_names, scores, how_few):
+    """Prints the top accounts by the personalised D-rank of each seed set"""
+    for s, (name, seeds) in enumerate(seed_sets):
+        print("Personalised D-Rank (%s, %d seeds)" % (name, len(seeds)))
+        for r in top(screen_names, scores[:, s].tolist(), how_few):
+            print("  @%s : %.2f" % r)
+
+
+def write_seed_scores(path, seed_sets, screen_names, scores, format=None):
+    """
+    Writes the personalised D-rank scores to a file, a row per user and a column per seed set.
+    :param path: The file to write
+    :param seed_sets: The seed sets, see load_seed_sets()
+    :param screen_names: The screen name of each row of scores
+    :param scores: The scores, see personalised_d_rank()
+    :param format: One of OUTPUT_FORMATS (default: by the file's extension)
+    :return The number of rows written
+    """
+    def chunks():
+        for start in range(0, len(screen_names), ROWS_PER_CHUNK):
+            end = start + ROWS_PER_CHUNK
+            yield [screen_names[start:end]] + scores[start:end].T.tolist()
+
+    columns = ['screen_name'] + [name for name, _ in seed_sets]
+    write_chunks(path, chunks(), format, columns, ['string'] + ['float64'] * len(seed_sets))
+    return len(screen_names)
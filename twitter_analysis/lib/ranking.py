@@ -0,0 +1,112 @@
+import heapq
+
+
+RANKED_METRICS = ['h_index', 'int_ratio', 'rm_ratio', 'snp', 'mixture', 'pa_ratio']
+
+
+def min_max(l):
+    """Convenience method to return the min and max of a list in one call (or zeros, if it's empty)"""
+    if not len(l):
+        return 0, 0
+    return min(l), max(l)
+
+
+def normalise(v, min_v, max_v):
+    """Normalises v between min_v and max_v to belong in (0,1)"""
+    # norm = v / float(max_v)  # assumes min_v = 0
+    if max_v == min_v:
+        return 0.0  # every value is the same, e.g. a small increment of tweets
+    norm = (v - min_v) / float(max_v - min_v)
+    if norm > 1.0:
+        print("[WARN] normalise(%f, %f, %f)" % (v, min_v, max_v))
+    return norm
+
+
+def top(names, values, how_few):
+    """
+    Picks the entries with the highest values, without sorting them all. Ties are broken by
+    position, exactly as sorted(..., reverse=True)[:how_few] would.
+    :param names: The name of each entry
+    :param values: The value of each entry
+    :param how_few: How many entries to pick
+    :return A list of (name, value) tuples, highest value first
+    """
+    best = heapq.nlargest(how_few, range(len(values)), key=values.__getitem__)
+    return [(names[i], values[i]) for i in best]
+
+
+class TopN:
+    """
+    Picks the entries with the highest values from a stream of them, exactly as top() does from
+    lists (ties going to the earlier entry), holding only how_few entries at a time.
+    """
+    def __init__(self, how_few):
+        self.how_few = how_few
+        self.heap = []  # (value, -position, name), lowest first
+
+    def add(self, position, name, value):
+        """
+        :param position: The position of the entry in the stream, counting from 0
+        :param name: The name of the entry
+        :param value: The value of the entry
+        """
+        entry = (value, -position, name)
+        if len(self.heap) < self.how_few:
+            heapq.heappush(self.heap, entry)
+        elif self.how_few:
+            heapq.heappushpop(self.heap, entry)
+
+    def top(self):
+        """:return A list of (name, value) tuples, highest value first"""
+        return [(name, value) for value, _, name in sorted(self.heap, reverse=True)]
+
+
+class MetricTable:
+    """
+    A row of metrics per user, each calculated once: the H-Index, Interactor Ratio, Retweet/Mention
+    Ratio and Post/Activity Ratio, plus the Social Networking Potential and Mixture Model Ratio
+    which combine them once they've been normalised over the observed ranges. Each metric is held
+    as a column (a list with an entry per user, in the order of `screen_names`).
+    """
+    def __init__(self, screen_names, h_index, int_ratio, rm_ratio, pa_ratio):
+        self.screen_names = screen_names
+        self.h_index = h_index
+        self.int_ratio = int_ratio
+        self.rm_ratio = rm_ratio
+        self.pa_ratio = pa_ratio
+
+        (min_h_index, max_h_index) = min_max(h_index)
+        (min_ir, max_ir) = min_max(int_ratio)
+        (min_rmr, max_rmr) = min_max(rm_ratio)
+
+        norm_h_index = [normalise(v, min_h_index, max_h_index) for v in h_index]
+        norm_ir = [normalise(v, min_ir, max_ir) for v in int_ratio]
+        norm_rmr = [normalise(v, min_rmr, max_rmr) for v in rm_ratio]
+        self.snp = [0.25 * ir + 0.75 * rmr for ir, rmr in zip(norm_ir, norm_rmr)]
+        self.mixture = [(h + ir + rmr) / 3.0 for h, ir, rmr in zip(norm_h_index, norm_ir, norm_rmr)]
+
+    @classmethod
+    def from_kudos(cls, kudos, pa_weights):
+        """
+        :param kudos: Map of screen name to Kudos
+        :param pa_weights: The weights to calculate pa_ratio with
+        :return The MetricTable of the users' Kudos
+        """
+        screen_names = list(kudos)
+        values = list(kudos.values())
+        return cls(screen_names,
+                   [k.h_index() for k in values],
+                   [k.int_ratio() for k in values],
+                   [k.rm_ratio() for k in values],
+                   [k.pa_ratio(*pa_weights) for k in values])
+
+    def __len__(self):
+        return len(self.screen_names)
+
+    def top(self, metric, how_few):
+        """
+        :param metric: The name of a metric column, e.g. 'h_index' or 'snp'
+        :param how_few: How many users to pick
+        :return A list of (screen name, value) for the users with the highest values of the metric
+        """
+        return top(self.screen_names, getattr(self, metric), how_few)
@@ -0,0 +1,289 @@
+import json
+import threading
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from .d_rank import DRankMatrix, matrix_d_rank, require_numpy
+from .decoders import get_decoder
+from .interactions import InteractionStore
+from .ranking import RANKED_METRICS, top
+from .state import AnalysisState
+from .tweet_parsers import RecordExtractor
+from .tweet_reader import report
+
+
+SERVED_METRICS = RANKED_METRICS + ['d_rank']
+
+DEFAULT_CACHE_SIZE = 128  # results of queries kept per snapshot
+
+
+class LRUCache:
+    """
+    A map of at most max_size entries, evicting the least recently used once full, which any number
+    of threads can share. Values are computed outside the lock, so a slow computation doesn't hold up
+    lookups of other entries (two threads may occasionally compute the same value).
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """
+        :param key: The key of the entry
+        :param compute: A function to compute the value with, if the entry isn't cached
+        :return The value of the entry
+        """
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Snapshot:
+    """
+    The analysis of the corpus as it stood after an ingestion: the metric table, the D-rank scores
+    with the server's parameters, and the D-rank matrix, from which D-rank is calculated with other
+    parameters. Queries are answered from a snapshot alone, never from the InteractionStore, so they
+    carry on while more tweets are ingested and the next snapshot is built. Each snapshot caches
+    the results of its own queries, so replacing it invalidates them.
+    """
+    def __init__(self, generation, metrics, d_rank_scores, matrix, d_rank_names, counts, options, cache_size):
+        self.generation = generation
+        self.metrics = metrics
+        self.rows = dict((sn, i) for i, sn in enumerate(metrics.screen_names))
+        self.d_rank_scores = d_rank_scores
+        self.matrix = matrix
+        self.d_rank_names = d_rank_names
+        self.counts = counts
+        self.options = options
+        self.cache = LRUCache(cache_size)
+        # the matrix caches the triangles of its last Gauss-Seidel sweep, so only one thread calculates D-rank at once
+        self.matrix_lock = threading.Lock()
+
+    def user(self, screen_name):
+        """:return A map of each metric to the user's value, or None if the user hasn't been given kudos"""
+        row = self.rows.get(screen_name)
+        if row is None:
+            return None
+        metrics = self.metrics
+        result = {'screen_name': screen_name}
+        for metric in RANKED_METRICS:
+            result[metric] = getattr(metrics, metric)[row]
+        result['h_index'] = int(result['h_index'])
+        result['d_rank'] = self.d_rank_scores.get(screen_name)
+        return result
+
+    def top(self, metric, how_few):
+        """:return A list of (screen name, value) of the users with the highest values of the metric"""
+        def compute():
+            if metric == 'd_rank':
+                return top(list(self.d_rank_scores), list(self.d_rank_scores.values()), how_few)
+            return [(sn, int(v) if metric == 'h_index' else v) for sn, v in self.metrics.top(metric, how_few)]
+        return self.cache.get(('top', metric, how_few), compute)
+
+    def d_rank(self, weight_factor, max_iterations):
+        """
+        Calculates D-rank with the given parameters (and the server's solver, extrapolation and
+        tolerance) from the snapshot's D-rank matrix.
+        :return A tuple of (map of screen name to score, the Convergence of the iterations)
+        """
+        def compute():
+            options = self.options
+            with self.matrix_lock:
+                scores, convergence = matrix_d_rank(self.matrix, self.matrix.initial_scores(None, weight_factor),
+                                                    max_iterations, weight_factor, options.debug, None,
+                                                    options.d_rank_solver, options.extrapolation,
+                                                    float(options.tolerance), options.residual_norm)
+            return dict(zip(self.d_rank_names, scores.tolist())), convergence
+        return self.cache.get(('d_rank', weight_factor, max_iterations), compute)
+
+
+class AnalysisServer:
+    """
+    Keeps the analysis of a corpus in memory, so it can be queried again and again, and added to,
+    without starting over. Ingestion is serialised, and each ingestion publishes a new Snapshot,
+    which the Kudos metrics of only the users affected are recalculated for, and whose D-rank is
+    warm-started from the last one's (see AnalysisState). Queries read the latest Snapshot. Tweets
+    already ingested (or loaded) are dropped, if given a Deduplicator.
+    """
+    def __init__(self, analyser, store=None, cache_size=DEFAULT_CACHE_SIZE, dedup=None):
+        require_numpy("The analysis server")
+        self.analyser = analyser
+        self.dedup = dedup
+        self.store = store if store is not None else InteractionStore()
+        self.state = AnalysisState(self.store)
+        self.cache_size = cache_size
+        self.ingest_lock = threading.Lock()
+        self.generation = 0
+        self.snapshot = self.build_snapshot()
+
+    def build_snapshot(self):
+        analyser = self.analyser
+        store = self.store
+        kudos, metrics = analyser.calculate_metrics(store, self.state)
+        d_rank_scores = analyser.calculate_d_rank(store, self.state.d_rank_scores)
+        self.state.update(kudos.values(), analyser.pa_weights, d_rank_scores)
+        matrix = DRankMatrix(store)
+        counts = {
+            'tweets': analyser.instrumentation.counters.get('tweets', 0),
+            'users': len(store.users),
+            'kudos_users': len(kudos),
+            'interactions': len(store),
+            'd_rank_users': matrix.n,
+            'duplicates': self.dedup.num_duplicates if self.dedup is not None else 0
+        }
+        return Snapshot(self.generation, metrics, d_rank_scores, matrix, matrix.screen_names(store), counts,
+                        analyser.options, self.cache_size)
+
+    def ingest(self, tweets):
+        """
+        Adds tweets to the analysis, publishing a new Snapshot once they've been analysed.
+        :param tweets: A list of TweetRecords or tweet dictionaries
+        :return A tuple of (the new Snapshot, the number of tweets ingested, the number dropped as duplicates)
+        """
+        with self.ingest_lock:
+            num_posted = len(tweets)
+            if self.dedup is not None:
+                tweets = list(self.dedup.unique_records(tweets))
+            self.analyser.ingest(tweets, self.store)
+            self.generation += 1
+            self.snapshot = self.build_snapshot()
+            return self.snapshot, len(tweets), num_posted - len(tweets)
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP/JSON API of an AnalysisServer:
+      GET  /status                               the size of the analysis and the cache statistics
+      GET  /users/<screen_name>                  the user's metrics and D-rank score
+      GET  /top?metric=<metric>&n=<how_few>      the top users by a metric (default: d_rank), see SERVED_METRICS
+      GET  /d_rank?weight=<w>&max_iterations=<x>&n=<how_few>&user=<screen_name>
+                                                 D-rank with the given parameters (default: the server's),
+                                                 with the top users and the scores of any users named
+      POST /tweets                               ingests the tweets in the body, one JSON object per line
+    """
+    server_version = 'TwitterAnalysis'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        snapshot = self.server.analysis.snapshot
+        try:
+            if url.path == '/status':
+                result = dict(snapshot.counts)
+                result.update({
+                    'generation': snapshot.generation,
+                    'cache': {'entries': len(snapshot.cache), 'hits': snapshot.cache.hits,
+                              'misses': snapshot.cache.misses}
+                })
+            elif url.path.startswith('/users/'):
+                result = snapshot.user(unquote(url.path[len('/users/'):]).lstrip('@'))
+                if result is None:
+                    return self.send_json(404, {'error': "No kudos for that user"})
+            elif url.path == '/top':
+                metric = self.param(params, 'metric', 'd_rank', str)
+                if metric not in SERVED_METRICS:
+                    raise ValueError("Unknown metric '%s', expected one of %s" % (metric, ', '.join(SERVED_METRICS)))
+                how_few = self.param(params, 'n', self.server.analysis.analyser.how_few, int)
+                result = {'metric': metric, 'top': [{'screen_name': sn, 'value': v}
+                                                    for sn, v in snapshot.top(metric, how_few)]}
+            elif url.path == '/d_rank':
+                result = self.d_rank(snapshot, params)
+            else:
+                return self.send_json(404, {'error': "No such resource: %s" % url.path})
+        except ValueError as e:
+            return self.send_json(400, {'error': str(e)})
+        result['generation'] = snapshot.generation
+        self.send_json(200, result)
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/tweets':
+            return self.send_json(404, {'error': "No such resource: %s" % self.path})
+        analysis = self.server.analysis
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        try:
+            # decoded before ingesting, so only the analysis itself holds up other ingestions
+            _, loads = get_decoder(analysis.analyser.options.decoder)
+            extract = RecordExtractor()
+            tweets = [extract(loads(l)) for l in body.splitlines() if l.strip()]
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json(400, {'error': "Invalid tweet: %s" % e})
+        snapshot, num_ingested, num_duplicates = analysis.ingest(tweets)
+        report("Ingested %d tweets, dropped %d duplicates (generation %d)" %
+               (num_ingested, num_duplicates, snapshot.generation))
+        self.send_json(200, {'ingested': num_ingested, 'duplicates': num_duplicates,
+                             'generation': snapshot.generation, 'tweets': snapshot.counts['tweets']})
+
+    def d_rank(self, snapshot, params):
+        options = self.server.analysis.analyser.options
+        weight_factor = self.param(params, 'weight', float(options.d_rank_weight_factor), float)
+        max_iterations = self.param(params, 'max_iterations', int(options.max_iterations), int)
+        how_few = self.param(params, 'n', self.server.analysis.analyser.how_few, int)
+        if not 0 <= weight_factor <= 1 or max_iterations < 0:
+            raise ValueError("Expected 0 <= weight <= 1 and max_iterations >= 0")
+        scores, convergence = snapshot.d_rank(weight_factor, max_iterations)
+        return {
+            'weight_factor': weight_factor,
+            'max_iterations': max_iterations,
+            'iterations': convergence.iterations,
+            'converged': convergence.converged,
+            'residual': convergence.residual,
+            'top': [{'screen_name': sn, 'value': v} for sn, v in top(list(scores), list(scores.values()), how_few)],
+            'users': dict((sn.lstrip('@'), scores.get(sn.lstrip('@'))) for sn in params.get('user', []))
+        }
+
+    @staticmethod
+    def param(params, name, default, convert):
+        if name not in params:
+            return default
+        try:
+            return convert(params[name][-1])
+        except ValueError:
+            raise ValueError("Invalid value for %s: %s" % (name, params[name][-1]))
+
+    def send_json(self, status, result):
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.analysis.analyser.options.debug:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def serve(analysis, host, port):
+    """
+    Serves the AnalysisServer's HTTP/JSON API (see AnalysisRequestHandler), a thread per request,
+    until interrupted.
+    """
+    httpd = ThreadingHTTPServer((host, port), AnalysisRequestHandler)
+    httpd.daemon_threads = True
+    httpd.analysis = analysis
+    report("Serving the analysis on http://%s:%d/ (Ctrl-C to stop)" % httpd.server_address[:2])
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
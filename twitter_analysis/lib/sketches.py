@@ -0,0 +1,129 @@
+import hashlib
+import heapq
+import math
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1 << 16)  # the same users and tweets come up again and again
+def hash64(key):
+    """:return A 64 bit hash of key (e.g. a screen name or tweet ID), the same from run to run"""
+    return int.from_bytes(hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    Estimates the number of distinct keys added to it in a fixed 2^precision bytes, however many
+    there are, with a relative standard error of about 1.04 / sqrt(2^precision) (see
+    Flajolet et al., "HyperLogLog: the analysis of a near-optimal cardinality estimation
+    algorithm", 2007). Small counts are estimated by linear counting, which is close to exact
+    while most registers are still empty.
+    """
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16, not %d" % precision)
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @staticmethod
+    def standard_error(precision):
+        return 1.04 / math.sqrt(1 << precision)
+
+    def add(self, key):
+        self.add_hash(hash64(key))
+
+    def add_hash(self, h):
+        """Adds a key by its hash64()"""
+        bits = 64 - self.precision
+        register = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1  # position of the first 1 bit
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def __len__(self):
+        """:return The estimated number of distinct keys added, rounded"""
+        return int(round(self.estimate()))
+
+    def estimate(self):
+        m = len(self.registers)
+        zeros = self.registers.count(0)
+        if zeros == m:
+            return 0.0
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * m and zeros:
+            return m * math.log(m / float(zeros))  # linear counting
+        return estimate
+
+
+class SpaceSaving:
+    """
+    Tracks the heaviest keys of a stream in a fixed number of counters, with the Space-Saving
+    algorithm (Metwally et al., "Efficient computation of frequent and top-k elements in data
+    streams", 2005). When a new key arrives and every counter is taken, the key with the lowest
+    count is evicted, and the new key takes over its count, which is remembered as the new key's
+    error. Each count is an overestimate by at most its error, which is at most total / capacity,
+    so every key seen more often than that is sure to be tracked.
+    """
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("Space-Saving needs at least one counter")
+        self.capacity = capacity
+        self.total = 0     # of all the counts added
+        self.counts = {}   # key -> estimated count
+        self.errors = {}   # key -> most by which its count may be overestimated
+        self.heap = []     # (count, sequence, key), one per key, whose count may since have grown
+        self.sequence = 0  # breaks ties between keys with the same count, oldest first
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def add(self, key, count=1):
+        """
+        :param key: The key seen
+        :param count: How many times it was seen
+        :return The key evicted to make room for it, or None if none was
+        """
+        self.total += count
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+            return None
+        evicted = None
+        error = 0
+        if len(counts) >= self.capacity:
+            evicted, error = self._pop_min()
+        counts[key] = error + count
+        self.errors[key] = error
+        heapq.heappush(self.heap, (error + count, self.sequence, key))
+        self.sequence += 1
+        return evicted
+
+    def _pop_min(self):
+        """Removes the key with the lowest count, :return A tuple of (key, count)"""
+        heap = self.heap
+        counts = self.counts
+        while True:
+            count, _, key = heap[0]
+            current = counts[key]
+            if current == count:
+                heapq.heappop(heap)
+                del counts[key]
+                del self.errors[key]
+                return key, count
+            heapq.heapreplace(heap, (current, self.sequence, key))  # it's grown since it was pushed
+            self.sequence += 1
+
+    @property
+    def bound(self):
+        """The most by which any count may be overestimated"""
+        return self.total // self.capacity
+
+    def items(self):
+        """:return A list of (key, count, error) for every tracked key, highest count first"""
+        return sorted(((k, c, self.errors[k]) for k, c in self.counts.items()), key=lambda i: i[1], reverse=True)
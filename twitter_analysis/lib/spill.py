@@ -0,0 +1,552 @@
+import heapq
+import math
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import zlib
+
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .d_rank import Convergence, require_numpy
+from .interactions import InteractionStore, NO_TWEET, POST, TweetRows
+from .output import OUTPUT_COLUMNS, ROWS_PER_CHUNK, write_chunks
+from .ranking import RANKED_METRICS, TopN, normalise
+from .tweet_reader import detect_compression, expand_input_paths, read_tweets
+
+
+SIZE_UNITS = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+MIN_BUCKETS = 16
+MAX_BUCKETS = 256
+COMPRESSION_RATIO = 10    # roughly how many times larger compressed input is once decompressed
+BUFFERED_ROW_BYTES = 256  # roughly the memory a row awaiting spilling takes, with its share of the other records
+RUN_ROW_BYTES = 256       # roughly the memory a row of a sorted run being merged takes
+LOADED_ROW_BYTES = 256    # roughly the memory a row of a bucket being analysed takes, with its users, tweets and Kudos
+
+if np is not None:
+    CONTRIBUTION = np.dtype([('position', np.int64), ('value', np.float64)])
+
+
+def parse_size(size):
+    """
+    :param size: A size such as '512M', '2G' or '1.5GiB' (or a number of bytes)
+    :return The size in bytes
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*$', size, re.IGNORECASE)
+    if match is None:
+        raise ValueError("Invalid size '%s', expected e.g. 512M or 2G" % size)
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def choose_num_buckets(tweets_files, max_memory):
+    """
+    Picks how many buckets to spill the interactions to, so that each bucket's share of the corpus
+    can be analysed within max_memory. The share is estimated from the size of the (decompressed)
+    input, of which the analysis holds far less, so this errs well on the side of caution.
+    """
+    size = 0
+    for path in expand_input_paths(tweets_files):
+        size += os.path.getsize(path) * (COMPRESSION_RATIO if detect_compression(path) else 1)
+    num_buckets = int(math.ceil(size / float(max_memory)))
+    if num_buckets > MAX_BUCKETS:
+        print("[WARN] The input would need %d buckets to be analysed within %s bytes of memory, but at most %d are "
+              "used; some buckets may not fit" % (num_buckets, max_memory, MAX_BUCKETS))
+    return max(MIN_BUCKETS, min(MAX_BUCKETS, num_buckets))
+
+
+def bucket_of(key, num_buckets):
+    """:return The bucket of a screen name or tweet ID (the same in every process, unlike hash())"""
+    return zlib.crc32(str(key).encode('utf-8')) % num_buckets
+
+
+def append_pickle(path, obj):
+    with open(path, 'ab') as f:
+        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+
+
+def read_pickles(path):
+    """:return A generator of the objects appended to a file by append_pickle() (none, if it doesn't exist)"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def read_run(path):
+    """:return A generator of the rows of a sorted run, written as chunks of columns by append_pickle()"""
+    for columns in read_pickles(path):
+        for row in zip(*columns):
+            yield row
+
+
+def write_run(path, columns, rows_per_chunk):
+    """Writes columns of rows (already sorted) to a file as a run of chunks, to be read back by read_run()"""
+    for start in range(0, len(columns[0]), rows_per_chunk):
+        append_pickle(path, [column[start:start + rows_per_chunk] for column in columns])
+
+
+class SpillingStore(TweetRows):
+    """
+    Takes the rows of each tweet as it's ingested and buffers them by the bucket of their target
+    user, as it does the profiles and kudos of users by their own bucket, and the posts and
+    favourite counts of tweets by the bucket of the tweet. The buffers are appended to each
+    bucket's files on disk whenever they fill.
+    """
+    def __init__(self, directory, num_buckets, rows_per_flush):
+        TweetRows.__init__(self)
+        self.directory = directory
+        self.num_buckets = num_buckets
+        self.rows_per_flush = rows_per_flush
+        self.num_kudos = 0  # calls of kudos_user() so far, which order users as an InteractionStore would
+        self.bucket_rows = [0] * num_buckets  # the rows spilled to each bucket
+        self.clear_buffers()
+
+    def clear_buffers(self):
+        n = self.num_buckets
+        self.buffered_rows = 0
+        self.rows = [([], [], [], []) for _ in range(n)]  # (sources, targets, tweets, kinds) by bucket of target
+        self.kudos = [{} for _ in range(n)]       # { user: number of first kudos } by bucket of user
+        self.profiles = [{} for _ in range(n)]    # { user: (followers, friends, tweets) } by bucket of user
+        self.posts = [set() for _ in range(n)]    # set((tweet, posting user)) by bucket of tweet
+        self.favourites = [{} for _ in range(n)]  # { tweet: favourite count } by bucket of tweet
+
+    def path(self, name, bucket):
+        return os.path.join(self.directory, '%s-%d.pkl' % (name, bucket))
+
+    def kudos_user(self, screen_name):
+        self.kudos[bucket_of(screen_name, self.num_buckets)].setdefault(screen_name, self.num_kudos)
+        self.num_kudos += 1
+        return screen_name
+
+    def update_profile(self, user, followers_count, friends_count, total_tweet_count):
+        profiles = self.profiles[bucket_of(user, self.num_buckets)]
+        seen = profiles.get(user)
+        if seen is not None:
+            followers_count = max(followers_count, seen[0])
+            friends_count = max(friends_count, seen[1])
+            total_tweet_count = max(total_tweet_count, seen[2])
+        profiles[user] = (followers_count, friends_count, total_tweet_count)
+
+    def update_favourite_count(self, tweet, new_fav_count):
+        favourites = self.favourites[bucket_of(tweet, self.num_buckets)]
+        if new_fav_count > favourites.get(tweet, 0):
+            favourites[tweet] = new_fav_count
+
+    def take_rows(self, sources, targets, tweets, kinds):
+        """Buffers the rows of the tweet just ingested, spilling the buffers to disk once they're full"""
+        n = self.num_buckets
+        for source, target, tweet, kind in zip(sources, targets, tweets, kinds):
+            b = bucket_of(target, n)
+            bucket_sources, bucket_targets, bucket_tweets, bucket_kinds = self.rows[b]
+            bucket_sources.append(source)
+            bucket_targets.append(target)
+            bucket_tweets.append(tweet)
+            bucket_kinds.append(kind)
+            self.bucket_rows[b] += 1
+            if kind & POST:
+                self.posts[bucket_of(tweet, n)].add((tweet, target))
+        self.buffered_rows += len(kinds)
+        if self.buffered_rows >= self.rows_per_flush:
+            self.flush()
+
+    def flush(self):
+        """Appends the buffers to the files of their buckets"""
+        for b in range(self.num_buckets):
+            for name, records in (('rows', self.rows[b]), ('kudos', self.kudos[b]), ('profiles', self.profiles[b]),
+                                  ('posts', self.posts[b]), ('favourites', self.favourites[b])):
+                if records and (name != 'rows' or records[0]):
+                    append_pickle(self.path(name, b), records)
+        self.clear_buffers()
+
+
+class OutOfCoreAnalysis:
+    """
+    Analyses a corpus whose interactions don't fit in memory, in bounded memory, giving exactly
+    the results of the in-memory analysis (with the python D-rank engine):
+
+    1. The tweets are ingested into a SpillingStore, which spills the rows to buckets on disk,
+       partitioned by the screen name of the user they target.
+    2. The favourite counts of tweets are credited to the users who posted them.
+    3. Each bucket in turn is loaded into an InteractionStore holding every row targeting its
+       users, whose Kudos metrics are calculated as usual and written out as a run sorted by the
+       order in which users were first given kudos. Its D-rank links are written out by bucket
+       of the interacting user.
+    4. D-rank iterates a bucket at a time: each bucket's scores are spread along its users'
+       outgoing links to the buckets of the users they interacted with, then each bucket sums up
+       its users' incoming influence, in the same order as TwitterAnalysis.d_rank() does. The
+       scores are written out as runs in screen name order, and in the order of the metrics runs.
+    5. The runs are merged as streams, normalising SNP and Mixture over the ranges of every bucket,
+       while the top users by each metric are picked out, and the table is optionally written out.
+
+    The number of buckets is capped at MAX_BUCKETS, and each bucket is analysed whole, so a bucket
+    too large for max_memory (e.g. one with a user given a great deal of kudos) is warned of.
+    """
+    def __init__(self, analyser, max_memory, directory, num_buckets):
+        require_numpy("Out-of-core analysis")
+        self.analyser = analyser
+        self.options = analyser.options
+        self.instrumentation = analyser.instrumentation
+        self.max_memory = max_memory
+        self.directory = directory
+        self.num_buckets = num_buckets
+        self.rows_per_run_chunk = max(256, max_memory // 4 // (num_buckets * RUN_ROW_BYTES))
+        self.num_interactions = 0
+        self.bucket_rows = [0] * num_buckets
+
+    def path(self, name, bucket, extension='pkl'):
+        return os.path.join(self.directory, '%s-%d.%s' % (name, bucket, extension))
+
+    def run(self, tweets, output=None, output_format=None):
+        """
+        Analyses the tweets, printing the top accounts by each metric as TwitterAnalysis.report() does.
+        :param tweets: An iterable of TweetRecords or tweet dictionaries
+        :param output: A file to write the full metric table to (default: none), see write_chunks()
+        :param output_format: The format of the output file (default: by its extension)
+        :return The number of users given kudos
+        """
+        instrumentation = self.instrumentation
+        self.ingest(tweets)
+        with instrumentation.stage('favourites'):
+            self.credit_favourites()
+        with instrumentation.stage('metrics'):
+            num_users, num_kudos_users, ranges = self.calculate_metrics()
+        instrumentation.count('users', num_users)
+        instrumentation.count('kudos_users', num_kudos_users)
+        instrumentation.count('interactions', self.num_interactions)
+        print("Detected %d different Twitter users" % num_kudos_users)
+        with instrumentation.stage('d_rank'):
+            self.prepare_d_rank()
+            self.d_rank()
+
+        how_few = self.analyser.how_few
+        with instrumentation.stage('rank'):
+            tops = dict((metric, TopN(how_few)) for metric in RANKED_METRICS)
+            chunks = self.merged_chunks(ranges, tops)
+            if output:
+                write_chunks(output, chunks, output_format)
+            else:
+                for _ in chunks:
+                    pass
+            d_rank_top = TopN(how_few)
+            for position, (name, score) in enumerate(heapq.merge(*(read_run(self.path('d_rank', b))
+                                                                    for b in range(self.num_buckets)))):
+                d_rank_top.add(position, name, score)
+
+        self.analyser.print_top_few(dict((metric, top.top()) for metric, top in tops.items()))
+        print("D-Rank")
+        for r in d_rank_top.top():
+            print("  @%s : %.2f" % r)
+        if output:
+            print("Wrote the metrics of %d users to %s" % (num_kudos_users, output))
+        return num_kudos_users
+
+    def ingest(self, tweets):
+        """Ingests the tweets, as TwitterAnalysis.ingest() does, but spilling their interactions to disk"""
+        rows_per_flush = max(1000, self.max_memory // 2 // BUFFERED_ROW_BYTES)
+        store = SpillingStore(self.directory, self.num_buckets, rows_per_flush)
+        self.analyser.ingest(tweets, store)
+        store.flush()
+
+        self.num_interactions = len(store)
+        self.bucket_rows = store.bucket_rows
+        self.instrumentation.count('spill_buckets', self.num_buckets)
+        print("Spilled %d interactions to %d buckets in %s" % (len(store), self.num_buckets, self.directory))
+
+    def credit_favourites(self):
+        """
+        Joins the favourite counts of tweets with the users who posted them (by the bucket of the
+        tweet), and passes the counts on to the buckets of those users, for their Post/Activity Ratio.
+        """
+        n = self.num_buckets
+        for k in range(n):
+            favourites = {}
+            for chunk in read_pickles(self.path('favourites', k)):
+                for tweet, count in chunk.items():
+                    if count > favourites.get(tweet, 0):
+                        favourites[tweet] = count
+            if not favourites:
+                continue
+            posts = set()
+            for chunk in read_pickles(self.path('posts', k)):
+                posts.update(p for p in chunk if p[0] in favourites)
+            by_bucket = [[] for _ in range(n)]
+            for tweet, user in posts:
+                by_bucket[bucket_of(user, n)].append((tweet, favourites[tweet]))
+            for b, records in enumerate(by_bucket):
+                if records:
+                    append_pickle(self.path('user_favourites', b), records)
+
+    def load_bucket(self, b):
+        """
+        :return A tuple of (store, kudos_order), where store is an InteractionStore holding every row
+        targeting the users of bucket b, with its users given kudos in order, and kudos_order the
+        number of each of those users' first kudos
+        """
+        store = InteractionStore()
+        user = store.user
+        tweet_id = store.tweet_id
+        for sources, targets, tweets, kinds in read_pickles(self.path('rows', b)):
+            for source, target, tweet, kind in zip(sources, targets, tweets, kinds):
+                store.add(user(source), user(target), tweet_id(tweet), NO_TWEET, kind)
+
+        first_kudos = {}
+        for chunk in read_pickles(self.path('kudos', b)):
+            for name, order in chunk.items():
+                first_kudos.setdefault(name, order)  # the chunks were spilled in order
+        kudos_order = []
+        for name, order in sorted(first_kudos.items(), key=itemgetter(1)):
+            store.kudos_user(name)
+            kudos_order.append(order)
+
+        for chunk in read_pickles(self.path('profiles', b)):
+            for name, counts in chunk.items():
+                store.update_profile(user(name), *counts)
+        for chunk in read_pickles(self.path('user_favourites', b)):
+            for tweet, count in chunk:
+                store.update_favourite_count(tweet_id(tweet), count)
+        return store, kudos_order
+
+    def calculate_metrics(self):
+        """
+        Calculates the Kudos metrics of the users of each bucket in turn, writing them out as runs
+        sorted by kudos order, and writes out the D-rank links targeting them.
+        :return A tuple of (number of users, number of users given kudos, ranges), where ranges maps
+        'h_index', 'int_ratio' and 'rm_ratio' to the (min, max) of each over every bucket
+        """
+        n = self.num_buckets
+        num_users = num_kudos_users = 0
+        ranges = {}
+        for b in range(n):
+            # a bucket is analysed whole, so one holding more than its share (e.g. a user given a great deal of
+            # kudos) takes more memory than allowed
+            bucket_bytes = self.bucket_rows[b] * LOADED_ROW_BYTES
+            if bucket_bytes > self.max_memory:
+                print("[WARN] Bucket %d holds %d interactions, about %d bytes once loaded, more than the %d bytes "
+                      "allowed" % (b, self.bucket_rows[b], bucket_bytes, self.max_memory))
+            store, kudos_order = self.load_bucket(b)
+            offsets, _ = store.rows_by_target()
+            num_users += sum(1 for u in range(len(store.users)) if offsets[u + 1] > offsets[u])
+            num_kudos_users += len(kudos_order)
+            if kudos_order:
+                _, metrics = self.analyser.calculate_metrics(store)
+                columns = [kudos_order, metrics.screen_names, metrics.h_index, metrics.int_ratio, metrics.rm_ratio,
+                           metrics.pa_ratio]
+                write_run(self.path('metrics', b), columns, self.rows_per_run_chunk)
+                for metric in ('h_index', 'int_ratio', 'rm_ratio'):
+                    values = getattr(metrics, metric)
+                    low, high = ranges.get(metric, (min(values), max(values)))
+                    ranges[metric] = (min(low, min(values)), max(high, max(values)))
+
+            # the links targeting this bucket's users, in the order TwitterAnalysis.d_rank() sums them up,
+            # passed on to the buckets of the interacting users
+            names = store.users
+            incoming, _ = store.links()
+            segment_targets = []
+            segment_lengths = []
+            links_by_bucket = [[] for _ in range(n)]
+            position = 0
+            for target, interactors in incoming.items():
+                segment_targets.append(names[target])
+                segment_lengths.append(len(interactors))
+                for source, num_interactions in interactors.items():
+                    source_name = names[source]
+                    links_by_bucket[bucket_of(source_name, n)].append((source_name, b, position, num_interactions))
+                    position += 1
+            append_pickle(self.path('segments', b), (segment_targets, segment_lengths))
+            for i, links in enumerate(links_by_bucket):
+                if links:
+                    append_pickle(self.path('links', i), links)
+        return num_users, num_kudos_users, ranges
+
+    def prepare_d_rank(self):
+        """
+        Numbers the D-rank users of each bucket (in screen name order) and saves, as arrays, the
+        outgoing links of its users and the incoming links of its users (as a segment per user of
+        the bucket's links, longest first), with every user's starting score.
+        """
+        n = self.num_buckets
+        weight_factor = float(self.options.d_rank_weight_factor)
+        num_users = num_links = 0
+        for b in range(n):
+            segment_targets, segment_lengths = next(read_pickles(self.path('segments', b)))
+            sources = []
+            target_buckets = []
+            positions = []
+            counts = []
+            for links in read_pickles(self.path('links', b)):
+                for source, target_bucket, position, num_interactions in links:
+                    sources.append(source)
+                    target_buckets.append(target_bucket)
+                    positions.append(position)
+                    counts.append(num_interactions)
+
+            names = sorted(set(segment_targets).union(sources))
+            index = dict((name, u) for u, name in enumerate(names))
+            source = np.array([index[s] for s in sources], dtype=np.int64)
+            out_degree = np.bincount(source, minlength=len(names)).astype(np.float64)
+            target_buckets = np.array(target_buckets, dtype=np.int64)
+            order = np.argsort(target_buckets, kind='stable')
+
+            lengths = np.array(segment_lengths, dtype=np.int64)
+            starts = np.cumsum(lengths) - lengths
+            longest_first = np.argsort(-lengths, kind='stable')
+            lengths = lengths[longest_first]
+            max_length = int(lengths[0]) if len(lengths) else 0
+            np.savez(self.path('d_rank_links', b, 'npz'),
+                     source=source[order],
+                     out_degree=out_degree,
+                     count=np.array(counts, dtype=np.float64)[order],
+                     position=np.array(positions, dtype=np.int64)[order],
+                     bucket_bounds=np.searchsorted(target_buckets[order], np.arange(n + 1)),
+                     segment_target=np.array([index[t] for t in segment_targets], dtype=np.int64)[longest_first],
+                     segment_start=starts[longest_first],
+                     segment_active=np.searchsorted(-lengths, -np.arange(max_length), side='left'),
+                     num_incoming=np.array([lengths.sum()]))
+            with open(self.path('d_rank_names', b), 'wb') as f:
+                pickle.dump(names, f, pickle.HIGHEST_PROTOCOL)
+            np.save(self.path('scores', b, 'npy'), np.full(len(names), weight_factor))
+            num_users += len(names)
+            num_links += len(sources)
+        self.instrumentation.count('d_rank_users', num_users)
+        self.instrumentation.count('d_rank_links', num_links)
+
+    def d_rank(self):
+        """
+        Iterates D-rank over the buckets, as TwitterAnalysis.d_rank() does over the whole graph at once,
+        stopping once the residual across every bucket is within the tolerance (Jacobi iterations only).
+        """
+        n = self.num_buckets
+        max_iterations = int(self.options.max_iterations)
+        weight_factor = float(self.options.d_rank_weight_factor)
+        damping_factor = 1 - weight_factor
+        convergence = Convergence(float(self.options.tolerance), self.options.residual_norm, self.options.debug,
+                                  self.instrumentation)
+
+        scores_have_changed = True
+        while convergence.iterations < max_iterations and scores_have_changed:
+            max_delta = 0.0
+            total_delta = 0.0
+            num_users = 0
+            convergence.start()
+
+            # spread the influence of each user along their outgoing links
+            for b in range(n):
+                open(self.path('contributions', b, 'bin'), 'wb').close()
+            for b in range(n):
+                links = np.load(self.path('d_rank_links', b, 'npz'))
+                source = links['source']
+                positions = links['position']
+                bounds = links['bucket_bounds']
+                scores = np.load(self.path('scores', b, 'npy'))
+                values = scores[source] * links['count'] / links['out_degree'][source]
+                for target_bucket in range(n):
+                    low, high = bounds[target_bucket], bounds[target_bucket + 1]
+                    if low < high:
+                        contributions = np.empty(high - low, dtype=CONTRIBUTION)
+                        contributions['position'] = positions[low:high]
+                        contributions['value'] = values[low:high]
+                        with open(self.path('contributions', target_bucket, 'bin'), 'ab') as f:
+                            contributions.tofile(f)
+
+            # sum up the influence reaching each user, one link of every user at a time, in order
+            for b in range(n):
+                links = np.load(self.path('d_rank_links', b, 'npz'))
+                contributions = np.fromfile(self.path('contributions', b, 'bin'), dtype=CONTRIBUTION)
+                incoming = np.zeros(int(links['num_incoming'][0]))
+                incoming[contributions['position']] = contributions['value']
+                segment_start = links['segment_start']
+                sums = np.zeros(len(segment_start))
+                for k, active in enumerate(links['segment_active']):
+                    sums[:active] += incoming[segment_start[:active] + k]
+
+                old_scores = np.load(self.path('scores', b, 'npy'))
+                surrounding_influence = np.zeros(len(old_scores))
+                surrounding_influence[links['segment_target']] = sums
+                new_scores = damping_factor + weight_factor * surrounding_influence
+                if len(new_scores):
+                    delta = np.abs(old_scores - new_scores)
+                    max_delta = max(max_delta, float(delta.max()))
+                    total_delta += float(delta.sum())
+                    num_users += len(new_scores)
+                np.save(self.path('scores', b, 'npy'), new_scores)
+
+            scores_have_changed = convergence.finish(max_delta, total_delta, num_users)
+        convergence.report(max_iterations)
+
+        for b in range(n):
+            with open(self.path('d_rank_names', b), 'rb') as f:
+                names = pickle.load(f)
+            scores = np.load(self.path('scores', b, 'npy')).tolist()
+            write_run(self.path('d_rank', b), [names, scores], self.rows_per_run_chunk)
+            # and in the order of the bucket's run of metrics, to be merged alongside it
+            scores = dict(zip(names, scores))
+            write_run(self.path('kudos_d_rank', b), [[scores.get(row[1]) for row in read_run(self.path('metrics', b))]],
+                      self.rows_per_run_chunk)
+
+    def merged_chunks(self, ranges, tops):
+        """
+        Merges the runs of metrics into one table in kudos order, with SNP, Mixture and D-rank, as
+        MetricTable does, feeding each value to the TopN of its metric.
+        :param ranges: The (min, max) of the H-Index, Interactor Ratio and Retweet/Mention Ratio
+        :param tops: Map of metric name to TopN
+        :return A generator of lists of columns, in the order of OUTPUT_COLUMNS
+        """
+        min_h_index, max_h_index = ranges.get('h_index', (0, 0))
+        min_ir, max_ir = ranges.get('int_ratio', (0, 0))
+        min_rmr, max_rmr = ranges.get('rm_ratio', (0, 0))
+        n = self.num_buckets
+
+        def bucket_rows(b):
+            for row, (d_rank,) in zip(read_run(self.path('metrics', b)), read_run(self.path('kudos_d_rank', b))):
+                yield row + (d_rank,)
+
+        chunk = [[] for _ in OUTPUT_COLUMNS]
+        rows = heapq.merge(*(bucket_rows(b) for b in range(n)), key=itemgetter(0))
+        for position, (_, name, h_index, int_ratio, rm_ratio, pa_ratio, d_rank) in enumerate(rows):
+            norm_h_index = normalise(h_index, min_h_index, max_h_index)
+            norm_ir = normalise(int_ratio, min_ir, max_ir)
+            norm_rmr = normalise(rm_ratio, min_rmr, max_rmr)
+            snp = 0.25 * norm_ir + 0.75 * norm_rmr
+            mixture = (norm_h_index + norm_ir + norm_rmr) / 3.0
+            row = (name, int(h_index), int_ratio, rm_ratio, snp, mixture, pa_ratio, d_rank)
+            for metric, value in zip(OUTPUT_COLUMNS[1:7], row[1:7]):
+                tops[metric].add(position, name, value)
+            for column, value in zip(chunk, row):
+                column.append(value)
+            if len(chunk[0]) >= ROWS_PER_CHUNK:
+                yield chunk
+                chunk = [[] for _ in OUTPUT_COLUMNS]
+        if chunk[0]:
+            yield chunk
+
+
+def analyse_out_of_core(analyser, options, dedup=None):
+    """
+    Analyses the tweets of the input files in at most (roughly) options.max_memory of memory, spilling
+    the interactions to a temporary directory, see OutOfCoreAnalysis.
+    :param analyser: The TwitterAnalysis
+    :param options: The parsed command line options
+    :param dedup: A Deduplicator to drop tweets seen before with (default: keep them)
+    :return The number of users given kudos
+    """
+    max_memory = parse_size(options.max_memory)
+    num_buckets = choose_num_buckets(options.tweets_files, max_memory)
+    directory = tempfile.mkdtemp(prefix='twitter_analysis-', dir=options.spill_dir)
+    try:
+        analysis = OutOfCoreAnalysis(analyser, max_memory, directory, num_buckets)
+        tweets = read_tweets(options.tweets_files, readers=int(options.readers), decoder=options.decoder,
+                             dedup=dedup)
+        return analysis.run(tweets, options.output, options.output_format)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,92 @@
+import os
+import pickle
+
+from array import array
+
+
+STATE_VERSION = 1
+
+
+class AnalysisState:
+    """
+    Everything needed to carry an analysis forward to a later run which only ingests new tweets:
+    the InteractionStore, the Kudos metrics last calculated for each user, and the last D-rank
+    scores (from which D-rank can be warm-started).
+    """
+    def __init__(self, store):
+        self.store = store
+        self.metrics = {}         # user number -> (h_index, int_ratio, rm_ratio, pa_ratio)
+        self.pa_weights = None    # the weights pa_ratio was calculated with
+        self.d_rank_scores = {}   # screen name -> D-rank score
+        self.mark()
+
+    def mark(self):
+        """Notes the current extent of the store, so later changes to it can be detected"""
+        self.rows_seen = len(self.store)
+        self.followers_seen = array('q', self.store.followers_count)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['rows_seen']
+        del state['followers_seen']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.mark()
+
+    def changed_users(self):
+        """
+        :return The (numbers of the) users whose Kudos metrics may have changed since mark(): those
+        targeted by new rows, those new to the store, and those whose follower counts have changed
+        """
+        store = self.store
+        changed = set(store.target[self.rows_seen:])
+        followers_seen = self.followers_seen
+        changed.update(u for u in range(len(followers_seen)) if store.followers_count[u] != followers_seen[u])
+        changed.update(range(len(followers_seen), len(store.users)))
+        return changed
+
+    def restore(self, kudos, pa_weights):
+        """Restores the cached metrics of a user's Kudos, if they were calculated in an earlier run"""
+        metrics = self.metrics.get(kudos.user)
+        if metrics is None:
+            return
+        kudos.cached_h_index, kudos.cached_int_ratio, kudos.cached_rm_ratio, cached_pa_ratio = metrics
+        if pa_weights == self.pa_weights:
+            kudos.cached_pa_ratio = cached_pa_ratio
+            kudos.cached_pa_weights = tuple(pa_weights)
+
+    def update(self, kudos, pa_weights, d_rank_scores):
+        """
+        Records the metrics of this run.
+        :param kudos: The Kudos of each user, with their metrics calculated
+        :param pa_weights: The weights pa_ratio was calculated with
+        :param d_rank_scores: Map of screen name to D-rank score
+        """
+        self.metrics = dict(
+            (k.user, (k.h_index(), k.int_ratio(), k.rm_ratio(), k.pa_ratio(*pa_weights))) for k in kudos
+        )
+        self.pa_weights = pa_weights
+        self.d_rank_scores = d_rank_scores
+        self.mark()
+
+
+def load_state(path):
+    """
+    Loads the analysis state saved by save_state().
+    :return The AnalysisState
+    """
+    with open(path, 'rb') as f:
+        version, state = pickle.load(f)
+    if version != STATE_VERSION:
+        raise ValueError("%s holds state version %s, expected %s" % (path, version, STATE_VERSION))
+    return state
+
+
+def save_state(path, state):
+    """Saves the analysis state, replacing any previous state in the file only once it's fully written"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((STATE_VERSION, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
@@ -0,0 +1,229 @@
+import itertools
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .batch_metrics import pa_ratios, pa_terms
+from .d_rank import DRankMatrix, INTERESTING_DELTA, require_numpy
+from .output import write_chunks
+
+
+# the parameters which can be swept: (the name in a --sweep grid, the option it takes the place of)
+SWEEP_PARAMETERS = [
+    ('rt-weight', 'rt_weight'),
+    ('qu-weight', 'qu_weight'),
+    ('re-weight', 're_weight'),
+    ('fav-weight', 'fav_weight'),
+    ('weight', 'd_rank_weight_factor')
+]
+
+SWEEP_COLUMNS = ['rt_weight', 'qu_weight', 're_weight', 'fav_weight', 'weight',
+                 'pa_top_overlap', 'pa_spearman', 'pa_top_account',
+                 'd_rank_top_overlap', 'd_rank_spearman', 'd_rank_top_account']
+SWEEP_TYPES = ['float64'] * 7 + ['string'] + ['float64'] * 2 + ['string']  # the pyarrow type of each column
+
+
+def parse_values(text):
+    """
+    :param text: Comma separated values and/or ranges, e.g. '0.5,1,2' or '0.1:0.5:0.1' (from 0.1 to 0.5
+    inclusive, in steps of 0.1)
+    :return The list of values
+    """
+    values = []
+    for part in text.split(','):
+        if ':' not in part:
+            values.append(float(part))
+            continue
+        start, stop, step = (float(v) for v in part.split(':'))
+        if step <= 0 or stop < start:
+            raise ValueError("Expected a range start:stop:step with start <= stop and step > 0, not '%s'" % part)
+        steps = int(round((stop - start) / step))
+        values.extend(round(start + i * step, 10) for i in range(steps + 1))
+    return values
+
+
+def parse_sweep(specs, options):
+    """
+    Parses the grids of a --sweep, e.g. ['rt-weight=0.5,1,2', 'weight=0.1:0.5:0.1'].
+    :param specs: A list of 'parameter=values' strings, with parameters from SWEEP_PARAMETERS and values
+    as parse_values() expects
+    :param options: The parsed command line options, from which the parameters not swept are taken
+    :return A list of the values to sweep each of SWEEP_PARAMETERS over, in order
+    """
+    names = [name for name, _ in SWEEP_PARAMETERS]
+    grid = dict((name, [float(getattr(options, dest))]) for name, dest in SWEEP_PARAMETERS)
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        name = name.strip().lstrip('-').replace('_', '-')
+        if name not in names:
+            raise ValueError("Unknown parameter '%s' to sweep, expected one of %s" % (name, ', '.join(names)))
+        try:
+            grid[name] = parse_values(values)
+        except ValueError as e:
+            raise ValueError("Can't sweep %s over '%s': %s" % (name, values, e))
+    return [grid[name] for name in names]
+
+
+def weight_factor_d_rank(matrix, weight_factors, max_iterations, debug=False, instrumentation=None,
+                         tolerance=INTERESTING_DELTA, norm='linf'):
+    """
+    Calculates D-rank with each of the given weight factors, iterated together as a matrix with a
+    column per weight factor, so the links are read once per iteration whatever the number of weight
+    factors (as personalised_d_rank() does for seed sets). Each column starts from, and iterates,
+    exactly as matrix_d_rank() would with its weight factor alone, with jacobi iterations, and stops
+    once its own residual is within the tolerance.
+    :param matrix: The DRankMatrix
+    :param weight_factors: The D-rank weight factors
+    :param max_iterations: The most iterations to run before giving up on convergence
+    :param debug: Whether to report each iteration
+    :param instrumentation: An Instrumentation to record the number of iterations in
+    :param tolerance: The residual at or below which a column's scores have converged
+    :param norm: The norm of the residual, one of RESIDUAL_NORMS, see Convergence
+    :return The scores, a matrix with a row per user of the matrix and a column per weight factor
+    """
+    weight_factors = np.asarray(weight_factors, dtype=np.float64)
+    damping_factors = 1 - weight_factors
+
+    # Step 1. Set all weights
+    influence_scores = np.tile(weight_factors, (matrix.n, 1))
+
+    # Step 2.
+    active = np.arange(len(weight_factors))  # the weight factors whose scores have yet to converge
+    iterations = 0
+    while iterations < max_iterations and len(active) and matrix.n:
+        iterations += 1
+        started = time.perf_counter()
+        scores = influence_scores[:, active]
+        new_scores = damping_factors[active] + weight_factors[active] * matrix.dot(scores)
+        influence_scores[:, active] = new_scores
+
+        # Step 3. check which have changed
+        changes = np.abs(new_scores - scores)
+        residuals = changes.max(axis=0) if norm == 'linf' else changes.sum(axis=0)
+        if debug:
+            print("=== Iteration %d (%d users, %d weight factors): largest change %.6f, largest %s residual %.6g, "
+                  "%.3fs ===" % (iterations, matrix.n, len(active), changes.max(), norm, residuals.max(),
+                                 time.perf_counter() - started))
+        active = active[residuals > tolerance]
+
+    if len(active):
+        print("[WARN] D-rank hit iteration max of %d before converging with weight factors %s" %
+              (max_iterations, ', '.join('%g' % w for w in weight_factors[active])))
+    elif debug:
+        print("[INFO] D-rank converged with every weight factor after %d iterations" % iterations)
+    if instrumentation is not None:
+        instrumentation.count('sweep_d_rank_iterations', iterations)
+    return influence_scores
+
+
+def average_ranks(values):
+    """:return The rank of each value, from 1 for the lowest, with tied values given the average of their ranks"""
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    ends = np.cumsum(counts)
+    return (ends - (counts - 1) / 2.0)[inverse]
+
+
+def rank_stability(scores, how_few):
+    """
+    Compares the ranking by each column of scores with that by the first.
+    :param scores: A matrix with a row per user and a column per ranking
+    :param how_few: How many of the top users to compare
+    :return A tuple of (the fraction of the top users by the first column who are also top users by each
+    column, the Spearman rank correlation of each column with the first (None where either column is
+    constant), and the row of the top user by each column (None if there are no rows))
+    """
+    num_users, num_columns = scores.shape
+    if not num_users:
+        return [0.0] * num_columns, [None] * num_columns, [None] * num_columns
+    # ties are broken by position, as top() does
+    tops = [np.argsort(-scores[:, c], kind='stable')[:how_few] for c in range(num_columns)]
+    baseline_top = set(tops[0].tolist())
+    overlaps = [len(baseline_top.intersection(t.tolist())) / float(len(tops[0])) for t in tops]
+
+    ranks = np.column_stack([average_ranks(scores[:, c]) for c in range(num_columns)])
+    ranks -= ranks.mean(axis=0)
+    norms = np.sqrt((ranks ** 2).sum(axis=0))
+    correlations = ranks.T.dot(ranks[:, 0])
+    spearman = [float(r / (n * norms[0])) if n and norms[0] else None for r, n in zip(correlations, norms)]
+    return overlaps, spearman, [int(t[0]) for t in tops]
+
+
+def sweep(store, grid, baseline, max_iterations, how_few, instrumentation, debug=False,
+          tolerance=INTERESTING_DELTA, norm='linf'):
+    """
+    Calculates the Post/Activity Ratio and D-rank of every user with every combination of the parameters
+    in the grid, comparing the ranking by each with that by the baseline parameters. The counts PAr is
+    calculated from are gathered once, and every weighting of them is a single matrix product, while
+    D-rank is iterated with every weight factor at once over the one interaction graph.
+    :param store: The InteractionStore
+    :param grid: A list of the values to sweep each of SWEEP_PARAMETERS over, see parse_sweep()
+    :param baseline: The value of each of SWEEP_PARAMETERS to compare the rankings with
+    :param max_iterations: The most D-rank iterations to run before giving up on convergence
+    :param how_few: How many of the top accounts to compare
+    :param instrumentation: An Instrumentation to record the stages and counts of the sweep in
+    :param debug: Whether to report each D-rank iteration
+    :param tolerance: The residual at or below which D-rank has converged
+    :param norm: The norm of the residual, one of RESIDUAL_NORMS, see Convergence
+    :return The rank-stability table, a list of rows in the order of SWEEP_COLUMNS, a row per combination
+    """
+    require_numpy("A parameter sweep")
+    pa_weightings = [tuple(baseline[:4])] + list(itertools.product(*grid[:4]))
+    weight_factors = [baseline[4]] + list(grid[4])
+    instrumentation.count('sweep_pa_weightings', len(pa_weightings) - 1)
+    instrumentation.count('sweep_weight_factors', len(weight_factors) - 1)
+
+    # the first column of each is the baseline
+    with instrumentation.stage('sweep.pa_ratio'):
+        log_counts, tweet_count = pa_terms(store)
+        kudos_users = np.frombuffer(store.kudos_users, dtype=np.int32)
+        pa_scores = pa_ratios(log_counts[kudos_users], tweet_count[kudos_users], np.array(pa_weightings).T)
+        pa_overlaps, pa_spearman, pa_tops = rank_stability(pa_scores, how_few)
+    with instrumentation.stage('sweep.d_rank'):
+        matrix = DRankMatrix(store)
+        d_rank_scores = weight_factor_d_rank(matrix, weight_factors, max_iterations, debug, instrumentation,
+                                             tolerance, norm)
+        d_rank_overlaps, d_rank_spearman, d_rank_tops = rank_stability(d_rank_scores, how_few)
+
+    def name(users, row):
+        return store.users[int(users[row])] if row is not None else None
+
+    rows = []
+    for p, pa_weights in enumerate(pa_weightings[1:], 1):
+        for w, weight_factor in enumerate(weight_factors[1:], 1):
+            rows.append(list(pa_weights) + [weight_factor,
+                                            pa_overlaps[p], pa_spearman[p], name(kudos_users, pa_tops[p]),
+                                            d_rank_overlaps[w], d_rank_spearman[w], name(matrix.users, d_rank_tops[w])])
+    return rows
+
+
+def print_sweep(rows, baseline, how_few):
+    """Prints the rank-stability table of a sweep"""
+    print("Rank stability against rt %g, qu %g, re %g, fav %g and D-rank weight %g (top %d overlap, "
+          "Spearman correlation, top account)" % (tuple(baseline) + (how_few,)))
+    print("  %5s %5s %5s %5s %6s | %7s %8s %-20s | %7s %8s %-20s" %
+          ('rt', 'qu', 're', 'fav', 'weight', 'PAr top', 'rho', 'top', 'D top', 'rho', 'top'))
+
+    def rho(r):
+        return '%8.4f' % r if r is not None else '%8s' % '-'
+
+    def account(a):
+        return '@' + a if a is not None else '-'
+
+    for rt, qu, re, fav, w, pa_overlap, pa_rho, pa_top, d_overlap, d_rho, d_top in rows:
+        print("  %5g %5g %5g %5g %6g | %7.2f %s %-20s | %7.2f %s %-20s" %
+              (rt, qu, re, fav, w, pa_overlap, rho(pa_rho), account(pa_top), d_overlap, rho(d_rho), account(d_top)))
+
+
+def write_sweep(path, rows, format=None):
+    """
+    Writes the rank-stability table of a sweep to a file.
+    :param path: The file to write
+    :param rows: The rows of the table, see sweep()
+    :param format: One of OUTPUT_FORMATS (default: by the file's extension)
+    :return The number of rows written
+    """
+    write_chunks(path, [[list(column) for column in zip(*rows)]] if rows else [], format, SWEEP_COLUMNS, SWEEP_TYPES)
+    return len(rows)
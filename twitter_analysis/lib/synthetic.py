@@ -0,0 +1,243 @@
+import bisect
+import bz2
+import datetime
+import gzip
+import json
+import lzma
+import random
+import time
+
+
+LAYOUTS = ['standard', 'twitter4j']
+
+FIRST_TWEET_ID = 1000000000000000000
+FIRST_USER_ID = 100000000
+RECENT_TWEETS = 10000  # how many of the latest original tweets can be retweeted, quoted or replied to
+
+EPOCH = datetime.datetime(2016, 8, 15, 9, 30)
+
+
+class CorpusGenerator:
+    """
+    Generates a reproducible synthetic corpus of tweets, for trying the analysis at scale. Users'
+    activity follows a power law (the user of rank r, from 1, tweets in proportion to 1/r^skew),
+    as do their follower counts, and users are retweeted, quoted, replied to and mentioned in
+    proportion to their activity too. Each tweet is a retweet, quote or reply (of one of the
+    recent original tweets) with the given probabilities, or else an original tweet, and any
+    tweet may also mention other users.
+    """
+    def __init__(self, num_users, seed=0, retweets=0.3, quotes=0.05, replies=0.1, mentions=0.2,
+                 favourites=0.1, skew=1.1):
+        """
+        :param num_users: How many users could appear in the corpus
+        :param seed: The random seed; the same parameters and seed always give the same corpus
+        :param retweets: The proportion of tweets which are retweets
+        :param quotes: The proportion of tweets which are quotes
+        :param replies: The proportion of tweets which are replies
+        :param mentions: The proportion of tweets which mention other users (besides any replied to)
+        :param favourites: The proportion of original tweets which have been favourited
+        :param skew: The power law exponent of user activity
+        """
+        if retweets + quotes + replies > 1:
+            raise ValueError("The proportions of retweets, quotes and replies add up to more than 1")
+        self.num_users = num_users
+        self.random = random.Random(seed)
+        self.retweets = retweets
+        self.quotes = quotes
+        self.replies = replies
+        self.mentions = mentions
+        self.favourites = favourites
+
+        total = 0.0
+        self.cumulative_activity = []
+        for rank in range(1, num_users + 1):
+            total += 1.0 / rank ** skew
+            self.cumulative_activity.append(total)
+        self.total_activity = total
+
+        self.next_tweet_id = FIRST_TWEET_ID
+        self.recent_tweets = []
+
+    def pick_user(self):
+        """:return A user number, 0 being the most active"""
+        return bisect.bisect_left(self.cumulative_activity, self.random.random() * self.total_activity)
+
+    def user(self, u):
+        followers_count = int(50000 / (u + 1) ** 0.8) + u % 7
+        return {
+            'id': FIRST_USER_ID + u,
+            'screen_name': 'user%d' % u,
+            'name': 'User %d' % u,
+            'followers_count': followers_count,
+            'friends_count': 50 + (u * 7919) % 500,
+            'statuses_count': 100 + (u * 104729) % 10000
+        }
+
+    def tweet(self, u, text, n):
+        tweet_id = self.next_tweet_id
+        self.next_tweet_id += 1
+        return {
+            'id': tweet_id,
+            'created_at': EPOCH + datetime.timedelta(seconds=n),
+            'user': self.user(u),
+            'text': text,
+            'favorite_count': 0,
+            'in_reply_to_user_id': None,
+            'in_reply_to_status_id': None,
+            'mentions': []
+        }
+
+    def mention(self, tweet, u):
+        tweet['mentions'].append(self.user(u))
+        tweet['text'] += ' @user%d' % u
+
+    def generate(self, num_tweets):
+        """
+        Generates the tweets, as dictionaries in a neutral layout; see standard_layout() and
+        twitter4j_layout().
+        :param num_tweets: How many tweets to generate
+        """
+        rnd = self.random
+        for n in range(num_tweets):
+            u = self.pick_user()
+            choice = rnd.random()
+            original = rnd.choice(self.recent_tweets) if self.recent_tweets else None
+            if original is not None and choice < self.retweets:
+                t = self.tweet(u, 'RT @%s: %s' % (original['user']['screen_name'], original['text']), n)
+                t['retweeted_status'] = original
+                t['mentions'] = [original['user']]
+                yield t
+                continue
+
+            t = self.tweet(u, 'tweet %d by user%d' % (n, u), n)
+            if original is not None and choice < self.retweets + self.quotes:
+                t['quoted_status'] = original
+            elif original is not None and choice < self.retweets + self.quotes + self.replies:
+                t['in_reply_to_user_id'] = original['user']['id']
+                t['in_reply_to_status_id'] = original['id']
+                self.mention(t, original['user']['id'] - FIRST_USER_ID)
+            if rnd.random() < self.mentions:
+                for _ in range(rnd.randint(1, 3)):
+                    self.mention(t, self.pick_user())
+            if rnd.random() < self.favourites:
+                t['favorite_count'] = int(rnd.paretovariate(1.5))
+
+            if 'quoted_status' not in t:
+                if len(self.recent_tweets) < RECENT_TWEETS:
+                    self.recent_tweets.append(t)
+                else:
+                    self.recent_tweets[rnd.randrange(RECENT_TWEETS)] = t
+            yield t
+
+
+def standard_layout(t):
+    """:return The generated tweet t as a dictionary in the standard Twitter API layout"""
+    user = t['user']
+    tweet = {
+        'id': t['id'],
+        'id_str': str(t['id']),
+        'created_at': t['created_at'].strftime('%a %b %d %H:%M:%S +0000 %Y'),
+        'user': {
+            'id': user['id'],
+            'id_str': str(user['id']),
+            'name': user['name'],
+            'screen_name': user['screen_name'],
+            'followers_count': user['followers_count'],
+            'friends_count': user['friends_count'],
+            'statuses_count': user['statuses_count']
+        },
+        'text': t['text'],
+        'favorited': False,
+        'favorite_count': t['favorite_count'],
+        'in_reply_to_user_id': t['in_reply_to_user_id'],
+        'in_reply_to_user_id_str': str(t['in_reply_to_user_id']) if t['in_reply_to_user_id'] else None,
+        'in_reply_to_status_id': t['in_reply_to_status_id'],
+        'in_reply_to_status_id_str': str(t['in_reply_to_status_id']) if t['in_reply_to_status_id'] else None,
+        'entities': {
+            'user_mentions': [{'id': m['id'], 'id_str': str(m['id']), 'name': m['name'],
+                               'screen_name': m['screen_name']} for m in t['mentions']]
+        }
+    }
+    if 'retweeted_status' in t:
+        tweet['retweeted_status'] = standard_layout(t['retweeted_status'])
+    if 'quoted_status' in t:
+        tweet['quoted_status_id_str'] = str(t['quoted_status']['id'])
+        tweet['quoted_status'] = standard_layout(t['quoted_status'])
+    return tweet
+
+
+def twitter4j_layout(t):
+    """:return The generated tweet t as a dictionary in the layout of Twitter4J's serialised Status objects"""
+    user = t['user']
+    return {
+        'id': t['id'],
+        'createdAt': t['created_at'].strftime('%Y-%m-%dT%H:%M:%S+0000'),
+        'user': {
+            'id': user['id'],
+            'name': user['name'],
+            'screenName': user['screen_name'],
+            'followersCount': user['followers_count'],
+            'friendsCount': user['friends_count'],
+            'statusesCount': user['statuses_count']
+        },
+        'text': t['text'],
+        'retweet': 'retweeted_status' in t,
+        'favorited': False,
+        'favoriteCount': t['favorite_count'],
+        'inReplyToUserId': t['in_reply_to_user_id'] or -1,
+        'inReplyToStatusId': t['in_reply_to_status_id'] or -1,
+        'userMentionEntities': [{'id': m['id'], 'name': m['name'], 'screenName': m['screen_name'],
+                                 'text': m['screen_name']} for m in t['mentions']],
+        'retweetedStatus': twitter4j_layout(t['retweeted_status']) if 'retweeted_status' in t else None,
+        'quotedStatus': twitter4j_layout(t['quoted_status']) if 'quoted_status' in t else None
+    }
+
+
+def open_output_file(path):
+    """Opens a file for writing text, compressing it according to its extension (.gz, .bz2 or .xz)"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'wt', encoding='utf-8')
+    if path.endswith('.xz'):
+        return lzma.open(path, 'wt', encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+
+def write_tweets(f, num_tweets, layout='standard', num_users=None, rate=None, **kwargs):
+    """
+    Writes synthetic tweets to a stream, one JSON object per line, e.g. to stand in for a collector.
+    :param f: The text stream to write to
+    :param num_tweets: How many tweets to write
+    :param layout: One of LAYOUTS
+    :param num_users: How many users could appear (default: a tenth as many as tweets, and at least 100)
+    :param rate: How many tweets to write per second, at most (default: as many as possible)
+    :param kwargs: The seed and proportions of each kind of tweet, see CorpusGenerator
+    """
+    if layout not in LAYOUTS:
+        raise ValueError("Unknown layout '%s', expected one of %s" % (layout, ', '.join(LAYOUTS)))
+    to_layout = standard_layout if layout == 'standard' else twitter4j_layout
+    generator = CorpusGenerator(num_users or max(100, num_tweets // 10), **kwargs)
+    started = time.perf_counter()
+    for n, t in enumerate(generator.generate(num_tweets)):
+        f.write(json.dumps(to_layout(t), separators=(',', ':')))
+        f.write('\n')
+        if rate:
+            ahead = started + (n + 1) / rate - time.perf_counter()
+            if ahead > 0:
+                f.flush()
+                time.sleep(ahead)
+    f.flush()
+
+
+def write_corpus(path, num_tweets, layout='standard', num_users=None, **kwargs):
+    """
+    Writes a synthetic corpus of tweets to a file, one JSON object per line.
+    :param path: The file to write, compressed if its name ends in .gz, .bz2 or .xz
+    :param num_tweets: How many tweets to write
+    :param layout: One of LAYOUTS
+    :param num_users: How many users could appear (default: a tenth as many as tweets, and at least 100)
+    :param kwargs: The seed and proportions of each kind of tweet, see CorpusGenerator
+    """
+    with open_output_file(path) as f:
+        write_tweets(f, num_tweets, layout, num_users, **kwargs)
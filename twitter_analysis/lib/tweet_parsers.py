@@ -1,106 +1,213 @@
-class StandardParser:
-    """
-    Given a dictionary populated from parsing the JSON of tweets provided by the
-    Twitter API, this parser will interrogate the dictionary using the appropriate
-    field/key names.
-    """
-
-    def is_a_retweet(self, t):
-        return 'retweeted_status' in t
-
-    def is_favourited(self, t):
-        return t['favorited'] == 'true' or int(t['favorite_count']) > 0
-
-    def is_a_quote(self, t):
-        return 'quoted_status' in t
-
-    def has_mentions(self, t):
-        return 'entities' in t and 'user_mentions' in t['entities']
-
-    def get_retweeted_status(self, t):
-        return t['retweeted_status']
-
-    def get_quoted_status(self, t):
-        return t['quoted_status']
-
-    def get_mentions(self, t):
-        return t['entities']['user_mentions']
-
-    def get_id(self, t):
-        return t['id_str']
+import datetime
 
-    def get_screen_name(self, screen_name_owner):
-        return screen_name_owner['screen_name']
+from operator import itemgetter
 
-    def get_followers_count(self, t):
-        return t['user']['followers_count']
 
-    def get_friends_count(self, t):
-        return t['user']['friends_count']
-
-    def get_statuses_count(self, t):
-        return t['user']['statuses_count']
-
-    def get_favourite_count(self, t):
-        return t['favorite_count']
-
-    def get_in_reply_to_user_id(self, t):
-        return t['in_reply_to_user_id_str']
-
-    def get_in_reply_to_status_id(self, t):
-        return t['in_reply_to_status_id_str']
-
-
-class Twitter4JParser(StandardParser):
+class TweetRecord:
     """
-    Given a dictionary populated from parsing the JSON of tweets serialised by using
-    the Twitter4J Java library (when, say, the Jackson JSON library is used to serialise
-    the Tweet JavaBeans that Twitter4J uses), this parser will interrogate the
-    dictionary using the expected field/key names (which differ from the standard
-    Twitter API ones).
+    A compact projection of a tweet, holding only the fields the analysis reads. Embedded
+    retweeted and quoted statuses are themselves TweetRecords (or None). Mentions are a tuple
+    of (user_id, screen_name) pairs. IDs are held as strings whatever the source format. The
+    creation time is held as it appears in the source (see parse_created_at()), as it's rarely needed,
+    and the format is that of the source, one of FORMATS.
     """
+    __slots__ = ('id', 'user_id', 'screen_name', 'followers_count', 'friends_count', 'statuses_count',
+                 'favourited', 'favourite_count', 'in_reply_to_user_id', 'in_reply_to_status_id',
+                 'mentions', 'retweeted_status', 'quoted_status', 'text', 'created_at', 'format')
+
+    def __init__(self, id, user_id, screen_name, followers_count, friends_count, statuses_count,
+                 favourited, favourite_count, in_reply_to_user_id, in_reply_to_status_id,
+                 mentions, retweeted_status, quoted_status, text, created_at=None, format=None):
+        self.id = id
+        self.user_id = user_id
+        self.screen_name = screen_name
+        self.followers_count = followers_count
+        self.friends_count = friends_count
+        self.statuses_count = statuses_count
+        self.favourited = favourited
+        self.favourite_count = favourite_count
+        self.in_reply_to_user_id = in_reply_to_user_id
+        self.in_reply_to_status_id = in_reply_to_status_id
+        self.mentions = mentions
+        self.retweeted_status = retweeted_status
+        self.quoted_status = quoted_status
+        self.text = text
+        self.created_at = created_at
+        self.format = format
+
+
+def id_str(v):
+    return v if v is None or isinstance(v, str) else str(v)
+
+
+def parse_created_at(created_at):
+    """
+    Parses the creation time of a tweet, as found in either the standard Twitter API format
+    ('Mon Aug 15 09:30:00 +0000 2016') or Twitter4J's ('2016-08-15T09:30:00+0000', or
+    milliseconds since the epoch).
+    :return Seconds since the epoch, or None if the time is missing
+    """
+    if created_at is None:
+        return None
+    if isinstance(created_at, (int, float)):
+        return created_at / 1000.0
+    if created_at[4:5] == '-':
+        return datetime.datetime.strptime(created_at, '%Y-%m-%dT%H:%M:%S%z').timestamp()
+    return datetime.datetime.strptime(created_at, '%a %b %d %H:%M:%S %z %Y').timestamp()
+
+
+FORMATS = ['standard', 'twitter4j']
+
+# The keys under which each format keeps the fields of a TweetRecord: those of the standard Twitter
+# API, and those of the Tweet JavaBeans of the Twitter4J Java library when serialised (with, say,
+# the Jackson JSON library). The user's fields are within the 'user' object, as are those of each
+# mention (with the same keys), and mentions are found by following a path of keys. The standard
+# format holds IDs as strings, while Twitter4J's are numbers.
+FIELD_MAPS = {
+    'standard': {
+        'id': 'id_str',
+        'user_id': 'id_str',
+        'screen_name': 'screen_name',
+        'followers_count': 'followers_count',
+        'friends_count': 'friends_count',
+        'statuses_count': 'statuses_count',
+        'favourited': 'favorited',
+        'favourite_count': 'favorite_count',
+        'in_reply_to_user_id': 'in_reply_to_user_id_str',
+        'in_reply_to_status_id': 'in_reply_to_status_id_str',
+        'mentions': ('entities', 'user_mentions'),
+        'retweeted_status': 'retweeted_status',
+        'quoted_status': 'quoted_status',
+        'created_at': 'created_at',
+        'string_ids': True
+    },
+    'twitter4j': {
+        'id': 'id',
+        'user_id': 'id',
+        'screen_name': 'screenName',
+        'followers_count': 'followersCount',
+        'friends_count': 'friendsCount',
+        'statuses_count': 'statusesCount',
+        'favourited': 'favorited',
+        'favourite_count': 'favoriteCount',
+        'in_reply_to_user_id': 'inReplyToUserId',
+        'in_reply_to_status_id': 'inReplyToStatusId',
+        'mentions': ('userMentionEntities',),
+        'retweeted_status': 'retweetedStatus',
+        'quoted_status': 'quotedStatus',
+        'created_at': 'createdAt',
+        'string_ids': False
+    }
+}
+
+
+def make_extractor(format):
+    """
+    Compiles a function which projects the fields of interest out of a tweet dictionary of the
+    given format (and any embedded retweeted or quoted status) into a TweetRecord, so the
+    dictionary itself can be discarded. The fields each tweet must have are fetched together with
+    itemgetters, so a tweet of another format fails with a KeyError.
+    :param format: One of FORMATS
+    :return The function, taking a tweet dictionary and returning a TweetRecord
+    """
+    fields = FIELD_MAPS[format]
+    get_tweet_fields = itemgetter(fields['id'], fields['favourited'], fields['favourite_count'],
+                                  fields['in_reply_to_user_id'], 'user')
+    get_user_fields = itemgetter(fields['user_id'], fields['screen_name'], fields['followers_count'],
+                                 fields['friends_count'], fields['statuses_count'])
+    get_mention = itemgetter(fields['user_id'], fields['screen_name'])
+    mentions_path = fields['mentions']
+    in_reply_to_status_id_key = fields['in_reply_to_status_id']
+    retweeted_status_key = fields['retweeted_status']
+    quoted_status_key = fields['quoted_status']
+    created_at_key = fields['created_at']
+    string_ids = fields['string_ids']
+
+    def extract(t):
+        tweet_id, favourited, favourite_count, in_reply_to_user_id, user = get_tweet_fields(t)
+        user_id, screen_name, followers_count, friends_count, statuses_count = get_user_fields(user)
+        mentions = t
+        for key in mentions_path:
+            mentions = mentions.get(key)
+            if not mentions:
+                break
+        if mentions:
+            mentions = tuple(map(get_mention, mentions))
+            if not string_ids:
+                mentions = tuple((str(i), sn) for i, sn in mentions)
+        else:
+            mentions = ()
+        in_reply_to_status_id = t.get(in_reply_to_status_id_key)
+        if not string_ids:
+            tweet_id = str(tweet_id)
+            user_id = str(user_id)
+            in_reply_to_user_id = id_str(in_reply_to_user_id)
+            in_reply_to_status_id = id_str(in_reply_to_status_id)
+        retweeted_status = t.get(retweeted_status_key)
+        quoted_status = t.get(quoted_status_key)
+        return TweetRecord(
+            tweet_id,
+            user_id,
+            screen_name,
+            followers_count,
+            friends_count,
+            statuses_count,
+            favourited == 'true' or int(favourite_count) > 0,
+            favourite_count,
+            in_reply_to_user_id,
+            in_reply_to_status_id,
+            mentions,
+            extract(retweeted_status) if retweeted_status else None,
+            extract(quoted_status) if quoted_status else None,
+            t.get('text', ''),
+            t.get(created_at_key),
+            format
+        )
+
+    return extract
+
+
+EXTRACTORS = dict((format, make_extractor(format)) for format in FORMATS)
+
+
+def detect_format(t):
+    """:return The format of a tweet dictionary, one of FORMATS"""
+    # is this the standard Twitter format or a known (Twitter4j serialised) alt've?
+    return 'standard' if 'id_str' in t else 'twitter4j'
+
+
+def to_record(t, format=None):
+    """
+    Projects a tweet dictionary, in either the standard Twitter API format or the Twitter4J
+    serialised format, into a TweetRecord.
+    :param t: The tweet dictionary
+    :param format: The format of the tweet, one of FORMATS (default: detect it)
+    """
+    return EXTRACTORS[format or detect_format(t)](t)
 
-    def is_a_retweet(self, t):
-        return 'retweetedStatus' in t and t['retweetedStatus']
-
-    def is_favourited(self, t):
-        return t['favorited'] == 'true' or int(t['favoriteCount']) > 0
-
-    def is_a_quote(self, t):
-        return 'quotedStatus' in t and t['quotedStatus']
-
-    def has_mentions(self, t):
-        return 'userMentionEntities' in t and t['userMentionEntities']
-
-    def get_retweeted_status(self, t):
-        return t['retweetedStatus']
-
-    def get_quoted_status(self, t):
-        return t['quotedStatus']
-
-    def get_mentions(self, t):
-        return t['userMentionEntities']
-
-    def get_id(self, t):
-        return t['id']
-
-    def get_screen_name(self, screen_name_owner):
-        return screen_name_owner['screenName']
-
-    def get_followers_count(self, t):
-        return t['user']['followersCount']
-
-    def get_friends_count(self, t):
-        return t['user']['friendsCount']
-
-    def get_statuses_count(self, t):
-        return t['user']['statusesCount']
-
-    def get_favourite_count(self, t):
-        return t['favoriteCount']
-
-    def get_in_reply_to_user_id(self, t):
-        return t['inReplyToUserId']
 
-    def get_in_reply_to_status_id(self, t):
-        return t['inReplyToStatusId']
+class RecordExtractor:
+    """
+    Projects a stream of tweet dictionaries into TweetRecords. The format is detected from the
+    first tweet, and then only again when a tweet doesn't fit the format of the one before, so
+    a stream in one format (or in runs of each, as when files are read one after another) is
+    projected without examining each tweet to tell which it is.
+    """
+    def __init__(self):
+        self.format = None
+        self.extract = None
+        self.format_counts = dict((format, 0) for format in FORMATS)
+
+    def __call__(self, t):
+        if self.extract is not None:
+            try:
+                record = self.extract(t)
+                self.format_counts[self.format] += 1
+                return record
+            except KeyError:
+                pass
+        self.format = detect_format(t)
+        self.extract = EXTRACTORS[self.format]
+        record = self.extract(t)
+        self.format_counts[self.format] += 1
+        return record
@@ -0,0 +1,282 @@
+import bz2
+import datetime
+import glob
+import gzip
+import lzma
+import os
+import queue
+import sys
+import threading
+
+from .decoders import get_decoder
+from .tweet_parsers import RecordExtractor
+
+
+# leading bytes identifying each supported compression format
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bzip2'),
+    (b'\xfd7zXZ\x00', 'xz')
+]
+
+LINES_PER_BATCH = 1000  # lines handed from a reader thread to the analysis at a time
+
+_report_lock = threading.Lock()  # keeps progress lines from concurrent readers from interleaving
+
+
+def timestamp():
+    now = datetime.datetime.now()
+    return "%d-%02d-%02d %02d:%02d:%02d" % (now.year, now.month, now.day, now.hour, now.minute, now.second)
+
+
+def report(msg):
+    # one write per line, so lines from concurrent threads or processes don't run together
+    with _report_lock:
+        sys.stdout.write("[%s] %s\n" % (timestamp(), msg))
+        sys.stdout.flush()
+
+
+def detect_compression(path):
+    """
+    Sniffs the first few bytes of a file to determine how it is compressed, regardless of its extension.
+    :return 'gzip', 'bzip2', 'xz', or None if the file isn't compressed in a recognised format
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    for prefix, compression in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            return compression
+    return None
+
+
+def open_tweets_file(path):
+    """
+    Opens a file of tweets for binary reading, transparently decompressing it if need be.
+    :return A tuple of (raw_file, stream), where raw_file is the underlying file (useful for
+    tracking progress through the compressed bytes) and stream yields the decompressed lines
+    """
+    raw = open(path, 'rb')
+    compression = detect_compression(path)
+    if compression == 'gzip':
+        return raw, gzip.GzipFile(fileobj=raw, mode='rb')
+    if compression == 'bzip2':
+        return raw, bz2.BZ2File(raw, mode='rb')
+    if compression == 'xz':
+        return raw, lzma.LZMAFile(raw, mode='rb')
+    return raw, raw
+
+
+def expand_input_paths(paths):
+    """
+    Expands the given paths into a list of files to read. Each path may be a plain file, a glob
+    pattern (e.g. 'data/2016-08-*.json.gz') or a directory, from which all (non-hidden) files are read.
+    :param paths: A path or list of paths
+    :return The sorted list of matching file paths
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files.extend(sorted(
+                os.path.join(p, f) for f in os.listdir(p)
+                if not f.startswith('.') and os.path.isfile(os.path.join(p, f))
+            ))
+        elif any(c in p for c in '*?['):
+            matches = sorted(m for m in glob.glob(p) if os.path.isfile(m))
+            if not matches:
+                raise ValueError("No files match %s" % p)
+            files.extend(matches)
+        else:
+            files.append(p)
+    return files
+
+
+def read_lines(tweets_file, progress_steps=10):
+    """
+    Lazily reads the non-blank lines of a single (possibly compressed) file of tweets, reporting
+    progress through the file as it goes.
+    :param tweets_file: Path to the file of tweets
+    :param progress_steps: How many progress reports to print over the size of the file (0 = none)
+    :return A generator of lines, as bytes
+    """
+    file_size = os.path.getsize(tweets_file)
+    report_every = file_size / float(progress_steps) if progress_steps and file_size else 0
+    next_report = report_every
+
+    count = 0
+    raw, stream = open_tweets_file(tweets_file)
+    with raw, stream:
+        for l in stream:
+            l = l.strip()
+            if not l:
+                continue
+            count += 1
+            if report_every and raw.tell() >= next_report:
+                report("%s: read %d lines (%d%%)..." %
+                       (tweets_file, count, min(100, 100 * raw.tell() // file_size)))
+                while next_report <= raw.tell():
+                    next_report += report_every
+            yield l
+
+    if progress_steps:
+        report("%s: finished after %d lines" % (tweets_file, count))
+
+
+def read_line_range(tweets_file, start, end, progress_steps=10):
+    """
+    Lazily reads the non-blank lines of an uncompressed file of tweets which start within the
+    byte range [start, end), so a file can be split between several readers on line boundaries.
+    :param tweets_file: Path to the file of tweets
+    :param start: Offset of the first byte of the range
+    :param end: Offset just past the last byte of the range
+    :param progress_steps: How many progress reports to print over the range (0 = none)
+    :return A generator of lines, as bytes
+    """
+    name = "%s[%d:%d]" % (tweets_file, start, end)
+    report_every = (end - start) / float(progress_steps) if progress_steps and end > start else 0
+    next_report = start + report_every
+
+    count = 0
+    with open(tweets_file, 'rb') as f:
+        if start > 0:
+            # the line straddling the start of the range belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            l = f.readline()
+            if not l:
+                break
+            l = l.strip()
+            if not l:
+                continue
+            count += 1
+            if report_every and f.tell() >= next_report:
+                report("%s: read %d lines (%d%%)..." %
+                       (name, count, min(100, 100 * (f.tell() - start) // (end - start))))
+                while next_report <= f.tell():
+                    next_report += report_every
+            yield l
+
+    if progress_steps:
+        report("%s: finished after %d lines" % (name, count))
+
+
+def read_lines_concurrently(tweets_files, readers, progress_steps=10):
+    """
+    Reads lines from several files at once, with up to `readers` threads each reading and
+    decompressing a file (decompression releases the GIL, so the threads genuinely overlap).
+    Lines are handed over in batches through a bounded queue, so fast readers wait for the
+    analysis to catch up rather than buffering whole files. Lines from different files interleave.
+    :return A generator of lines, as bytes
+    """
+    pending = queue.Queue()
+    for path in tweets_files:
+        pending.put(path)
+
+    batches = queue.Queue(maxsize=readers * 4)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def reader():
+        try:
+            while not stop.is_set():
+                try:
+                    path = pending.get_nowait()
+                except queue.Empty:
+                    break
+                batch = []
+                for l in read_lines(path, progress_steps):
+                    batch.append(l)
+                    if len(batch) >= LINES_PER_BATCH:
+                        put(batch)
+                        batch = []
+                        if stop.is_set():
+                            break
+                if batch:
+                    put(batch)
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(min(readers, len(tweets_files)))]
+    for t in threads:
+        t.start()
+
+    try:
+        finished = 0
+        while finished < len(threads):
+            item = batches.get()
+            if item is done:
+                finished += 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                for l in item:
+                    yield l
+    finally:
+        stop.set()  # unblocks any readers still waiting to hand over a batch
+
+
+def decode_tweets(lines, decoder='auto'):
+    """
+    Decodes lines of JSON into compact TweetRecords.
+    :param lines: An iterable of lines, each holding one tweet as a JSON object
+    :param decoder: Which JSON library to decode with, see get_decoder()
+    :return A generator of TweetRecords
+    """
+    _, loads = get_decoder(decoder)
+    extract = RecordExtractor()
+    for l in lines:
+        yield extract(loads(l))
+
+
+def read_tweets(tweets_files, progress_steps=10, readers=1, decoder='auto', instrumentation=None, dedup=None):
+    """
+    Lazily reads tweets, one JSON object per line, from one or more (possibly compressed) files,
+    yielding a compact TweetRecord for each in turn so that only a few tweets are held in memory
+    at a time.
+    :param tweets_files: A path or list of paths, globs or directories, see expand_input_paths()
+    :param progress_steps: How many progress reports to print over the size of each file (0 = none)
+    :param readers: How many files to read and decompress concurrently
+    :param decoder: Which JSON library to decode with, see get_decoder()
+    :param instrumentation: An Instrumentation to time reading and decoding with (default: none)
+    :param dedup: A Deduplicator to drop tweets seen before with, in any file (default: keep them)
+    :return A generator of TweetRecords
+    """
+    files = expand_input_paths(tweets_files)
+    if readers > 1 and len(files) > 1:
+        lines = read_lines_concurrently(files, readers, progress_steps)
+    else:
+        lines = (l for f in files for l in read_lines(f, progress_steps))
+
+    decoder_name, loads = get_decoder(decoder)
+    if instrumentation is not None:
+        lines = instrumentation.timed(lines, 'read')
+    extract = RecordExtractor()
+    if dedup is not None:
+        records = dedup.decode_unique(lines, lambda l: extract(loads(l)))
+    else:
+        records = (extract(loads(l)) for l in lines)
+    if instrumentation is not None:
+        records = instrumentation.timed(records, 'decode')
+    count = 0
+    for record in records:
+        count += 1
+        yield record
+
+    formats = ', '.join('%d %s' % (n, f) for f, n in extract.format_counts.items() if n)
+    report("Read %d tweets from %d file(s) (decoded with %s%s)" %
+           (count, len(files), decoder_name, '; ' + formats if formats else ''))
+    if dedup is not None:
+        report("Dropped %d duplicate tweets" % dedup.num_duplicates)
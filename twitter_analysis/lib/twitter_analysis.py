@@ -1,10 +1,33 @@
+import sys
 import unicodedata
 
-from .tweet_parsers import StandardParser, Twitter4JParser
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
+from .batch_metrics import batch_metrics
+from .d_rank import Convergence, Extrapolator, INTERESTING_DELTA, parallel_d_rank, sparse_d_rank
+from .instrumentation import Instrumentation
+from .ranking import MetricTable, RANKED_METRICS, top
+from .interactions import InteractionStore, NO_TWEET, KUDOS_KINDS, POST, RETWEET, QUOTE, REPLY, MENTION
+from .tweet_parsers import TweetRecord, to_record
+
+from functools import partial
 from math import log
 
 
+# how each ranked metric is reported: (metric, heading, line format of each account)
+REPORTED_METRICS = [
+    ('h_index', "H-Index (h)", "  @%s : %4d"),
+    ('int_ratio', "Interactor Ratio (Ir)", "  @%s : %.2f"),
+    ('rm_ratio', "Retweet/Mention(Reply) Ratio (RMr)", "  @%s : %.2f"),
+    ('snp', "Social Networking Potential (Ir' * 0.25 + RMr' * 0.75)", "  @%s : %.2f"),
+    ('mixture', "Mixture Model Ratio ((h' + Ir' + RMr') / 3)", "  @%s : %.2f"),
+    ('pa_ratio', "Post/Activity Ratio (PAr)", "  @%s : %.2f")
+]
+
+
 def get_or(m, k, v):
     """
     Checks map m for an entry under key k, adding it with value v if it's missing,
@@ -20,18 +43,33 @@ def update_count(m, k, v):
     m[k] = max(v, get_or(m, k, v))
 
 
-def min_max(l):
-    """Convenience method to return the min and max of a list in one call"""
-    return min(l), max(l)
+def h_index_of(interaction_counts):
+    """
+    :param interaction_counts: The number of interactions with each of a user's tweets
+    :return The largest h such that h of the counts are at least h
+    """
+    sorted_interaction_counts = sorted(interaction_counts)
+
+    h_index = 0
+    i = len(sorted_interaction_counts) - 1
+    while i >= 0:
+        num_interactors_for_this_tweet = sorted_interaction_counts[i]
+        if num_interactors_for_this_tweet < h_index + 1:
+            break
+        h_index += 1
+        i -= 1
+    return h_index
 
 
-def normalise(v, min_v, max_v):
-    """Normalises v between min_v and max_v to belong in (0,1)"""
-    # norm = v / float(max_v)  # assumes min_v = 0
-    norm = (v - min_v) / float(max_v - min_v)
-    if norm > 1.0:
-        print("[WARN] normalise(%f, %f, %f)" % (v, min_v, max_v))
-    return norm
+def pa_ratio_of(retweet_count, quote_count, reply_count, fav_count, tweet_count,
+                rt_weight=1, qu_weight=2, re_weight=3, fav_weight=1):
+    """:return The Post/Activity ratio of the given counts, see Kudos.pa_ratio()"""
+    rt_part = rt_weight * log(retweet_count + 1)
+    qu_part = qu_weight * log(quote_count + 1)
+    re_part = re_weight * log(reply_count + 1)
+    fav_part = fav_weight * log(fav_count + 1)
+
+    return (rt_part + qu_part + re_part + fav_part) / float(tweet_count) if tweet_count else 0
 
 
 def make_safe(text):
@@ -41,29 +79,30 @@ def make_safe(text):
 
 class Kudos:
     """
-    Structure to capture kudos of an individual
-    data.'profile'.{screen_name,followers_count,friends_count,total_tweet_count,corpus_tweet_count}
+    The kudos of an individual user, calculated from the rows of an InteractionStore that
+    target them. The same information is available in its original nested form via `data`.
+    data.'profile'.{screen_name,followers_count,friends_count,total_tweet_count,corpus_tweet_set}
         .'my_quoted_tweets'.quoted_tweet_id.[(quoting_user, quote_tweet_id)]
         .'my_retweets'.retweeted_tweet_id.[retweeting_user]
-        .'mentions_of_me'.mentioning_user.[mentioning_tweet]
+        .'mentions_of_me'.mentioning_user.{mentioning_tweet}
         .'replies_to'.original_tweet_id.replying_user_id.[reply_tweet_id]
         .'replies_from'.replying_user_id.[(original_tweet_id, reply_tweet_id)]
         .'favourited'.favourited_tweet_id.count
     """
-    def __init__(self):
-        self.data = {
-            'profile': {},
-            'my_retweets': {},
-            'my_quoted_tweets': {},
-            'mentions_of_me': {},
-            'replies_to': {},
-            'replies_from': {},
-            'favourited': {}
-        }
+    def __init__(self, store, user):
+        self.store = store
+        self.user = user
         self.cached_h_index = -1
         self.cached_int_ratio = -1
         self.cached_rm_ratio = -1
         self.cached_pa_ratio = -1
+        self.cached_pa_weights = None  # the weights cached_pa_ratio was calculated with
+        self.cached_pa_counts = None   # the counts PAr is calculated from, whatever the weights
+
+    def rows(self, kinds=KUDOS_KINDS):
+        """:return The numbers of the store rows of the given kinds which target this user"""
+        kind = self.store.kind
+        return [r for r in self.store.rows_targeting(self.user) if kind[r] & kinds]
 
     def h_index(self):
         """
@@ -73,21 +112,16 @@ class Kudos:
         if self.cached_h_index != -1:
             return self.cached_h_index
 
-        # turn the retweets & quoted tweets into a list of tuples (tweet_id, list of tweeters)
-        interactions = list(self.data['my_retweets'].items()) + list(self.data['my_quoted_tweets'].items())
-
-        sorted_interactions_list = sorted(interactions, key=lambda t: len(t[1]))  # operator.itemgetter(1))
+        # count the retweets & quotes of each tweet (separately, as they're separate interactions)
+        retweets = {}
+        quotes = {}
+        kind = self.store.kind
+        tweet = self.store.tweet
+        for r in self.rows(RETWEET | QUOTE):
+            counts = retweets if kind[r] & RETWEET else quotes
+            counts[tweet[r]] = counts.get(tweet[r], 0) + 1
 
-        h_index = 0
-        i = len(sorted_interactions_list) - 1
-        while i >= 0:
-            num_interactors_for_this_tweet = len(sorted_interactions_list[i][1])
-            if num_interactors_for_this_tweet < h_index + 1:
-                break
-            h_index += 1
-            i -= 1
-
-        self.cached_h_index = h_index
+        self.cached_h_index = h_index_of(list(retweets.values()) + list(quotes.values()))
         return self.cached_h_index
 
     def int_ratio(self):
@@ -98,34 +132,13 @@ class Kudos:
         if self.cached_int_ratio != -1:
             return self.cached_int_ratio
 
-        unique_retweeters = set()
-        if 'my_retweets' in self.data:
-            for retweeters in self.data['my_retweets']:
-                unique_retweeters = unique_retweeters.union(self.data['my_retweets'][retweeters])
-
-        # print("Retweeters of @%s: %s" % (self.data['profile']['screen_name'], unique_retweeters))
-        # pprint("Mentions of @%s: %s" % (self.data['profile']['screen_name'], self.data['mentions_of_me']))
-        # pprint("Replies to of @%s: %s" % (self.data['profile']['screen_name'], self.data['replies_to']))
-        # pprint("Replies from of @%s: %s" % (self.data['profile']['screen_name'], self.data['replies_from']))
-        unique_mentioners = set().union(self.data['mentions_of_me'].keys()).union(self.data['replies_from'].keys())
-        # print("Mentions of @%s: %s" % (self.data['profile']['screen_name'], unique_mentioners))
-
-        unique_quoters = set()
-        if 'my_quoted_tweets' in self.data:
-            for quoted_tweet_id in self.data['my_quoted_tweets']:
-                for quotes_of_that_tweet in self.data['my_quoted_tweets'][quoted_tweet_id]:
-                    unique_quoters.add(quotes_of_that_tweet[0])  # value is (user, quoting tweet ID)
-
-        followers_count = get_or(self.data['profile'], 'followers_count', 0)
-
-        # sn = self.data['profile']['screen_name']
-        # pprint("@%s: unique_retweeters: %s" % (sn, unique_retweeters))
-        # pprint("@%s: unique_mentioners: %s" % (sn, unique_mentioners))
-        # pprint("@%s: unique_quoters:    %s" % (sn, unique_quoters))
-
-        self.cached_int_ratio = \
-            len(set().union(unique_retweeters).union(unique_mentioners).union(unique_quoters)) / \
-            float(followers_count) if followers_count else 0
+        # retweeters, quoters, mentioners and repliers
+        source = self.store.source
+        unique_interactors = set(source[r] for r in self.rows(RETWEET | QUOTE | REPLY | MENTION))
+
+        followers_count = self.store.followers_count[self.user]
+
+        self.cached_int_ratio = len(unique_interactors) / float(followers_count) if followers_count else 0
         return self.cached_int_ratio
 
     def pa_ratio(self, rt_weight=1, qu_weight=2, re_weight=3, fav_weight=1):
@@ -140,42 +153,40 @@ class Kudos:
         :return The ratio of activities (retweets, quotes, replies, favourite counts) of this user to the number of
         tweets they have posted in the current corpus
         """
-        if self.cached_pa_ratio != -1:
+        pa_weights = (rt_weight, qu_weight, re_weight, fav_weight)
+        if self.cached_pa_ratio != -1 and self.cached_pa_weights == pa_weights:
             return self.cached_pa_ratio
 
-        # print("PA calc for @%s" % self.data['profile']['screen_name'])
+        self.cached_pa_ratio = pa_ratio_of(*self.pa_counts(), *pa_weights)
+        self.cached_pa_weights = pa_weights
+        return self.cached_pa_ratio
 
-        retweet_count = 0
-        for retweeted_tweet_id in self.data['my_retweets']:
-            # print("RTs of {0}: {1}".format(retweeted_tweet_id, len(self.data['my_retweets'][retweeted_tweet_id])))
-            retweet_count += len(self.data['my_retweets'][retweeted_tweet_id])
+    def pa_counts(self):
+        """
+        :return A tuple of the counts the Post/Activity ratio is calculated from, (|retweets|, |quotes|,
+        |replies|, |favourites|, |tweets posted in the corpus|), so it can be recalculated with other weights
+        """
+        if self.cached_pa_counts is not None:
+            return self.cached_pa_counts
 
+        retweet_count = 0
         quote_count = 0
-        for quoted_tweet_id in self.data['my_quoted_tweets']:
-            # print("Quote of {0} is {1}".format(quoted_tweet_id, len(self.data['my_quoted_tweets'][quoted_tweet_id])))
-            quote_count += len(self.data['my_quoted_tweets'][quoted_tweet_id])
-
         reply_count = 0
-        for replied_to_tweet_id in self.data['replies_to']:
-            for replier in self.data['replies_to'][replied_to_tweet_id]:
-                # print("RE to %s from %s: %s times" %
-                #       (replied_to_tweet_id, replier, len(self.data['replies_to'][replied_to_tweet_id][replier])))
-                reply_count += len(self.data['replies_to'][replied_to_tweet_id][replier])
-
-        fav_count = 0
-        for faved_tweet_id in self.data['favourited']:
-            # print("%s faved %s times" % (faved_tweet_id, self.data['favourited'][faved_tweet_id]))
-            fav_count += self.data['favourited'][faved_tweet_id]
+        kind = self.store.kind
+        for r in self.rows(RETWEET | QUOTE | REPLY):
+            if kind[r] & RETWEET:
+                retweet_count += 1
+            elif kind[r] & QUOTE:
+                quote_count += 1
+            else:
+                reply_count += 1
+
+        favourites = self.store.favourites
+        fav_count = sum(favourites.get(t, 0) for t in self.corpus_tweet_set())
 
         tweet_count = self.get_corpus_tweet_count()
-        rt_part = rt_weight * log(retweet_count + 1)
-        qu_part = qu_weight * log(quote_count + 1)
-        re_part = re_weight * log(reply_count + 1)
-        fav_part = fav_weight * log(fav_count + 1)
-
-        self.cached_pa_ratio = (rt_part + qu_part + re_part + fav_part) / float(tweet_count) if tweet_count else 0
-
-        return self.cached_pa_ratio
+        self.cached_pa_counts = (retweet_count, quote_count, reply_count, fav_count, tweet_count)
+        return self.cached_pa_counts
 
     def rm_ratio(self):
         """
@@ -187,76 +198,69 @@ class Kudos:
         if self.cached_rm_ratio != -1:
             return self.cached_rm_ratio
 
-        # print("RMR calc for @%s" % self.data['profile']['screen_name'])
-
-        retweeted_tweet_ids = self.data['my_retweets'].keys()    # which tweets were retweeted?
-        # print("  retweeted_tweet_ids: %s" % retweeted_tweet_ids)
-        quoted_tweet_ids = self.data['my_quoted_tweets'].keys()  # which tweets were quoted?
-        quoting_tweet_ids = set()
-        for quoted_tweet_id in quoted_tweet_ids:
-            for quoted_tweet in self.data['my_quoted_tweets'][quoted_tweet_id]:
-                quoting_tweet_ids.add(quoted_tweet[1])  # value is (quoting user, quoting tweet ID)
-        # print("  quoted_tweet_ids: %s" % self.data['my_quoted_tweets'])
         # this is the number of unique tweets that inspired a quote and/or an RT
-        inspiring_tweets_count = len(set(retweeted_tweet_ids).union(quoted_tweet_ids))
+        tweet = self.store.tweet
+        inspiring_tweets_count = len(set(tweet[r] for r in self.rows(RETWEET | QUOTE)))
 
         # Only consider mentions that are in response to a tweet
-        reply_count = len(self.data['replies_to'])
+        reply_count = len(set(tweet[r] for r in self.rows(REPLY)))
 
         tweet_count = self.get_corpus_tweet_count()
-        # print("Tweet count for @%s is %d" % (self.data['profile']['screen_name'], tweet_count))
-        # print("  %s" % self.data['profile']['corpus_tweet_set'])
-        # print("Unique inspiring tweets count is %d" % inspiring_tweets_count)
-        # print("Mention count (including replies) is %d" % mention_count)
         self.cached_rm_ratio = (inspiring_tweets_count + reply_count) / float(tweet_count) if tweet_count else 0
 
         return self.cached_rm_ratio
 
-    def update_screen_name(self, screen_name):
-        profile = get_or(self.data, 'profile', {})
-        get_or(profile, 'screen_name', screen_name)
-
-    def update_profile(self, parser, tweet):
-        profile = get_or(self.data, 'profile', {})
-        get_or(profile, 'screen_name', parser.get_screen_name(tweet['user']))
-        update_count(profile, 'followers_count', parser.get_followers_count(tweet))
-        update_count(profile, 'friends_count', parser.get_friends_count(tweet))
-        update_count(profile, 'total_tweet_count', parser.get_statuses_count(tweet))
-        get_or(profile, 'corpus_tweet_set', set()).add(parser.get_id(tweet))  # unique tweets in corpus
+    def corpus_tweet_set(self):
+        """:return The (numbers of the) unique tweets this user posted in the corpus"""
+        tweet = self.store.tweet
+        return set(tweet[r] for r in self.rows(POST))
 
     def get_corpus_tweet_count(self):
-        return len(get_or(self.data['profile'], 'corpus_tweet_set', set()))
-
-    def update_favourite_count(self, tweet_id, new_fav_count):
-        faves = get_or(self.data, 'favourited', {})
-        fave_count = get_or(faves, tweet_id, 0)
-        if new_fav_count > fave_count:
-            faves[tweet_id] = new_fav_count
-
-    def add_quote(self, quoter, quoted_tweet_id, quoting_tweet_id):
-        my_tweets_quoted = get_or(self.data, 'my_quoted_tweets', {})
-        my_tweet_quoted_by = get_or(my_tweets_quoted, quoted_tweet_id, [])
-        my_tweet_quoted_by.append((quoter, quoting_tweet_id))
-
-    def add_retweet(self, retweeter, tweet_id):
-        my_retweets = get_or(self.data, 'my_retweets', {})
-        my_tweets_retweeted_by = get_or(my_retweets, tweet_id, [])
-        my_tweets_retweeted_by.append(retweeter)
-
-    def add_mention(self, mentioner, tweet_id):
-        mentions_of_me = get_or(self.data, 'mentions_of_me', {})
-        mentions_by = get_or(mentions_of_me, mentioner, set())
-        mentions_by.add(tweet_id)
-
-    def add_reply(self, replying_user, original_tweet_id, reply_tweet_id):
-        replies_to_me = get_or(self.data, 'replies_to', {})
-        repliers_to_my_tweet = get_or(replies_to_me, original_tweet_id, {})
-        replier_to_my_tweet = get_or(repliers_to_my_tweet, replying_user, [])
-        replier_to_my_tweet.append(reply_tweet_id)
-
-        replies_to_me_from = get_or(self.data, 'replies_from', {})
-        replier_to_my_tweets = get_or(replies_to_me_from, replying_user, [])
-        replier_to_my_tweets.append((original_tweet_id, reply_tweet_id))
+        return len(self.corpus_tweet_set())
+
+    @property
+    def data(self):
+        """This user's kudos in the original nested form (see the class comment), built on demand"""
+        store = self.store
+        users = store.users
+        tweets = store.tweets
+
+        def tweet_id(t):
+            return tweets[t] if t != NO_TWEET else None
+
+        profile = {'screen_name': users[self.user]}
+        if store.profiled[self.user]:
+            profile['followers_count'] = store.followers_count[self.user]
+            profile['friends_count'] = store.friends_count[self.user]
+            profile['total_tweet_count'] = store.total_tweet_count[self.user]
+        data = {
+            'profile': profile,
+            'my_retweets': {},
+            'my_quoted_tweets': {},
+            'mentions_of_me': {},
+            'replies_to': {},
+            'replies_from': {},
+            'favourited': {}
+        }
+        for r in self.rows():
+            kind = store.kind[r]
+            source = users[store.source[r]]
+            t = tweet_id(store.tweet[r])
+            via = tweet_id(store.via[r])
+            if kind & POST:
+                get_or(profile, 'corpus_tweet_set', set()).add(t)
+                if store.tweet[r] in store.favourites:
+                    data['favourited'][t] = store.favourites[store.tweet[r]]
+            elif kind & RETWEET:
+                get_or(data['my_retweets'], t, []).append(source)
+            elif kind & QUOTE:
+                get_or(data['my_quoted_tweets'], t, []).append((source, via))
+            elif kind & MENTION:
+                get_or(data['mentions_of_me'], source, set()).add(t)
+            elif kind & REPLY:
+                get_or(get_or(data['replies_to'], t, {}), source, []).append(via)
+                get_or(data['replies_from'], source, []).append((t, via))
+        return data
 
 
 class TwitterAnalysis:
@@ -279,282 +283,355 @@ class TwitterAnalysis:
 
     def __init__(self, options):
         self.options = options
+        self.how_few = int(options.how_few)  # top X to report on
+        self.pa_weights = (float(options.rt_weight), float(options.qu_weight), float(options.re_weight),
+                           float(options.fav_weight))
+        self.tweet_count = int(options.tweet_count)  # the tweets to gather D-rank interactions from (-1 = all)
+        self.instrumentation = Instrumentation()
 
     def debug(self, msg):
         if self.options.debug:
             print(msg)
 
     def analyse(self, tweets):
-        num_tweets = len(tweets)
+        """
+        Consumes the tweets in a single pass, building the kudos of each user and gathering the
+        interactions needed for D-rank as each tweet goes by, so the tweets themselves need not be
+        retained. Then reports the top accounts by each metric.
+        :param tweets: An iterable of TweetRecords (e.g. from read_tweets()) or tweet dictionaries
+        """
+        print("Analysing tweets to provide top %d accounts..." % self.how_few)
+        self.report(self.ingest(tweets))
+
+    def ingest(self, tweets, store=None):
+        """
+        Records the interactions in each of the tweets in an InteractionStore.
+        :param tweets: An iterable of TweetRecords or tweet dictionaries
+        :param store: The store to add to (default: a new, empty store), or a TweetRows to hand each tweet's rows to
+        :return The store
+        """
+        # every interaction, from which both the Kudos metrics and D-rank are calculated
+        if store is None:
+            store = InteractionStore()
+
+        # parse all tweets and build kudos for each user
+        num_tweets = 0
+        with self.instrumentation.stage('ingest'):
+            for t in tweets:
+                num_tweets += 1
+                if not isinstance(t, TweetRecord):
+                    t = to_record(t)
+                if self.options.debug:
+                    sys.stdout.write("%2d." % num_tweets)
+                self.ingest_tweet(t, store, num_tweets)
+        self.instrumentation.add_count('tweets', num_tweets)
+
         print("Loaded %d tweets..." % num_tweets)
+        return store
 
+    def ingest_tweet(self, t, store, tweet_number):
+        """
+        Records the interactions in a tweet in an InteractionStore, the D-rank interactions only if it's
+        among the first tweet_count tweets (see -c).
+        :param t: The TweetRecord
+        :param store: The store to add to, or a TweetRows to hand the tweet's rows to
+        :param tweet_number: The number of the tweet among those ingested, from 1
+        """
+        first_row = len(store)
+        self.add_kudos(store, t)
+        if self.tweet_count == -1 or tweet_number <= self.tweet_count:
+            TwitterAnalysis.gather_tweet_interactions(t, store, first_row)
+        store.end_tweet()
+
+    def calculate_metrics(self, store, state=None):
+        """
+        Calculates the Kudos metrics of every user given kudos, with the chosen metrics engine.
+        :param store: An InteractionStore populated by ingest()
+        :param state: An AnalysisState from an earlier run, from which the metrics of users with no new
+        interactions are reused (if any)
+        :return A tuple of (kudos, metrics), where kudos maps each screen name to its Kudos, with its
+        metrics calculated, and metrics is the MetricTable of them all
+        """
         # user -> Kudos instance(mentions, retweets, quotes, ...)
-        kudos = {}
-        how_few = 20  # top X to report on
+        kudos = dict((store.users[u], Kudos(store, u)) for u in store.kudos_users)
+        if state is not None:
+            changed_users = state.changed_users()
+            for k in kudos.values():
+                if k.user not in changed_users:
+                    state.restore(k, self.pa_weights)
+
+        instrumentation = self.instrumentation
+        instrumentation.count('users', len(store.users))
+        instrumentation.count('kudos_users', len(kudos))
+        instrumentation.count('interactions', len(store))
+
+        if self.options.metrics_engine == 'batch':
+            # calculate every user's metrics at once, caching them in their Kudos
+            with instrumentation.stage('metrics.batch'):
+                _, h_index, int_ratio, rm_ratio, pa_ratio = batch_metrics(store, self.pa_weights)
+                for k, h, ir, rmr, par in zip(kudos.values(), h_index.tolist(), int_ratio.tolist(),
+                                              rm_ratio.tolist(), pa_ratio.tolist()):
+                    k.cached_h_index, k.cached_int_ratio, k.cached_rm_ratio, k.cached_pa_ratio = h, ir, rmr, par
+                    k.cached_pa_weights = self.pa_weights
+        else:
+            # calculate each metric for every user in turn, so each can be timed
+            with instrumentation.stage('metrics.rows_by_target'):
+                store.rows_by_target()
+            with instrumentation.stage('metrics.h_index'):
+                for k in kudos.values():
+                    k.h_index()
+            with instrumentation.stage('metrics.int_ratio'):
+                for k in kudos.values():
+                    k.int_ratio()
+            with instrumentation.stage('metrics.rm_ratio'):
+                for k in kudos.values():
+                    k.rm_ratio()
+            with instrumentation.stage('metrics.pa_ratio'):
+                for k in kudos.values():
+                    k.pa_ratio(*self.pa_weights)
+
+        # each user's metrics are calculated once, and only the top few by each are picked out
+        with instrumentation.stage('rank'):
+            return kudos, MetricTable.from_kudos(kudos, self.pa_weights)
+
+    def calculate_d_rank(self, store, initial_scores=None):
+        """
+        Calculates the D-rank of every user with the chosen D-rank engine.
+        :param store: An InteractionStore populated by ingest()
+        :param initial_scores: Map of screen name to score to start from (default: none)
+        :return A map of screen name to D-rank score
+        """
+        engine = self.options.d_rank_engine
+        if engine == 'parallel':
+            d_rank = partial(parallel_d_rank, workers=int(self.options.d_rank_workers))
+        else:
+            d_rank = sparse_d_rank if engine == 'sparse' else self.d_rank
+        with self.instrumentation.stage('d_rank'):
+            return d_rank(store,
+                          int(self.options.max_iterations),
+                          float(self.options.d_rank_weight_factor),
+                          self.options.debug,
+                          initial_scores,
+                          self.instrumentation,
+                          solver=self.options.d_rank_solver,
+                          extrapolation=self.options.extrapolation,
+                          tolerance=float(self.options.tolerance),
+                          norm=self.options.residual_norm)
+
+    def report(self, store, state=None):
+        """
+        Prints the top accounts by each metric, calculated from the interactions in the store.
+        :param store: An InteractionStore populated by ingest()
+        :param state: An AnalysisState from an earlier run over (part of) the same store, if any,
+        from which the metrics of users with no new interactions are reused and D-rank is warm-started.
+        It is updated with the results of this run.
+        :return A tuple of (kudos, metrics, d_rank_scores), where kudos maps each screen name reported on to
+        its Kudos, with its metrics calculated, metrics is their MetricTable, and d_rank_scores maps screen
+        names to D-rank scores
+        """
+        how_few = self.how_few
+        kudos, metrics = self.calculate_metrics(store, state)
+        print("Detected %d different Twitter users" % len(kudos))
+        with self.instrumentation.stage('rank'):
+            top_few = dict((metric, metrics.top(metric, how_few)) for metric in RANKED_METRICS)
 
-        print("Analysing tweets to provide top %d accounts..." % how_few)
+        self.print_top_few(top_few)
 
-        def get_kudos(user_id):
-            return get_or(kudos, user_id, Kudos())
+        print("D-Rank")
+        d_rank_scores = self.calculate_d_rank(store, state.d_rank_scores if state is not None else None)
+        for r in top(list(d_rank_scores), list(d_rank_scores.values()), how_few):
+            print("  @%s : %.2f" % r)
 
-        # parse all tweets and build kudos for each user
-        i = 0
-        import sys
-        parser = None
-        for t in tweets:
-            i += 1
-            if i % (num_tweets / 10) == 0:
-                print('.', end='')
-            # print("Processing tweet #%d" % i)
-            # is this the standard Twitter format or a known (Twitter4j serialised) alt've?
-            parser = StandardParser() if 'id_str' in t else Twitter4JParser()
-            if self.options.debug:
-                sys.stdout.write("%2d." % i)
-
-            tweeting_user = parser.get_screen_name(t['user'])
-            tweet_id = parser.get_id(t)
-            tweet_text = make_safe(t['text'])
-            get_kudos(tweeting_user).update_profile(parser, t)
-            if parser.is_favourited(t):
-                # This will only work for tweets collected via the REST API;
-                # tweets collected via the stream will not have had a chance to be favourited when we collect them
-                fav_count = parser.get_favourite_count(t)  # t['favorite_count'] if standard else t['favoriteCount']
-                get_kudos(tweeting_user).update_favourite_count(tweet_id, fav_count)
-                self.debug("FAVE:    @%s tweet favourited (%s)" % (tweeting_user, tweet_id))
-
-            t_stack = [t]  # stack of tweets, including this and any embedded ones
-            is_a_retweet = parser.is_a_retweet(t)
+        if state is not None:
+            state.update(kudos.values(), self.pa_weights, d_rank_scores)
+
+        return kudos, metrics, d_rank_scores
+
+    @staticmethod
+    def print_top_few(top_few):
+        """
+        Prints the top accounts by each metric.
+        :param top_few: Map of metric name (see RANKED_METRICS) to a list of (screen name, value)
+        """
+        for metric, heading, line in REPORTED_METRICS:
+            print(heading)
+            for r in top_few[metric]:
+                print(line % r)
+
+    def add_kudos(self, store, t):
+        """
+        Credits the users involved in a single tweet (its author and anyone it retweets, quotes,
+        replies to or mentions) with the appropriate kudos.
+        :param store: The InteractionStore to record the tweet's interactions in
+        :param t: The TweetRecord
+        """
+        tweeting_user = store.kudos_user(t.screen_name)
+        tweet_id = store.tweet_id(t.id)
+        tweet_text = make_safe(t.text) if self.options.debug else ''
+        store.update_profile(tweeting_user, t.followers_count, t.friends_count, t.statuses_count)
+        store.add(tweeting_user, tweeting_user, tweet_id, tweet_id, POST)  # unique tweets in corpus
+        if t.favourited:
+            # This will only work for tweets collected via the REST API;
+            # tweets collected via the stream will not have had a chance to be favourited when we collect them
+            store.update_favourite_count(tweet_id, t.favourite_count)
+            self.debug("FAVE:    @%s tweet favourited (%s)" % (t.screen_name, t.id))
+
+        t_stack = [t]  # stack of tweets, including this and any embedded ones
+        is_a_retweet = t.retweeted_status is not None
+        if is_a_retweet:
+            retweeted_status = t.retweeted_status
+            retweeted_user = store.kudos_user(retweeted_status.screen_name)
+            original_tweet_id = store.tweet_id(retweeted_status.id)
+
+            store.add(tweeting_user, retweeted_user, original_tweet_id, tweet_id, RETWEET)
+            store.update_profile(retweeted_user, retweeted_status.followers_count,
+                                 retweeted_status.friends_count, retweeted_status.statuses_count)
+            store.add(retweeted_user, retweeted_user, original_tweet_id, tweet_id, POST)
+            t_stack.append(retweeted_status)
+            self.debug("RETWEET: @%s retweeted by @%s: %s" %
+                       (retweeted_status.screen_name, t.screen_name, tweet_text))
+
+        if t.quoted_status is not None:
+            # NB, it's possible to have a retweet of a quoted tweet, but not a quote of a retweet (the
+            # quote will be of the original tweet). In the case of a retweeted quote, the quoted_status
+            # field of both the retweeted tweet and the original quoting tweet will be populated with
+            # the quoted tweet, so it's important to distinguish exactly who is quoting whom and who is
+            # just retweeting.
+            #
+            # - If @A retweets @B's quote of @C, then we get @A RETWEETS @B, and @B QUOTES @C.
+            # - If @A quotes @B's retweet of @C, then we get @A quotes @C only.
+            quoted_tweet = t.quoted_status
             if is_a_retweet:
-                retweeted_status = parser.get_retweeted_status(t)
-                retweeted_user = parser.get_screen_name(retweeted_status['user'])
-                original_tweet_id = parser.get_id(retweeted_status)
-
-                get_kudos(retweeted_user).add_retweet(tweeting_user, original_tweet_id)
-                get_kudos(retweeted_user).update_profile(parser, retweeted_status)
-                t_stack.append(retweeted_status)
-                self.debug("RETWEET: @%s retweeted by @%s: %s" % (retweeted_user, tweeting_user, tweet_text))
-
-            if parser.is_a_quote(t):
-                # NB, it's possible to have a retweet of a quoted tweet, but not a quote of a retweet (the
-                # quote will be of the original tweet). In the case of a retweeted quote, the quoted_status
-                # field of both the retweeted tweet and the original quoting tweet will be populated with
-                # the quoted tweet, so it's important to distinguish exactly who is quoting whom and who is
-                # just retweeting.
-                #
-                # - If @A retweets @B's quote of @C, then we get @A RETWEETS @B, and @B QUOTES @C.
-                # - If @A quotes @B's retweet of @C, then we get @A quotes @C only.
-                quoted_tweet = parser.get_quoted_status(t)
-                if is_a_retweet:
-                    quoted_tweet = parser.get_retweeted_status(t)
-
-                quoted_user = parser.get_screen_name(quoted_tweet['user'])
-                quoted_tweet_id = parser.get_id(quoted_tweet)
-                get_kudos(quoted_user).add_quote(tweeting_user, quoted_tweet_id, quoted_tweet_id)
-                t_stack.append(quoted_tweet)
-                self.debug("QUOTE:   @%s quoted tweet by @%s: %s" % (tweeting_user, quoted_user, tweet_text))
-
-            t_stack = [x for x in t_stack if (parser.has_mentions(x))]  # look for those containing mentions
-            if len(t_stack):
-                for _t in t_stack:
-                    mentions = parser.get_mentions(_t)
-                    for mentioned_user in mentions:
-
-                        mentioned_sn = parser.get_screen_name(mentioned_user)
-                        mentioned_user_id = parser.get_id(mentioned_user)
-                        in_reply_to_user_id = parser.get_in_reply_to_user_id(_t)
-
-                        if mentioned_user_id == in_reply_to_user_id:
-                            in_reply_to_status_id = parser.get_in_reply_to_status_id(_t)
-                            get_kudos(mentioned_sn).add_reply(tweeting_user, in_reply_to_status_id, tweet_id)
-                            get_kudos(mentioned_sn).update_screen_name(mentioned_sn)
-                            self.debug("REPLY:   @%s replied to by @%s: %s" % (mentioned_sn, tweeting_user, tweet_text))
-                        else:
-                            # those mentioned in the retweeted or quoted tweet ought to get extra points
-                            retweeted_author_id = ''
-                            if parser.is_a_retweet(_t):
-                                retweeted_author_id = parser.get_id(parser.get_retweeted_status(_t)['user'])
-
-                            quoted_author_id = ''
-                            if parser.is_a_quote(_t):
-                                quoted_author_id = parser.get_id(parser.get_quoted_status(_t)['user'])
-
-                            if not (parser.is_a_retweet(_t) and mentioned_user_id == retweeted_author_id) and \
-                               not (parser.is_a_quote(_t) and mentioned_user_id == quoted_author_id):
-                                _t_id = parser.get_id(_t)
-                                get_kudos(mentioned_sn).add_mention(tweeting_user, _t_id)
-                                get_kudos(mentioned_sn).update_screen_name(mentioned_sn)
-                                self.debug("MENTION: @%s mentioned by @%s: %s" %
-                                           (mentioned_sn, tweeting_user, tweet_text))
-
-        print("\nDetected %d different Twitter users" % len(kudos))
-        kudos_list = kudos.items()
-
-        print("H-Index (h)")
-        h_index_top_few = sorted(kudos_list, key=lambda k: k[1].h_index(), reverse=True)[:how_few]
-        for r in h_index_top_few:
-            print("  @%s : %4d" % (r[0], r[1].h_index()))
-
-        print("Interactor Ratio (Ir)")
-        ir_top_few = sorted(kudos_list, key=lambda k: k[1].int_ratio(), reverse=True)[:how_few]
-        for r in ir_top_few:
-            print("  @%s : %.2f" % (r[0], r[1].int_ratio()))
-
-        print("Retweet/Mention(Reply) Ratio (RMr)")
-        rm_ratio_top_few = sorted(kudos_list, key=lambda k: k[1].rm_ratio(), reverse=True)[:how_few]
-        for r in rm_ratio_top_few:
-            print("  @%s : %.2f" % (r[0], r[1].rm_ratio()))
-
-        (min_h_index, max_h_index) = min_max(list(map(lambda k: k[1].h_index(), kudos_list)))
-        (min_ir, max_ir) = min_max(list(map(lambda k: k[1].int_ratio(), kudos_list)))
-        (min_rmr, max_rmr) = min_max(list(map(lambda k: k[1].rm_ratio(), kudos_list)))
-
-        print("Social Networking Potential (Ir' * 0.25 + RMr' * 0.75)")
-        snp_top_few = sorted(kudos_list,
-                             key=lambda row:
-                                 (0.25 * normalise(row[1].int_ratio(), min_ir, max_ir) +
-                                  0.75 * normalise(row[1].rm_ratio(), min_rmr, max_rmr)),
-                             reverse=True)[:how_few]
-        for r in snp_top_few:
-            print("  @%s : %.2f" % (
-                r[0],
-                (0.25 * normalise(r[1].int_ratio(), min_ir, max_ir) +
-                 0.75 * normalise(r[1].rm_ratio(), min_rmr, max_rmr))
-            ))
-
-        print("Mixture Model Ratio ((h' + Ir' + RMr') / 3)")
-        blended_top_few = sorted(kudos_list,
-                                 key=lambda row:
-                                     (normalise(row[1].h_index(), min_h_index, max_h_index) +
-                                      normalise(row[1].int_ratio(), min_ir, max_ir) +
-                                      normalise(row[1].rm_ratio(), min_rmr, max_rmr)) / 3.0,
-                                 reverse=True)[:how_few]
-        for r in blended_top_few:
-            print("  @%s : %.2f" % (
-                r[0],
-                (normalise(r[1].h_index(), min_h_index, max_h_index) +
-                 normalise(r[1].int_ratio(), min_ir, max_ir) +
-                 normalise(r[1].rm_ratio(), min_rmr, max_rmr)) / 3.0
-            ))
-
-        print("Post/Activity Ratio (PAr)")
-        rt_w = float(self.options.rt_weight)
-        qu_w = float(self.options.qu_weight)
-        re_w = float(self.options.re_weight)
-        fav_w = float(self.options.fav_weight)
-        pa_ratio_top_few = sorted(kudos_list,
-                                  key=lambda row: row[1].pa_ratio(rt_w, qu_w, re_w, fav_w),
-                                  reverse=True)[:how_few]
-        for r in pa_ratio_top_few:
-            print("  @%s : %.2f" % (r[0], r[1].pa_ratio(rt_w, qu_w, re_w, fav_w)))
+                quoted_tweet = t.retweeted_status
+
+            quoted_user = store.kudos_user(quoted_tweet.screen_name)
+            store.add(tweeting_user, quoted_user, store.tweet_id(quoted_tweet.id), tweet_id, QUOTE)
+            t_stack.append(quoted_tweet)
+            self.debug("QUOTE:   @%s quoted tweet by @%s: %s" % (t.screen_name, quoted_tweet.screen_name, tweet_text))
+
+        for _t in t_stack:  # look for those containing mentions
+            for mentioned_user_id, mentioned_sn in _t.mentions:
+                if mentioned_user_id == _t.in_reply_to_user_id:
+                    replied_to_user = store.kudos_user(mentioned_sn)
+                    in_reply_to_status_id = store.tweet_id(_t.in_reply_to_status_id)
+                    store.add(tweeting_user, replied_to_user, in_reply_to_status_id, tweet_id, REPLY)
+                    self.debug("REPLY:   @%s replied to by @%s: %s" % (mentioned_sn, t.screen_name, tweet_text))
+                else:
+                    # those mentioned in the retweeted or quoted tweet ought to get extra points
+                    if _t.retweeted_status is not None and mentioned_user_id == _t.retweeted_status.user_id:
+                        continue
+                    if _t.quoted_status is not None and mentioned_user_id == _t.quoted_status.user_id:
+                        continue
+                    mentioned_user = store.kudos_user(mentioned_sn)
+                    store.add(tweeting_user, mentioned_user, store.tweet_id(_t.id), tweet_id, MENTION)
+                    self.debug("MENTION: @%s mentioned by @%s: %s" % (mentioned_sn, t.screen_name, tweet_text))
 
-        print("D-Rank")
-        d_rank_scores = self.d_rank(tweets,
-                                    parser,
-                                    int(self.options.max_iterations),
-                                    int(self.options.tweet_count),
-                                    float(self.options.d_rank_weight_factor),
-                                    self.options.debug)
-        d_rank_top_few = sorted(d_rank_scores.items(), key=lambda kv: kv[1], reverse=True)[:how_few]
-        for r in d_rank_top_few:
-            print("  @%s : %.2f" % (r[0], r[1]))
+    @staticmethod
+    def gather_interactions(tweets, store):
+        # tweets: list of TweetRecords
+        # store: InteractionStore in which to record the links between users, as rows of kind LINK
+        for t in tweets:
+            TwitterAnalysis.gather_tweet_interactions(t, store, len(store))
 
     @staticmethod
-    def gather_interactions(tweets, users, incoming, outgoing, parser):
-        # tweets: list of parsed tweets
-        # users: set of users to populate with usernames seen in tweets
-        # incoming: { mentioned_user: { mentioning_user : [mentioning_tweet_ID] } } -- possible duplicates from RTs/Qus
-        # outgoing: { mentioning_user: set(mentioned_user) }
+    def gather_tweet_interactions(tweet, store, first_row):
+        # as for gather_interactions(), but for a single tweet, so interactions can be gathered as tweets stream by;
+        # rows already added for this tweet from first_row onwards are reused for links between the same users
+        via = store.tweet_id(tweet.id)
+
         def link(interactee, interactor, tweet_id):
-            incoming_for_user_a = get_or(incoming, interactee, {})
-            get_or(incoming_for_user_a, interactor, []).append(tweet_id)
-            get_or(outgoing, interactor, set()).add(interactee)
-            users.add(interactor)
-            users.add(interactee)
+            store.link(store.user(interactee), store.user(interactor), store.tweet_id(tweet_id), via, first_row)
 
         def process_tweet(tweet):
-            if parser.is_a_quote(tweet):
-                quoting_user = parser.get_screen_name(tweet['user'])
-                quoted_tweet = parser.get_quoted_status(tweet)
-                quoted_user = parser.get_screen_name(quoted_tweet['user'])
+            if tweet.quoted_status is not None:
+                quoting_user = tweet.screen_name
+                quoted_tweet = tweet.quoted_status
+                quoted_user = quoted_tweet.screen_name
 
-                quoting_tweet_id = parser.get_id(tweet)
+                quoting_tweet_id = tweet.id
                 link(quoted_user, quoting_user, quoting_tweet_id)
 
                 process_tweet(quoted_tweet)
 
                 # if someone is mentioned in the quoted status, then the quoter and the mentionee are also linked
-                if parser.has_mentions(quoted_tweet):
-                    mentions = parser.get_mentions(quoted_tweet)
-                    for mention in mentions:
-                        mentioned_user = parser.get_screen_name(mention)
-
-                        link(mentioned_user, quoting_user, quoting_tweet_id)
+                for _, mentioned_user in quoted_tweet.mentions:
+                    link(mentioned_user, quoting_user, quoting_tweet_id)
 
-            if parser.is_a_retweet(tweet):
-                process_tweet(parser.get_retweeted_status(t))
+            if tweet.retweeted_status is not None:
+                process_tweet(tweet.retweeted_status)
 
-            if parser.has_mentions(tweet):
-                # covers RTs, replies and mentions
-                mentions = parser.get_mentions(tweet)
-                for mention in mentions:
-                    mentioned_user = parser.get_screen_name(mention)
-                    mentioning_user = parser.get_screen_name(tweet['user'])
+            # covers RTs, replies and mentions
+            for _, mentioned_user in tweet.mentions:
+                link(mentioned_user, tweet.screen_name, tweet.id)
 
-                    mentioning_tweet_id = parser.get_id(tweet)
-                    link(mentioned_user, mentioning_user, mentioning_tweet_id)
-
-        for t in tweets:
-            process_tweet(t)
+        process_tweet(tweet)
 
     @staticmethod
-    def d_rank(tweets, parser, max_iterations, tweet_count, weight_factor=0.2, debug=False):
-
+    def d_rank(store, max_iterations, weight_factor=0.2, debug=False, initial_scores=None, instrumentation=None,
+               solver='jacobi', extrapolation='none', tolerance=INTERESTING_DELTA, norm='linf'):
+        """
+        Calculates the D-rank of each user from the links gathered by gather_interactions().
+        :param store: The InteractionStore holding the links
+        :param max_iterations: The most iterations to run before giving up on convergence
+        :param weight_factor: The D-rank weighting factor
+        :param debug: Whether to print the working of each iteration
+        :param initial_scores: Map of screen name to score to start from, e.g. the scores from an earlier run
+        over most of the same interactions (default: start every user from weight_factor)
+        :param instrumentation: An Instrumentation to record the time taken and residual of each iteration in
+        :param solver: jacobi, to calculate each iteration's scores from the previous iteration's (the reference),
+        or gauss-seidel, to update the scores in place, so each is calculated from the latest scores of the others
+        :param extrapolation: none, aitken or quadratic, see Extrapolator (requires numpy)
+        :param tolerance: The residual at or below which the scores have converged
+        :param norm: linf, for the residual to be the largest change to a score in an iteration, or l1, their total
+        :return A map of screen name to D-rank score
+        """
         damping_factor = 1 - weight_factor
-        interesting_delta = 0.001   # redo scores if new value differs by this
+        convergence = Convergence(tolerance, norm, debug, instrumentation)
+        extrapolate = Extrapolator(extrapolation, instrumentation)
+        in_place = solver == 'gauss-seidel'
         influence_scores = {}
-        users = set()
-        users_who_mentioned_x = {}  # to collect users who mentioned X (the key)
-        users_mentioned_by_x = {}   # to collect users mentioned by X (the key)
+        names = store.users
 
-        tweets_to_consider = tweets if tweet_count == -1 else tweets[0:tweet_count]
-        if debug:
-            print("[INFO] Tweets to consider: %d" % len(tweets_to_consider))
-        TwitterAnalysis.gather_interactions(
-            tweets_to_consider, users, users_who_mentioned_x, users_mentioned_by_x, parser
-        )
+        # users_who_mentioned_x: { mentioned_user: { mentioning_user : number of mentions } }
+        # users_mentioned_by_x: { mentioning_user: set(mentioned_user) }
+        users_who_mentioned_x, users_mentioned_by_x = store.links()
+        users = sorted(set(users_who_mentioned_x).union(users_mentioned_by_x), key=lambda u: names[u])
+        if instrumentation is not None:
+            instrumentation.count('d_rank_users', len(users))
+            instrumentation.count('d_rank_links',
+                                  sum(len(interactees) for interactees in users_mentioned_by_x.values()))
 
         # Step 1. Set all weights
+        initial_scores = initial_scores or {}
         for this_user in users:
-            influence_scores[this_user] = weight_factor
+            influence_scores[this_user] = initial_scores.get(names[this_user], weight_factor)
 
         # Step 2.
-        iterations = 0
         scores_have_changed = True
-        while iterations < max_iterations and scores_have_changed:
-            scores_have_changed = False
-            new_influence_scores = {}
-            iterations += 1
+        while convergence.iterations < max_iterations and scores_have_changed:
+            new_influence_scores = influence_scores if in_place else {}
+            max_delta = 0.0
+            total_delta = 0.0
+            convergence.start()
             if debug:
-                print("\n=== Iteration %d (%d users) ===" % (iterations, len(users)))
-            for this_user in sorted(users):
+                print("\n=== Iteration %d (%d users) ===" % (convergence.iterations, len(users)))
+            for this_user in users:
                 # grab the previous new_score and call it old_score
                 old_score = influence_scores[this_user]
 
                 # calculate surrounding influence, accounting for own interactions (mentions of others)
                 surrounding_influence = 0.0
-                inspired_users = get_or(users_who_mentioned_x, this_user, {}).keys()
-                for inspired_user in inspired_users:
+                inspired_users = users_who_mentioned_x.get(this_user, {})
+                for inspired_user, num_interactions_from_inspired_user in inspired_users.items():
                     # how many people, in total, received a mention or RT from this inspired user?
                     unique_recipients_of_outgoing_interactions_of_this_inspired_user = \
-                        len(get_or(users_mentioned_by_x, inspired_user, []))
+                        len(users_mentioned_by_x[inspired_user])
 
                     influence_of_inspired_user = influence_scores[inspired_user]
-                    num_interactions_from_inspired_user = len(users_who_mentioned_x[this_user][inspired_user])
 
                     if debug:
-                        print("    inspired user: %s %.3f" % (inspired_user, influence_of_inspired_user))
-                        print("    num interactions to this user: %2d: %s" %
-                              (num_interactions_from_inspired_user, users_who_mentioned_x[this_user][inspired_user]))
+                        print("    inspired user: %s %.3f" % (names[inspired_user], influence_of_inspired_user))
+                        print("    num interactions to this user: %2d" % num_interactions_from_inspired_user)
                         print("    total interactions: %2d" %
                               unique_recipients_of_outgoing_interactions_of_this_inspired_user)
                         print("    -> %.2f" % (
@@ -571,17 +648,21 @@ class TwitterAnalysis:
                 new_score = damping_factor + weight_factor * surrounding_influence
 
                 # Step 3. check if it's changed
-                if abs(old_score - new_score) > interesting_delta:
-                    scores_have_changed = True
+                delta = abs(old_score - new_score)
+                max_delta = max(max_delta, delta)
+                total_delta += delta
 
                 if debug:
-                    print("@%s %.3f -> %.3f" % (this_user, old_score, new_score))
+                    print("@%s %.3f -> %.3f" % (names[this_user], old_score, new_score))
                 new_influence_scores[this_user] = new_score
 
             # commit the new scores
             influence_scores = new_influence_scores
+            scores_have_changed = convergence.finish(max_delta, total_delta, len(users))
+            if extrapolate and scores_have_changed:
+                extrapolated = extrapolate(np.array([influence_scores[u] for u in users]))
+                influence_scores = dict(zip(users, extrapolated.tolist()))
 
-        if debug and iterations == max_iterations:
-            print("[INFO] D-rank hit iteration max of %d. Could have continued." % max_iterations)
+        convergence.report(max_iterations)
 
-        return influence_scores
+        return dict((names[u], score) for u, score in influence_scores.items())
@@ -0,0 +1,286 @@
+import collections
+import datetime
+import re
+
+from .interactions import InteractionStore, KUDOS_KINDS, LINK, POST, RETWEET, QUOTE, REPLY
+from .ranking import MetricTable, RANKED_METRICS, top
+from .tweet_parsers import TweetRecord, parse_created_at, to_record
+from .twitter_analysis import TwitterAnalysis, h_index_of, pa_ratio_of
+
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+COMPACT_AFTER_ROWS = 100000  # rows which have left the window to keep before dropping them from the store
+
+
+def parse_duration(duration):
+    """
+    :param duration: A duration such as '90s', '15m', '6h' or '1d' (or a number of seconds)
+    :return The duration in seconds
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$', duration)
+    if match is None:
+        raise ValueError("Invalid duration '%s', expected e.g. 90s, 15m, 6h or 1d" % duration)
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or 's']
+
+
+def format_time(seconds):
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def bump(counts, key, by):
+    """Adds by to the count of key in counts, removing the key once its count is zero"""
+    count = counts.get(key, 0) + by
+    if count:
+        counts[key] = count
+    else:
+        del counts[key]
+
+
+class WindowKudos:
+    """
+    The kudos of a user from the interactions within a time window, as counts which can be taken
+    away from as well as added to.
+    """
+    __slots__ = ('rows', 'retweets', 'quotes', 'replies', 'interactors', 'posts')
+
+    def __init__(self):
+        self.rows = 0
+        self.retweets = {}     # tweet -> number of retweets of it
+        self.quotes = {}       # tweet -> number of quotes of it
+        self.replies = {}      # tweet -> number of replies to it
+        self.interactors = {}  # user -> number of their retweets, quotes, replies and mentions of this user
+        self.posts = {}        # tweet -> number of times it was seen posted
+
+    def metrics(self, followers_count, favourites, pa_weights):
+        """
+        Calculates the metrics exactly as Kudos does, but from the counts.
+        :param followers_count: The user's follower count
+        :param favourites: Map of tweet to favourite count
+        :param pa_weights: The weights to calculate pa_ratio with
+        :return A tuple of (h_index, int_ratio, rm_ratio, pa_ratio)
+        """
+        h_index = h_index_of(list(self.retweets.values()) + list(self.quotes.values()))
+        int_ratio = len(self.interactors) / float(followers_count) if followers_count else 0
+
+        tweet_count = len(self.posts)
+        inspiring_tweets_count = len(set(self.retweets).union(self.quotes))
+        rm_ratio = (inspiring_tweets_count + len(self.replies)) / float(tweet_count) if tweet_count else 0
+
+        fav_count = sum(favourites.get(t, 0) for t in self.posts)
+        pa_ratio = pa_ratio_of(sum(self.retweets.values()), sum(self.quotes.values()), sum(self.replies.values()),
+                               fav_count, tweet_count, *pa_weights)
+        return h_index, int_ratio, rm_ratio, pa_ratio
+
+
+class SlidingWindow:
+    """
+    The interactions of the tweets created within a sliding time window, over an InteractionStore
+    into which the tweets are ingested in time order. As tweets enter the window their rows are
+    added to per-user counts (and to the D-rank links), and as they leave it their rows are taken
+    away again, so moving the window costs time in proportion to the tweets entering and leaving
+    it, rather than to all those within it. Only the metrics of users whose counts have changed
+    are recalculated.
+
+    It can stand in for the store when calculating D-rank: `links()` gives the links within the
+    window, and `source`, `target` and `kind` its rows.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.users = store.users
+        self.first_row = 0  # the window holds the rows first_row..last_row-1 of the store
+        self.last_row = 0
+        self.tweets = collections.deque()  # (creation time, first row) of each tweet in the window, oldest first
+        self.kudos = {}      # user -> WindowKudos
+        self.incoming = {}   # interactee -> { interactor: number of interactions }
+        self.outgoing = {}   # interactor -> { interactee: number of interactions }
+        self.metrics = {}    # user -> (h_index, int_ratio, rm_ratio, pa_ratio)
+        self.changed_users = set()
+
+    def __len__(self):
+        return len(self.tweets)
+
+    @property
+    def source(self):
+        return self.store.source[self.first_row:self.last_row]
+
+    @property
+    def target(self):
+        return self.store.target[self.first_row:self.last_row]
+
+    @property
+    def kind(self):
+        return self.store.kind[self.first_row:self.last_row]
+
+    def links(self):
+        """:return The D-rank links between users within the window, as InteractionStore.links() does"""
+        return self.incoming, self.outgoing
+
+    def add(self, created_at, first_row):
+        """
+        Adds a tweet which has just been ingested into the store to the window.
+        :param created_at: The tweet's creation time
+        :param first_row: The first of the tweet's rows in the store
+        """
+        self.tweets.append((created_at, first_row))
+        self._count_rows(self.last_row, len(self.store), 1)
+        self.last_row = len(self.store)
+
+    def evict(self, start):
+        """Removes the tweets created before start from the window"""
+        tweets = self.tweets
+        while tweets and tweets[0][0] < start:
+            tweets.popleft()
+        end = tweets[0][1] if tweets else self.last_row
+        self._count_rows(self.first_row, end, -1)
+        self.first_row = end
+
+        # once most of the store is rows which have left the window, forget them
+        if self.first_row >= COMPACT_AFTER_ROWS and 2 * self.first_row >= self.last_row:
+            self.store.drop_rows_before(self.first_row)
+            self.tweets = collections.deque((created_at, row - self.first_row) for created_at, row in tweets)
+            self.last_row -= self.first_row
+            self.first_row = 0
+
+    def _count_rows(self, first_row, end_row, by):
+        store = self.store
+        kind = store.kind
+        source = store.source
+        target = store.target
+        tweet = store.tweet
+        for r in range(first_row, end_row):
+            k = kind[r]
+            s = source[r]
+            t = target[r]
+            if k & KUDOS_KINDS:
+                kudos = self.kudos.get(t)
+                if kudos is None:
+                    kudos = self.kudos[t] = WindowKudos()
+                kudos.rows += by
+                if k & POST:
+                    bump(kudos.posts, tweet[r], by)
+                else:
+                    if k & RETWEET:
+                        bump(kudos.retweets, tweet[r], by)
+                    elif k & QUOTE:
+                        bump(kudos.quotes, tweet[r], by)
+                    elif k & REPLY:
+                        bump(kudos.replies, tweet[r], by)
+                    bump(kudos.interactors, s, by)
+                if not kudos.rows:
+                    del self.kudos[t]
+                    self.metrics.pop(t, None)
+                self.changed_users.add(t)
+            if k & LINK:
+                for links, a, b in ((self.incoming, t, s), (self.outgoing, s, t)):
+                    counts = links.get(a)
+                    if counts is None:
+                        counts = links[a] = {}
+                    bump(counts, b, by)
+                    if not counts:
+                        del links[a]
+
+    def metric_table(self, pa_weights):
+        """
+        Recalculates the metrics of the users whose interactions have changed since the last call.
+        :param pa_weights: The weights to calculate pa_ratio with
+        :return The MetricTable of the users in the window
+        """
+        store = self.store
+        for u in self.changed_users:
+            kudos = self.kudos.get(u)
+            if kudos is not None:
+                self.metrics[u] = kudos.metrics(store.followers_count[u], store.favourites, pa_weights)
+        self.changed_users = set()
+
+        metrics = self.metrics
+        users = list(self.kudos)
+        return MetricTable([self.users[u] for u in users],
+                           [metrics[u][0] for u in users],
+                           [metrics[u][1] for u in users],
+                           [metrics[u][2] for u in users],
+                           [metrics[u][3] for u in users])
+
+
+def analyse_windows(analyser, tweets, window, step):
+    """
+    Reports the top accounts by each metric, and by D-rank, within a window of time which slides
+    over the tweets (by their creation time) a step at a time, e.g. for the last 6 hours, every 15
+    minutes. D-rank is warm-started from the scores of the previous window. The tweets should be in
+    time order; any created before the current window (or without a creation time) are skipped.
+    :param analyser: The TwitterAnalysis
+    :param tweets: An iterable of TweetRecords or tweet dictionaries
+    :param window: The length of the window, in seconds
+    :param step: How far the window moves between reports, in seconds
+    :return The number of windows reported on
+    """
+    store = InteractionStore()
+    sliding = SlidingWindow(store)
+    how_few = analyser.how_few
+    instrumentation = analyser.instrumentation
+    d_rank_scores = None
+
+    def report_window(end):
+        with instrumentation.stage('window.rank'):
+            metrics = sliding.metric_table(analyser.pa_weights)
+            top_few = dict((metric, metrics.top(metric, how_few)) for metric in RANKED_METRICS)
+        print("Window %s to %s: %d tweets, %d users" %
+              (format_time(end - window), format_time(end), len(sliding), len(metrics)))
+        analyser.print_top_few(top_few)
+
+        print("D-Rank")
+        scores = analyser.calculate_d_rank(sliding, d_rank_scores)
+        for r in top(list(scores), list(scores.values()), how_few):
+            print("  @%s : %.2f" % r)
+        return scores
+
+    window_end = None
+    num_tweets = num_windows = skipped = 0
+    for t in tweets:
+        num_tweets += 1
+        if not isinstance(t, TweetRecord):
+            t = to_record(t)
+        created_at = parse_created_at(t.created_at)
+        if created_at is None:
+            skipped += 1
+            continue
+        if window_end is None:
+            window_end = (created_at // step + 1) * step
+
+        # report on each window which ends before this tweet
+        while created_at >= window_end:
+            with instrumentation.stage('window.evict'):
+                sliding.evict(window_end - window)
+            if not len(sliding):
+                window_end = (created_at // step + 1) * step  # nothing to report until this tweet's window
+                break
+            d_rank_scores = report_window(window_end)
+            num_windows += 1
+            window_end += step
+
+        if created_at < window_end - window:
+            skipped += 1  # too late for the window
+            continue
+        with instrumentation.stage('window.add'):
+            first_row = len(store)
+            analyser.add_kudos(store, t)
+            TwitterAnalysis.gather_tweet_interactions(t, store, first_row)
+            sliding.add(created_at, first_row)
+
+    # the last window, like the others, is reported without the tweets which have left it
+    if window_end is not None:
+        with instrumentation.stage('window.evict'):
+            sliding.evict(window_end - window)
+    if len(sliding):
+        report_window(window_end)
+        num_windows += 1
+
+    instrumentation.add_count('tweets', num_tweets)
+    instrumentation.count('windows', num_windows)
+    instrumentation.count('window_skipped', skipped)
+    print("Loaded %d tweets (%d skipped as out of order or undated) into %d windows" %
+          (num_tweets, skipped, num_windows))
+    if skipped:
+        print("[WARN] %d tweets were skipped, so weren't counted in any window; the input should be in time order" %
+              skipped)
+    return num_windows
@@ -1,38 +1,271 @@
-import datetime
-import json
+import cProfile
+import math
+import os
 import sys
+import time
+import tracemalloc
 
-from lib import Options
+from lib import Options, LiveOptions, QueryOptions, ServeOptions
 from lib import TwitterAnalysis
+from lib import read_tweets, timestamp
+from lib.approximate import analyse_approximately
+from lib.cache import cache_key, load_cache, save_cache
+from lib.database import InteractionDatabase, print_interactions, save_database
+from lib.dedup import make_deduplicator
+from lib.live import analyse_live, parse_address
+from lib.output import output_format, write_metric_table
+from lib.parallel import ingest_in_parallel
+from lib.personalised import load_seed_sets, personalised_d_rank, print_personalised_top_few, write_seed_scores
+from lib.server import AnalysisServer, serve
+from lib.spill import analyse_out_of_core
+from lib.sweep import SWEEP_PARAMETERS, parse_sweep, print_sweep, sweep, write_sweep
+from lib.state import AnalysisState, load_state, save_state
+from lib.window import analyse_windows, parse_duration
 
 
-def timestamp():
-    now = datetime.datetime.now()
-    return "%d-%02d-%02d %02d:%02d:%02d" % (now.year, now.month, now.day, now.hour, now.minute, now.second)
+def query(args):
+    """Looks up users' interactions and metrics in a database saved by an earlier analysis run"""
+    opts = QueryOptions().parse(args)
+    if not os.path.exists(opts.database):
+        print("[ERROR] No such database: %s" % opts.database)
+        return 1
+    all_found = True
+    with InteractionDatabase(opts.database) as db:
+        for screen_name in opts.screen_names:
+            started = time.perf_counter()
+            all_found = print_interactions(db, screen_name, opts.kinds, opts.by_user) and all_found
+            print("(%.1f ms)" % ((time.perf_counter() - started) * 1000))
+    return 0 if all_found else 1
+
+
+def finish_dedup(dedup, instrumentation):
+    """Records how many duplicate tweets were dropped, and closes the de-duplication index"""
+    if dedup is not None:
+        dedup.record(instrumentation)
+        dedup.close()
+
+
+def serve_analysis(args):
+    """Loads the tweets once, then serves queries of their analysis, and ingests more, over HTTP"""
+    opts = ServeOptions().parse(args)
+    analyser = TwitterAnalysis(opts)
+    store = None
+    dedup = make_deduplicator(opts)
+    if opts.tweets_files:
+        print("Reading %s" % ', '.join(opts.tweets_files))
+        store = analyser.ingest(read_tweets(opts.tweets_files, readers=int(opts.readers), decoder=opts.decoder,
+                                            dedup=dedup))
+    analysis = AnalysisServer(analyser, store, int(opts.cache_size), dedup)
+    serve(analysis, opts.host, int(opts.port))
+    return 0
+
+
+def analyse_live_tweets(args):
+    """Analyses tweets as they arrive on stdin, named pipes or TCP sockets, reporting the top accounts periodically"""
+    opts = LiveOptions().parse(args)
+    if opts.output:
+        output_format(opts.output, opts.output_format)
+    analyser = TwitterAnalysis(opts)
+    dedup = make_deduplicator(opts)
+    analyse_live(analyser, parse_duration(opts.refresh), opts.stdin, opts.fifos,
+                 [parse_address(a) for a in opts.tcp_addresses], opts.output, dedup)
+    finish_dedup(dedup, analyser.instrumentation)
+    if opts.metrics_out:
+        analyser.instrumentation.save(opts.metrics_out)
+    print("Finished at %s" % timestamp())
+    return 0
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['query']:
+        sys.exit(query(sys.argv[2:]))
+    if sys.argv[1:2] == ['serve']:
+        sys.exit(serve_analysis(sys.argv[2:]))
+    if sys.argv[1:2] == ['live']:
+        sys.exit(analyse_live_tweets(sys.argv[2:]))
+
     options = Options()
     opts = options.parse(sys.argv[1:])
+    if opts.trace_memory:
+        tracemalloc.start()
+    if opts.output:
+        output_format(opts.output, opts.output_format)  # fails now, rather than after the analysis, if unwritable
+    if opts.seed_output:
+        output_format(opts.seed_output)
+    if opts.sweep_output:
+        output_format(opts.sweep_output)
+    sweep_grid = parse_sweep(opts.sweep, opts) if opts.sweep else None
+    if sweep_grid is not None:
+        if opts.state_file or opts.database or opts.output or opts.seeds:
+            print("[WARN] --state, --database, --output and --seeds don't apply to a sweep; ignoring them")
+            opts.state_file = opts.database = opts.output = opts.seeds = None
+        if opts.d_rank_solver != 'jacobi' or opts.extrapolation != 'none':
+            print("[WARN] --d-rank-solver and --extrapolation don't apply to a sweep; ignoring them")
+    seed_sets = load_seed_sets(opts.seeds) if opts.seeds else None
 
-    print("Reading %s" % opts.tweets_file)
+    analyser = TwitterAnalysis(opts)
+    instrumentation = analyser.instrumentation
 
-    tweets = []
-    with open(opts.tweets_file) as f:
-        # tweets = [json.loads(l.rstrip('\n')) for l in f.readlines()]
-        lines = f.readlines()
-        batch_size = (len(lines) / 10)
-        count = 0
-        for l in lines:
-            count += 1
-            if int(count % batch_size) == 0:
-                print("[%s] Read %d lines..." % (timestamp(), count))
-            tweets.append(json.loads(l.rstrip('\n')))
+    # carry on from where an earlier run left off, ingesting only the new tweets
+    state = None
+    store = None
+    if opts.state_file and os.path.exists(opts.state_file):
+        with instrumentation.stage('load_state'):
+            state = load_state(opts.state_file)
+        store = state.store
+        print("Resuming from %s (%d users, %d interactions)" % (opts.state_file, len(store.users), len(store)))
 
-    print("[%s] Read %d tweets" % (timestamp(), len(tweets)))
+    # drops tweets seen before, in any of the input files
+    dedup = make_deduplicator(opts)
 
-    analyser = TwitterAnalysis(opts)
+    print("Reading %s" % ', '.join(opts.tweets_files))
+
+    if opts.window:
+        if (opts.state_file or opts.database or opts.output or opts.seeds or int(opts.workers) > 1 or opts.cache_file or
+                opts.sweep):
+            print("[WARN] --state, --database, --output, --seeds, --workers, --cache and --sweep don't apply to "
+                  "windows; ignoring them")
+        print("Analysing tweets to provide top %d accounts per %s window, every %s..." %
+              (analyser.how_few, opts.window, opts.step))
+        # the files are read one after another, as concurrent readers would interleave them out of time order
+        analyse_windows(analyser, read_tweets(opts.tweets_files, readers=1, decoder=opts.decoder, dedup=dedup),
+                        parse_duration(opts.window), parse_duration(opts.step))
+        finish_dedup(dedup, instrumentation)
+        if opts.metrics_out:
+            instrumentation.save(opts.metrics_out)
+        print("Finished at %s" % timestamp())
+        sys.exit(0)
+
+    if opts.max_memory:
+        if opts.state_file or opts.database or opts.seeds or int(opts.workers) > 1 or opts.cache_file or opts.sweep:
+            print("[WARN] --state, --database, --seeds, --workers, --cache and --sweep don't apply out of core; "
+                  "ignoring them")
+        if opts.d_rank_solver != 'jacobi' or opts.extrapolation != 'none':
+            print("[WARN] --d-rank-solver and --extrapolation don't apply out of core; ignoring them")
+        print("Analysing tweets to provide top %d accounts, within %s of memory..." % (analyser.how_few, opts.max_memory))
+        analyse_out_of_core(analyser, opts, dedup)
+        finish_dedup(dedup, instrumentation)
+        if opts.metrics_out:
+            instrumentation.save(opts.metrics_out)
+        print("Finished at %s" % timestamp())
+        sys.exit(0)
+
+    if opts.approximate:
+        if opts.state_file or opts.database or opts.seeds or int(opts.workers) > 1 or opts.cache_file or opts.sweep:
+            print("[WARN] --state, --database, --seeds, --workers, --cache and --sweep don't apply to approximate "
+                  "metrics; ignoring them")
+        print("Analysing tweets to provide approximate top %d accounts..." % analyser.how_few)
+        analyse_approximately(analyser, opts, dedup)
+        finish_dedup(dedup, instrumentation)
+        if opts.metrics_out:
+            instrumentation.save(opts.metrics_out)
+        print("Finished at %s" % timestamp())
+        sys.exit(0)
+
+    workers = int(opts.workers)
+    if workers > 1 and int(opts.tweet_count) != -1:
+        print("[WARN] --count limits the tweets of a single pass; ignoring --workers")
+        workers = 1
+
+    profiler = cProfile.Profile() if opts.profile_file else None
+    if profiler is not None:
+        profiler.enable()
+
+    if dedup is not None and store is not None:
+        dedup.add_store(store)  # and those ingested by an earlier run
+
+    # the interactions ingested from the same input by an earlier run are mapped from the cache, rather than
+    # reading and decoding the tweets again
+    cache_file = opts.cache_file
+    if cache_file and opts.state_file:
+        print("[WARN] --cache doesn't apply with --state; ignoring it")
+        cache_file = None
+    cached_store = None
+    if cache_file:
+        key = cache_key(opts)
+        with instrumentation.stage('load_cache'):
+            cached_store = load_cache(cache_file, key)
+
+    print("Analysing tweets to provide top %d accounts..." % analyser.how_few)
+    if cached_store is not None:
+        store = cached_store
+        instrumentation.add_count('tweets', store.num_tweets)
+        if dedup is not None:
+            dedup.close()
+        print("Mapped the interactions of %d tweets from %s" % (store.num_tweets, cache_file))
+    else:
+        if workers > 1:
+            with instrumentation.stage('ingest'):
+                new_store = ingest_in_parallel(opts, workers, instrumentation, dedup)
+                store = new_store if store is None else store.merge(new_store)
+        else:
+            # tweets are decoded (into compact records) one at a time as the analysis consumes them;
+            # reading and decoding are only timed separately when asked for, as it costs a little per tweet
+            tweets = read_tweets(opts.tweets_files, readers=int(opts.readers), decoder=opts.decoder,
+                                 instrumentation=instrumentation if opts.metrics_out else None, dedup=dedup)
+            store = analyser.ingest(tweets, store)
+        finish_dedup(dedup, instrumentation)
+        if cache_file:
+            with instrumentation.stage('save_cache'):
+                size = save_cache(cache_file, store, key, instrumentation.counters.get('tweets', 0))
+            print("Saved the interactions to %s (%d bytes) for later runs" % (cache_file, size))
+
+    if opts.state_file and state is None:
+        state = AnalysisState(store)
+
+    if sweep_grid is not None:
+        # every combination of the swept parameters is compared with those of the other options
+        baseline = [float(getattr(opts, dest)) for _, dest in SWEEP_PARAMETERS]
+        print("Comparing the rankings with %d combinations of parameters..." % math.prod(len(v) for v in sweep_grid))
+        sweep_rows = sweep(store, sweep_grid, baseline, int(opts.max_iterations), analyser.how_few, instrumentation,
+                           opts.debug, float(opts.tolerance), opts.residual_norm)
+        print_sweep(sweep_rows, baseline, analyser.how_few)
+    else:
+        kudos, metrics, d_rank_scores = analyser.report(store, state)
+
+    if seed_sets is not None:
+        with instrumentation.stage('personalised_d_rank'):
+            screen_names, seed_scores = personalised_d_rank(store, seed_sets, int(opts.max_iterations),
+                                                            float(opts.d_rank_weight_factor), opts.debug,
+                                                            instrumentation, float(opts.tolerance),
+                                                            opts.residual_norm)
+        print_personalised_top_few(seed_sets, screen_names, seed_scores, analyser.how_few)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(opts.profile_file)
+        print("Saved profile to %s (see python -m pstats %s)" % (opts.profile_file, opts.profile_file))
+
+    if opts.state_file:
+        with instrumentation.stage('save_state'):
+            save_state(opts.state_file, state)
+        print("Saved state to %s" % opts.state_file)
+
+    if opts.database:
+        with instrumentation.stage('save_database'):
+            save_database(opts.database, store, kudos.values(), analyser.pa_weights, d_rank_scores)
+        print("Saved interactions and metrics to %s" % opts.database)
+
+    if opts.output:
+        with instrumentation.stage('output'):
+            rows = write_metric_table(opts.output, metrics, d_rank_scores, opts.output_format)
+        print("Wrote the metrics of %d users to %s" % (rows, opts.output))
+
+    if opts.seed_output and seed_sets is not None:
+        with instrumentation.stage('output'):
+            rows = write_seed_scores(opts.seed_output, seed_sets, screen_names, seed_scores)
+        print("Wrote the personalised D-rank of %d users for %d seed sets to %s" %
+              (rows, len(seed_sets), opts.seed_output))
+
+    if opts.sweep_output and sweep_grid is not None:
+        with instrumentation.stage('output'):
+            rows = write_sweep(opts.sweep_output, sweep_rows)
+        print("Wrote the rank stability of %d combinations of parameters to %s" % (rows, opts.sweep_output))
 
-    analyser.analyse(tweets)
+    if opts.metrics_out:
+        if opts.trace_memory:
+            instrumentation.count('tracemalloc_peak_bytes', tracemalloc.get_traced_memory()[1])
+        instrumentation.save(opts.metrics_out)
+        print("Saved run metrics to %s" % opts.metrics_out)
 
     print("Finished at %s" % timestamp())